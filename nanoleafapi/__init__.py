@@ -1,18 +1,61 @@
-from nanoleafapi.nanoleaf import (
-    Nanoleaf,
-    NanoleafRegistrationError,
-    NanoleafConnectionError,
-    NanoleafEffectCreationError
-)
-from nanoleafapi.nanoleaf import (
-    RED,
-    ORANGE,
-    YELLOW,
-    GREEN,
-    LIGHT_BLUE,
-    BLUE,
-    PINK,
-    PURPLE,
-    WHITE
-)
-from nanoleafapi.digital_twin import NanoleafDigitalTwin
+"""nanoleafapi
+
+The classes and colours below are imported from their submodules the first
+time they are used, so importing the package itself is quick and doesn't load
+optional dependencies such as NumPy."""
+# pylint: disable=undefined-all-variable
+
+from importlib import import_module
+from typing import Any, List
+
+_EXPORTS = {
+    'Nanoleaf': 'nanoleafapi.nanoleaf',
+    'NanoleafRegistrationError': 'nanoleafapi.nanoleaf',
+    'NanoleafConnectionError': 'nanoleafapi.nanoleaf',
+    'NanoleafOfflineError': 'nanoleafapi.nanoleaf',
+    'NanoleafEffectCreationError': 'nanoleafapi.nanoleaf',
+    'RED': 'nanoleafapi.nanoleaf',
+    'ORANGE': 'nanoleafapi.nanoleaf',
+    'YELLOW': 'nanoleafapi.nanoleaf',
+    'GREEN': 'nanoleafapi.nanoleaf',
+    'LIGHT_BLUE': 'nanoleafapi.nanoleaf',
+    'BLUE': 'nanoleafapi.nanoleaf',
+    'PINK': 'nanoleafapi.nanoleaf',
+    'PURPLE': 'nanoleafapi.nanoleaf',
+    'WHITE': 'nanoleafapi.nanoleaf',
+    'NanoleafDigitalTwin': 'nanoleafapi.digital_twin',
+    'NanoleafEffectsCatalogue': 'nanoleafapi.effects_catalogue',
+    'NanoleafLayout': 'nanoleafapi.layout',
+    'NanoleafFrameMapper': 'nanoleafapi.frame_mapper',
+    'NanoleafTransition': 'nanoleafapi.transitions',
+    'NanoleafVirtualCanvas': 'nanoleafapi.canvas',
+    'NanoleafSharedFrame': 'nanoleafapi.shared_frame',
+    'NanoleafTransport': 'nanoleafapi.transport',
+    'HTTPClientTransport': 'nanoleafapi.transport',
+    'RequestsTransport': 'nanoleafapi.transport',
+    'AsyncTransport': 'nanoleafapi.async_transport',
+    'NanoleafHealth': 'nanoleafapi.health',
+    'NanoleafEventHistory': 'nanoleafapi.event_history',
+    'RecordingTransport': 'nanoleafapi.recorder',
+    'NanoleafReplayer': 'nanoleafapi.recorder',
+    'NanoleafScene': 'nanoleafapi.scenes',
+    'NanoleafNonBlocking': 'nanoleafapi.nonblocking',
+    'wait_all': 'nanoleafapi.nonblocking',
+    'as_completed': 'nanoleafapi.nonblocking',
+    'NanoleafFleet': 'nanoleafapi.fleet',
+    'NanoleafScheduler': 'nanoleafapi.scheduler',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name : str) -> Any:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'nanoleafapi' has no attribute '{name}'")
+    value = getattr(import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,208 @@
+"""anim_data
+
+This module parses and optimises the animData of custom effects, which grows
+ with the number of panels times the number of frames, so large layouts and
+ long animations can be uploaded faster and stay within what the controller
+ accepts.
+
+The custom effect format needs the W and T values of every frame, so they
+ can't be left out of animData itself. Instead, when every panel plays the
+ same frames, the effect is replaced with an equivalent palette based fade
+ effect, which has no per-panel data at all."""
+
+import colorsys
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from nanoleafapi.nanoleaf import NanoleafEffectCreationError
+
+# A frame of a panel: (R, G, B, W, T), where T is the transition time to the
+# frame in tenths of a second
+Frame = Tuple[int, int, int, int, int]
+
+# The largest difference in an RGB value allowed when converting a colour to
+# the HSB palette of a fade effect
+PALETTE_TOLERANCE = 3
+
+
+def parse_anim_data(anim_data : str) -> Dict[int, List[Frame]]:
+    """Parses an animData string
+
+    :param anim_data: The animData string of a custom or static effect
+
+    :raises NanoleafEffectCreationError: When the animData is malformed.
+
+    :returns: Dictionary of panel IDs and their frames
+    """
+    try:
+        values = [int(value) for value in anim_data.split()]
+        panels = {}
+        index = 1
+        for _ in range(values[0]):
+            panel_id, num_frames = values[index], values[index + 1]
+            index += 2
+            frames = []
+            for _ in range(num_frames):
+                r, g, b, w, t = values[index:index + 5]
+                frames.append((r, g, b, w, t))
+                index += 5
+            panels[panel_id] = frames
+    except (ValueError, IndexError) as error:
+        raise NanoleafEffectCreationError("Invalid animData") from error
+    return panels
+
+
+def format_anim_data(panels : Dict[int, List[Frame]]) -> str:
+    """Returns the animData string of panels and their frames
+
+    :param panels: Dictionary of panel IDs and their frames"""
+    parts = [str(len(panels))]
+    for panel_id, frames in panels.items():
+        parts.append(f"{panel_id} {len(frames)}")
+        for frame in frames:
+            parts.append(" ".join(str(value) for value in frame))
+    return " ".join(parts)
+
+
+def payload_size(effect : Dict[str, Any]) -> int:
+    """Returns the size in bytes of the request which writes an effect
+
+    :param effect: The effect dictionary"""
+    return len(json.dumps({"write": effect}).encode('utf-8'))
+
+
+def merge_frames(frames : List[Frame]) -> List[Frame]:
+    """Merges runs of identical consecutive frames without changing the animation
+
+    A run of the same colour is shown by fading to it and then holding it,
+    so it needs at most two frames: the first, and a second whose transition
+    time is the total of the rest.
+
+    :param frames: The frames of a panel
+
+    :returns: The merged frames
+    """
+    merged : List[Frame] = []
+    run = 0
+    for frame in frames:
+        if merged and merged[-1][:4] == frame[:4]:
+            run += 1
+            if run > 1:
+                last = merged[-1]
+                merged[-1] = last[:4] + (last[4] + frame[4],)
+                continue
+        else:
+            run = 0
+        merged.append(frame)
+    return merged
+
+
+def downsample_frames(frames : List[Frame]) -> List[Frame]:
+    """Halves the number of frames, keeping the first and last frames and the
+    total length of the animation
+
+    :param frames: The frames of a panel
+
+    :returns: The remaining frames
+    """
+    kept : List[Frame] = []
+    skipped_time = 0
+    for index, frame in enumerate(frames):
+        if index % 2 == 1 and index != len(frames) - 1:
+            skipped_time += frame[4]
+            continue
+        kept.append(frame[:4] + (frame[4] + skipped_time,))
+        skipped_time = 0
+    return kept
+
+
+def palette_effect(panels : Dict[int, List[Frame]], effect : Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+    """Returns an equivalent fade effect when every panel plays the same frames
+
+    An effect has a single palette which every panel fades through together,
+    so panels aren't grouped by their frames: when any panel plays different
+    frames, even if the panels fall into a few groups which each play the
+    same frames, there's no equivalent fade effect and the custom effect is kept.
+
+    :param panels: Dictionary of panel IDs and their frames
+    :param effect: The custom effect dictionary
+
+    :returns: The fade effect dictionary, or None if there isn't an equivalent one
+    """
+    sequences = {tuple(frames) for frames in panels.values()}
+    if len(sequences) != 1:
+        return None
+    frames = sequences.pop()
+    if not frames or any(frame[3] != 0 or frame[4] != frames[0][4] for frame in frames):
+        return None
+    palette = []
+    for r, g, b, _, _ in frames:
+        hue, sat, value = colorsys.rgb_to_hsv(r / 255, g / 255, b / 255)
+        colour = {"hue": round(hue * 360) % 360, "saturation": round(sat * 100),
+            "brightness": round(value * 100)}
+        shown = colorsys.hsv_to_rgb(colour["hue"] / 360, colour["saturation"] / 100,
+            colour["brightness"] / 100)
+        if any(abs(round(channel * 255) - original) > PALETTE_TOLERANCE
+                for channel, original in zip(shown, (r, g, b))):
+            return None
+        palette.append(colour)
+    fade = {key: value for key, value in effect.items() if key not in ('animData', 'palette')}
+    fade.update({
+        "animType": "fade",
+        "colorType": "HSB",
+        "palette": palette,
+        "transTime": {"minValue": frames[0][4], "maxValue": frames[0][4]},
+        "delayTime": {"minValue": 0, "maxValue": 0}
+    })
+    return fade
+
+
+def optimise_effect(effect : Dict[str, Any], max_bytes : int =None,
+    use_palette : bool =True) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Optimises the animData of a custom or static effect
+
+    Identical consecutive frames are merged, and the effect is replaced with
+    a fade effect when every panel plays the same frames. If it is still
+    larger than max_bytes, frames are dropped (keeping the length of the
+    animation) until it fits, which changes how it looks.
+
+    :param effect: The effect dictionary, e.g. from
+        Nanoleaf.get_custom_base_effect() with animData added
+    :param max_bytes: Optional, the largest size in bytes of the request
+        writing the effect
+    :param use_palette: Optional, False to always keep the custom effect
+
+    :raises NanoleafEffectCreationError: When the effect can't fit in max_bytes.
+
+    :returns: Tuple of the optimised effect dictionary, for use with
+        Nanoleaf.write_effect(), and a report dictionary with the original
+        and optimised sizes in bytes and numbers of frames, the animation
+        type, and whether the animation is unchanged
+    """
+    report : Dict[str, Any] = {"original_bytes": payload_size(effect)}
+    if 'animData' not in effect:
+        optimised = dict(effect)
+        report.update(optimised_bytes=report["original_bytes"], original_frames=0,
+            optimised_frames=0, anim_type=effect.get('animType'), lossless=True)
+        return optimised, report
+    panels = parse_anim_data(effect['animData'])
+    report["original_frames"] = sum(len(frames) for frames in panels.values())
+    panels = {panel_id: merge_frames(frames) for panel_id, frames in panels.items()}
+    lossless = True
+    optimised = palette_effect(panels, effect) if use_palette else None
+    if optimised is None:
+        optimised = dict(effect, animData=format_anim_data(panels))
+    while max_bytes is not None and payload_size(optimised) > max_bytes:
+        downsampled = {panel_id: downsample_frames(frames) for panel_id, frames in panels.items()}
+        if optimised['animType'] == 'fade' or downsampled == panels:
+            raise NanoleafEffectCreationError(f"The effect can't fit in {max_bytes} bytes")
+        panels = downsampled
+        optimised = dict(effect, animData=format_anim_data(panels))
+        lossless = False
+    if 'animData' in optimised:
+        report["optimised_frames"] = sum(len(frames) for frames in panels.values())
+    else:
+        report["optimised_frames"] = len(optimised['palette'])
+    report.update(optimised_bytes=payload_size(optimised),
+        anim_type=optimised['animType'], lossless=lossless)
+    return optimised, report
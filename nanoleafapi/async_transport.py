@@ -0,0 +1,235 @@
+"""async_transport
+
+This module provides a transport using asyncio streams. It is kept separate
+ from the transport module so that asyncio is only imported when it is used."""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+from urllib.parse import SplitResult, urlsplit
+from nanoleafapi.transport import (Body, EventParser, NanoleafResponse, NanoleafTransport,
+    Timeout, split_timeout)
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+async def _read_head(reader : asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+    """Reads the status line and headers of a response"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Connection closed by device")
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError) as error:
+        raise ConnectionError(f"Malformed status line {status_line!r}") from error
+    headers : Dict[str, str] = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            return status, headers
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _read_lines(reader : asyncio.StreamReader, chunked : bool) -> AsyncIterator[bytes]:
+    """Yields the lines of a response body until it ends"""
+    if not chunked:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            yield line
+    pending = b""
+    while True:
+        size_line = await reader.readline()
+        try:
+            size = int(size_line.split(b';')[0], 16)
+        except ValueError as error:
+            raise ConnectionError(f"Malformed chunk size {size_line!r}") from error
+        if size == 0:
+            # Skip the trailers, up to the blank line which ends the body
+            while (await reader.readline()).strip():
+                pass
+            if pending:
+                yield pending
+            return
+        pending += await reader.readexactly(size)
+        await reader.readline()
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+
+
+async def _read_response(reader : asyncio.StreamReader) -> Tuple[NanoleafResponse, bool]:
+    """Reads a whole response
+
+    :returns: The response, and True if the device will close the connection
+    """
+    status, headers = await _read_head(reader)
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        content = b"".join([line async for line in _read_lines(reader, True)])
+    else:
+        content = await reader.readexactly(int(headers.get('content-length', 0)))
+    return NanoleafResponse(status, content), headers.get('connection', '').lower() == 'close'
+
+
+def _request_head(method : str, parts : SplitResult, length : int, extra : str ="") -> bytes:
+    """Returns the request line and headers of a request"""
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    return (f"{method} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n" +
+        f"Content-Length: {length}\r\n{extra}\r\n").encode('latin-1')
+
+
+class AsyncTransport(NanoleafTransport):
+    """Transport using asyncio streams, with a keep-alive connection per device
+
+    The coroutines arequest() and aevents() can be awaited from an event loop.
+    The keep-alive connections belong to a background event loop, which every
+    request runs on, so arequest() and the blocking request() method used by
+    the Nanoleaf class share them whichever loop they are called from.
+    close() ends any event streams, closes the connections and stops the
+    background loop, which is started again if the transport is used.
+    """
+
+    def __init__(self) -> None:
+        self.__loop : Optional[asyncio.AbstractEventLoop] = None
+        self.__thread : Optional[threading.Thread] = None
+        self.__loop_lock = threading.Lock()
+        self.__connections : Dict[str, Connection] = {}
+        self.__locks : Dict[str, asyncio.Lock] = {}
+
+    def __background_loop(self) -> asyncio.AbstractEventLoop:
+        """Returns the background event loop, starting it if required"""
+        with self.__loop_lock:
+            if self.__loop is None:
+                self.__loop = asyncio.new_event_loop()
+                self.__thread = threading.Thread(target=self.__loop.run_forever,
+                    name="nanoleaf-async-transport", daemon=True)
+                self.__thread.start()
+            return self.__loop
+
+    async def __connect(self, parts : SplitResult, timeout : Optional[float]) -> Connection:
+        """Returns the open connection to a host, connecting if required"""
+        if parts.netloc not in self.__connections:
+            self.__connections[parts.netloc] = await asyncio.wait_for(
+                asyncio.open_connection(parts.hostname, parts.port or 80), timeout)
+        return self.__connections[parts.netloc]
+
+    def __disconnect(self, host : str) -> None:
+        """Closes the open connection to a host, if there is one"""
+        connection = self.__connections.pop(host, None)
+        if connection is not None:
+            connection[1].close()
+
+    async def arequest(self, method : str, url : str, data : Body =None,
+        timeout : Timeout =None) -> NanoleafResponse:
+        """Sends a request and awaits the response, see request()
+
+        :raises TimeoutError: When the device doesn't respond in time.
+        """
+        loop = self.__background_loop()
+        if asyncio.get_running_loop() is loop:
+            return await self.__send(method, url, data, timeout)
+        # Connections can only be used by the loop which opened them
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+            self.__send(method, url, data, timeout), loop))
+
+    async def __send(self, method : str, url : str, data : Body,
+        timeout : Timeout) -> NanoleafResponse:
+        """Sends a request on the background loop"""
+        try:
+            return await self.__request(method, url, data, timeout)
+        except asyncio.TimeoutError as error:
+            # Before Python 3.11 this isn't the built in TimeoutError
+            raise TimeoutError(f"{method} {url} timed out") from error
+
+    async def __request(self, method : str, url : str, data : Body,
+        timeout : Timeout) -> NanoleafResponse:
+        """Sends a request over the host's keep-alive connection"""
+        timeouts = split_timeout(timeout)
+        parts = urlsplit(url)
+        body = data.encode('utf-8') if isinstance(data, str) else (data or b"")
+        body = _request_head(method, parts, len(body)) + body
+        async with self.__locks.setdefault(parts.netloc, asyncio.Lock()):
+            for attempt in range(2):
+                reused = parts.netloc in self.__connections
+                reader, writer = await self.__connect(parts, timeouts[0])
+                try:
+                    writer.write(body)
+                    await writer.drain()
+                    response, closing = await asyncio.wait_for(_read_response(reader),
+                        timeouts[1])
+                    if closing:
+                        self.__disconnect(parts.netloc)
+                    return response
+                except (ConnectionError, asyncio.IncompleteReadError) as error:
+                    self.__disconnect(parts.netloc)
+                    # Only a connection left open from a previous request can be stale
+                    if not reused or attempt == 1:
+                        raise ConnectionResetError("Connection closed by device") from error
+                except BaseException:
+                    self.__disconnect(parts.netloc)
+                    raise
+        raise ConnectionError("Request failed")
+
+    async def aevents(self, url : str) -> AsyncIterator[Tuple[str, str]]:
+        """Connects to an event stream and yields its events, see events()"""
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        try:
+            writer.write(_request_head('GET', parts, 0, "Accept: text/event-stream\r\n"))
+            await writer.drain()
+            status, headers = await _read_head(reader)
+            if status >= 400:
+                raise ConnectionError(f"Event stream returned status {status}")
+            parser = EventParser()
+            chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+            async for line in _read_lines(reader, chunked):
+                event = parser.feed(line)
+                if event is not None:
+                    yield event
+        finally:
+            writer.close()
+
+    def request(self, method : str, url : str, data : Body =None,
+        timeout : Timeout =None) -> NanoleafResponse:
+        future = asyncio.run_coroutine_threadsafe(self.__send(method, url, data, timeout),
+            self.__background_loop())
+        return future.result()
+
+    def events(self, url : str) -> Iterator[Tuple[str, str]]:
+        loop = self.__background_loop()
+        stream = self.aevents(url)
+
+        async def next_event() -> Tuple[str, str]:
+            return await stream.__anext__() # pylint: disable=unnecessary-dunder-call
+
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(next_event(), loop).result()
+            except (StopAsyncIteration, concurrent.futures.CancelledError):
+                # The stream ended, or was cancelled by close()
+                return
+
+    def close(self) -> None:
+        with self.__loop_lock:
+            loop, thread = self.__loop, self.__thread
+            self.__loop = self.__thread = None
+        if loop is None or thread is None:
+            return
+
+        async def shutdown() -> None:
+            # Cancels event streams and requests in progress
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for host in list(self.__connections):
+                self.__disconnect(host)
+            self.__locks.clear()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,271 @@
+"""NanoleafAudioVisualiser
+
+This module turns a stream of PCM audio into frames for a digital twin, by
+ splitting the audio into frequency bands and mapping the bands onto the
+ panels. It requires NumPy, which can be installed with
+ ``pip install nanoleafapi[frames]``."""
+
+import colorsys
+import time
+import wave
+from typing import Any, Dict, Iterable, Iterator, Tuple
+from nanoleafapi.layout import NanoleafLayout
+from nanoleafapi.digital_twin import NanoleafDigitalTwin
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SAMPLE_TYPES = {1: 'u1', 2: '<i2', 4: '<i4'}
+
+class NanoleafAudioAnalyser(): # pylint: disable=too-many-instance-attributes
+    """Class for extracting frequency band levels from PCM audio
+
+    Samples are written into a preallocated sliding window, which is
+    analysed with a windowed FFT on request.
+
+    :ivar sample_rate: The sample rate of the audio in Hz
+    :ivar channels: The number of interleaved channels in the audio
+    :ivar sample_width: The number of bytes per sample
+    :ivar levels: NumPy array of the level of each band, between 0 and 1
+    :ivar samples_fed: The total number of samples (per channel) fed so far
+    """
+
+    def __init__(self, sample_rate : int, # pylint: disable=too-many-arguments,too-many-positional-arguments
+        channels : int =1, sample_width : int =2, window_size : int =2048,
+        bands : int =8, min_freq : float =40,
+        max_freq : float =16000, decay : float =0.85) -> None:
+        """Initialises the analyser for the given audio format.
+
+        :param sample_rate: The sample rate of the audio in Hz
+        :param channels: Optional, the number of interleaved channels, which
+            are mixed down to mono
+        :param sample_width: Optional, the number of bytes per sample (1, 2 or 4)
+        :param window_size: Optional, the number of samples in each FFT
+        :param bands: Optional, the number of logarithmically spaced bands
+        :param min_freq: Optional, the lowest frequency of the first band in Hz
+        :param max_freq: Optional, the highest frequency of the last band in Hz
+        :param decay: Optional, how much of the previous level (and peak) is
+            kept when the level falls, between 0 and 1"""
+        if np is None:
+            raise ImportError("NanoleafAudioAnalyser requires NumPy, install it with " +
+                "'pip install nanoleafapi[frames]'")
+        if sample_width not in SAMPLE_TYPES:
+            raise ValueError("Sample width must be 1, 2 or 4 bytes")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.decay = decay
+        self.samples_fed = 0
+        self.levels = np.zeros(bands)
+        self.__remainder = b""
+        self.__samples = np.zeros(window_size, dtype=np.float32)
+        self.__window = np.hanning(window_size).astype(np.float32)
+        self.__windowed = np.zeros(window_size, dtype=np.float32)
+        self.__magnitudes = np.zeros(window_size // 2 + 1)
+        self.__peak = 1e-6
+
+        # The FFT bins at which each band starts, each band has at least one bin
+        max_freq = min(max_freq, sample_rate / 2)
+        edges = np.geomspace(min_freq, max_freq, bands + 1)
+        bins = np.round(edges * window_size / sample_rate).astype(np.intp)
+        self.__band_starts = np.maximum(bins[:-1], 1)
+        for band in range(1, bands):
+            self.__band_starts[band] = max(self.__band_starts[band],
+                self.__band_starts[band - 1] + 1)
+        self.__band_stop = min(max(int(bins[-1]), int(self.__band_starts[-1]) + 1),
+            len(self.__magnitudes))
+        if self.__band_starts[-1] >= self.__band_stop:
+            raise ValueError("The window size is too small for this many bands")
+
+    def feed(self, chunk : bytes) -> int:
+        """Adds a chunk of PCM audio to the analysis window.
+
+        :param chunk: Raw interleaved PCM bytes, which don't need to contain
+            a whole number of samples
+
+        :returns: The number of samples (per channel) added
+        """
+        frame_size = self.channels * self.sample_width
+        data = self.__remainder + bytes(chunk)
+        usable = len(data) - len(data) % frame_size
+        self.__remainder = data[usable:]
+        if usable == 0:
+            return 0
+        pcm = np.frombuffer(data[:usable], dtype=SAMPLE_TYPES[self.sample_width])
+        samples = pcm.reshape(-1, self.channels).mean(axis=1)
+        if self.sample_width == 1:
+            samples = (samples - 128) / 128
+        else:
+            samples = samples / float(2 ** (8 * self.sample_width - 1))
+        count = len(samples)
+        window_size = len(self.__samples)
+        if count >= window_size:
+            self.__samples[:] = samples[-window_size:]
+        else:
+            self.__samples[:-count] = self.__samples[count:]
+            self.__samples[-count:] = samples
+        self.samples_fed += count
+        return count
+
+    def analyse(self) -> Any:
+        """Calculates the band levels of the current analysis window
+
+        Levels rise immediately but fall by the decay factor, and are
+        normalised against a slowly decaying peak of the loudest band.
+
+        :returns: NumPy array of the level of each band, between 0 and 1
+        """
+        np.multiply(self.__samples, self.__window, out=self.__windowed)
+        np.abs(np.fft.rfft(self.__windowed), out=self.__magnitudes)
+        energies = np.add.reduceat(self.__magnitudes[:self.__band_stop], self.__band_starts)
+        self.__peak = max(float(energies.max()), self.__peak * self.decay, 1e-6)
+        np.maximum(energies / self.__peak, self.levels * self.decay, out=self.levels)
+        return self.levels
+
+
+class NanoleafAudioVisualiser():
+    """Class for mapping audio band levels onto the panels of a layout
+
+    Panels are split into groups along an ordering of the layout, with one
+    group per band. Each band has its own hue, and its level sets the
+    brightness of the panels in its group.
+
+    :ivar analyser: The audio analyser
+    :ivar panel_ids: The IDs of the panels, in the order of the ordering
+    """
+
+    def __init__(self, analyser : NanoleafAudioAnalyser, layout : NanoleafLayout,
+        ordering : str ='sweep') -> None:
+        """Initialises the visualiser and precomputes the band of each panel.
+
+        :param analyser: The audio analyser
+        :param layout: The layout of the panels
+        :param ordering: Optional, the layout ordering used to assign panels
+            to bands, either sweep, radial or rings"""
+        self.analyser = analyser
+        if ordering == 'sweep':
+            self.panel_ids = layout.sweep()
+        elif ordering == 'radial':
+            self.panel_ids = layout.radial()
+        elif ordering == 'rings':
+            self.panel_ids = [panel_id for ring in layout.rings() for panel_id in ring]
+        else:
+            raise ValueError("Ordering must be sweep, radial or rings")
+        bands = len(analyser.levels)
+        self.__panel_bands = (np.arange(len(self.panel_ids)) * bands //
+            max(len(self.panel_ids), 1))
+        self.__band_colours = np.array([colorsys.hsv_to_rgb(band / bands * 0.8, 1.0, 1.0)
+            for band in range(bands)]) * 255
+
+    def colours(self) -> Dict[int, Tuple[int, int, int]]:
+        """Returns the colour of each panel for the current band levels
+
+        :returns: Dictionary with panel IDs as keys and RGB tuples as values
+        """
+        levels = np.clip(self.analyser.levels, 0, 1)[self.__panel_bands]
+        colours = (self.__band_colours[self.__panel_bands] * levels[:, None]).astype(int)
+        return {panel_id: tuple(colour) for panel_id, colour in
+            zip(self.panel_ids, colours.tolist())}
+
+    def frames(self, chunks : Iterable[bytes],
+        fps : float =20) -> Iterator[Dict[int, Tuple[int, int, int]]]:
+        """Analyses a stream of PCM chunks and yields frames at a fixed rate
+
+        Frames are timed by the audio itself, so a recorded file produces the
+        same frames however quickly it is read.
+
+        :param chunks: An iterable of raw PCM chunks, e.g. from wav_chunks()
+        :param fps: Optional, the number of frames per second of audio
+
+        :returns: Iterator of dictionaries of {panel_id: (R, G, B)}
+        """
+        samples_per_frame = self.analyser.sample_rate / fps
+        next_frame = self.analyser.samples_fed + samples_per_frame
+        for chunk in chunks:
+            self.analyser.feed(chunk)
+            if self.analyser.samples_fed >= next_frame:
+                # Skip the frames which a single large chunk would repeat
+                while next_frame <= self.analyser.samples_fed:
+                    next_frame += samples_per_frame
+                self.analyser.analyse()
+                yield self.colours()
+
+    def run(self, chunks : Iterable[bytes], twin : NanoleafDigitalTwin, fps : float =20,
+        realtime : bool =True) -> int:
+        """Streams audio-reactive frames to a digital twin, syncing each one
+
+        In real time, each frame waits until the audio it was analysed from
+        has been played, so the visuals stay in step with the audio even
+        when frames are skipped or a sync is slow.
+
+        :param chunks: An iterable of raw PCM chunks
+        :param twin: The digital twin to update and sync
+        :param fps: Optional, the number of frames per second
+        :param realtime: Optional, True to wait for each frame's time to come,
+            which should be False for live sources which already arrive in real time
+
+        :returns: The number of frames synced
+        """
+        start = time.monotonic()
+        start_samples = self.analyser.samples_fed
+        synced = 0
+        for colours in self.frames(chunks, fps):
+            if realtime:
+                audio_time = (self.analyser.samples_fed - start_samples) / \
+                    self.analyser.sample_rate
+                delay = start + audio_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            twin.set_colors(colours)
+            twin.sync()
+            synced += 1
+        return synced
+
+
+def wav_chunks(path : str, chunk_size : int =1024) -> Iterator[bytes]:
+    """Reads a WAV file in chunks of raw PCM
+
+    :param path: The path to the WAV file
+    :param chunk_size: Optional, the number of samples (per channel) in each chunk
+
+    :returns: Iterator of raw PCM chunks
+    """
+    with wave.open(path, 'rb') as wav_file:
+        while True:
+            chunk = wav_file.readframes(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def benchmark(path : str, layout : NanoleafLayout, fps : float =20,
+    chunk_size : int =1024, **kwargs : Any) -> Dict[str, float]:
+    """Runs the audio pipeline over a WAV file as fast as possible
+
+    No requests are made, so this measures only the analysis and mapping.
+
+    :param path: The path to the WAV file
+    :param layout: The layout of the panels to map onto
+    :param fps: Optional, the number of frames per second of audio
+    :param chunk_size: Optional, the number of samples (per channel) in each chunk
+    :param kwargs: Optional, further arguments for NanoleafAudioAnalyser
+
+    :returns: Dictionary of the number of frames, the seconds of audio, the
+        seconds taken and how many times faster than real time it ran
+    """
+    with wave.open(path, 'rb') as wav_file:
+        analyser = NanoleafAudioAnalyser(wav_file.getframerate(), wav_file.getnchannels(),
+            wav_file.getsampwidth(), **kwargs)
+    visualiser = NanoleafAudioVisualiser(analyser, layout)
+    start = time.perf_counter()
+    frames = sum(1 for _ in visualiser.frames(wav_chunks(path, chunk_size), fps))
+    elapsed = time.perf_counter() - start
+    audio_seconds = analyser.samples_fed / analyser.sample_rate
+    return {
+        'frames': frames,
+        'audio_seconds': audio_seconds,
+        'elapsed_seconds': elapsed,
+        'realtime_factor': audio_seconds / elapsed if elapsed else float('inf'),
+    }
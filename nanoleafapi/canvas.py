@@ -0,0 +1,206 @@
+"""NanoleafVirtualCanvas
+
+This module combines the digital twins of several Nanoleaf devices into a
+ single virtual canvas, with one global panel space and coordinate system."""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from nanoleafapi.nanoleaf import NanoleafConnectionError, NanoleafEffectCreationError
+from nanoleafapi.digital_twin import NanoleafDigitalTwin
+from nanoleafapi.layout import NanoleafLayout
+
+# Global panel IDs are the index of the device shifted above the 16 bit panel ID
+DEVICE_SHIFT = 16
+
+class NanoleafVirtualCanvas():
+    """Class for controlling several digital twins as one surface
+
+    Each device is placed on the canvas at an offset, and its panels are
+    given global IDs of the form (device index << 16) | panel ID.
+
+    :ivar twins: The digital twins on the canvas, in the order they were added
+    :ivar offsets: The (x, y) offset of each twin on the canvas
+    :ivar layout: The combined layout of all panels, in global coordinates
+        and with global panel IDs
+    """
+
+    def __init__(self, twins : List[Tuple[NanoleafDigitalTwin, Tuple[float, float]]] =None) -> None:
+        """Initialises the canvas with an optional list of twins and offsets.
+
+        :param twins: Optional, list of (twin, (x, y)) tuples to add"""
+        self.twins : List[NanoleafDigitalTwin] = []
+        self.offsets : List[Tuple[float, float]] = []
+        self.layout = NanoleafLayout({})
+        self.__executor : ThreadPoolExecutor = None
+        for twin, offset in twins or []:
+            self.add_twin(twin, offset)
+
+    def add_twin(self, twin : NanoleafDigitalTwin, offset : Tuple[float, float] =(0, 0)) -> int:
+        """Adds a digital twin to the canvas.
+
+        :param twin: The digital twin of the device
+        :param offset: Optional, the (x, y) position of the device's layout
+            origin on the canvas
+
+        :returns: The index of the device, used in its global panel IDs
+        """
+        self.twins.append(twin)
+        self.offsets.append(offset)
+        position_data = []
+        for index, (each_twin, (offset_x, offset_y)) in enumerate(zip(self.twins, self.offsets)):
+            for panel_id, (x, y) in each_twin.layout.positions.items():
+                position_data.append({
+                    'panelId': self.to_global(index, panel_id),
+                    'x': x + offset_x,
+                    'y': y + offset_y,
+                    'shapeType': each_twin.layout.shape_types[panel_id]
+                })
+        self.layout = NanoleafLayout({'positionData': position_data})
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+        return len(self.twins) - 1
+
+    @staticmethod
+    def to_global(device_index : int, panel_id : int) -> int:
+        """Returns the global ID of a panel
+
+        :param device_index: The index of the device on the canvas
+        :param panel_id: The ID of the panel on the device"""
+        return (device_index << DEVICE_SHIFT) | panel_id
+
+    def to_local(self, global_id : int) -> Tuple[NanoleafDigitalTwin, int]:
+        """Returns the twin and local panel ID of a global panel ID
+
+        :param global_id: The global ID of the panel
+
+        :returns: Tuple of the digital twin and the panel's ID on that device
+        """
+        device_index = global_id >> DEVICE_SHIFT
+        if device_index >= len(self.twins):
+            raise NanoleafEffectCreationError("Invalid panel ID")
+        return self.twins[device_index], global_id & ((1 << DEVICE_SHIFT) - 1)
+
+    def get_ids(self) -> List[int]:
+        """Returns a list of the global IDs of all panels"""
+        return self.layout.get_ids()
+
+    #######################################################
+    ####                   COLOUR                      ####
+    #######################################################
+
+    def set_color(self, global_id : int, rgb : Tuple[int, int, int]) -> None:
+        """Sets the colour of an individual panel.
+
+        :param global_id: The global ID of the panel
+        :param rgb: A tuple containing the RGB values of the colour to set"""
+        twin, panel_id = self.to_local(global_id)
+        twin.set_color(panel_id, rgb)
+
+    def set_colors(self, colors : Dict[int, Tuple[int, int, int]]) -> None:
+        """Sets the colours of several panels.
+
+        :param colors: Dictionary with global panel IDs as keys and RGB tuples as values"""
+        for global_id, rgb in colors.items():
+            self.set_color(global_id, rgb)
+
+    def set_all_colors(self, rgb : Tuple[int, int, int]) -> None:
+        """Sets the colour of all panels on every device.
+
+        :param rgb: A tuple containing the RGB values of the colour to set"""
+        for twin in self.twins:
+            twin.set_all_colors(rgb)
+
+    def set_color_at(self, x : float, y : float, rgb : Tuple[int, int, int]) -> int:
+        """Sets the colour of the panel nearest to a point on the canvas.
+
+        :param x: The x coordinate on the canvas
+        :param y: The y coordinate on the canvas
+        :param rgb: A tuple containing the RGB values of the colour to set
+
+        :returns: The global ID of the panel which was changed
+        """
+        global_id = self.layout.nearest(x, y)
+        if global_id is None:
+            raise NanoleafEffectCreationError("There are no panels on the canvas")
+        self.set_color(global_id, rgb)
+        return global_id
+
+    def set_color_in_radius(self, x : float, y : float, radius : float,
+        rgb : Tuple[int, int, int]) -> List[int]:
+        """Sets the colour of all panels within a radius of a point on the canvas.
+
+        :param x: The x coordinate on the canvas
+        :param y: The y coordinate on the canvas
+        :param radius: The radius around the point
+        :param rgb: A tuple containing the RGB values of the colour to set
+
+        :returns: List of the global IDs of the panels which were changed
+        """
+        global_ids = self.layout.within_radius(x, y, radius)
+        for global_id in global_ids:
+            self.set_color(global_id, rgb)
+        return global_ids
+
+    def set_color_in_box(self, x_min : float, y_min : float, x_max : float, y_max : float,
+        rgb : Tuple[int, int, int]) -> List[int]:
+        """Sets the colour of all panels inside a bounding box on the canvas.
+
+        :param x_min: The left edge of the box
+        :param y_min: The bottom edge of the box
+        :param x_max: The right edge of the box
+        :param y_max: The top edge of the box
+        :param rgb: A tuple containing the RGB values of the colour to set
+
+        :returns: List of the global IDs of the panels which were changed
+        """
+        global_ids = self.layout.within_box(x_min, y_min, x_max, y_max)
+        for global_id in global_ids:
+            self.set_color(global_id, rgb)
+        return global_ids
+
+    def get_color(self, global_id : int) -> Tuple[int, int, int]:
+        """Returns the colour of a panel.
+
+        :param global_id: The global ID of the panel"""
+        twin, panel_id = self.to_local(global_id)
+        return twin.get_color(panel_id)
+
+    def get_all_colors(self) -> Dict[int, Tuple[int, int, int]]:
+        """Returns a dictionary of all global panel IDs and associated colours."""
+        color_dict = {}
+        for index, twin in enumerate(self.twins):
+            for panel_id, rgb in twin.get_all_colors().items():
+                color_dict[self.to_global(index, panel_id)] = rgb
+        return color_dict
+
+    #######################################################
+    ####                    SYNC                       ####
+    #######################################################
+
+    def sync(self) -> bool:
+        """Syncs every device on the canvas concurrently.
+
+        A device which can't be reached doesn't stop the others from syncing.
+
+        :returns: True if every device was synced successfully, otherwise False
+        """
+        if not self.twins:
+            return True
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=len(self.twins),
+                thread_name_prefix="nanoleaf-canvas")
+        futures = [self.__executor.submit(twin.sync) for twin in self.twins]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except NanoleafConnectionError:
+                results.append(False)
+        return all(results)
+
+    def close(self) -> None:
+        """Stops the threads used to sync the devices."""
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
@@ -0,0 +1,99 @@
+"""nanoleaf
+
+This module is a thin command line client for the nanoleafd daemon. It only
+ uses the standard library, so each command takes milliseconds rather than
+ reconnecting to the device every time.
+
+Example usage::
+
+    nanoleafd 192.168.0.2 &
+    nanoleaf power_on
+    nanoleaf set_color "[255, 0, 0]"
+    nanoleaf --ip 192.168.0.3 set_effect "Falling Whites"
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict, List
+
+
+class NanoleafDaemonError(Exception):
+    """Raised when the daemon can't be reached or a request to it fails."""
+
+
+def default_socket_path() -> str:
+    """Returns the path of the daemon's Unix socket, matching nanoleafd"""
+    if 'NANOLEAF_SOCKET' in os.environ:
+        return os.environ['NANOLEAF_SOCKET']
+    directory = os.environ.get('XDG_RUNTIME_DIR', os.path.expanduser('~'))
+    return os.path.join(directory, '.nanoleafapi.sock')
+
+
+def send(request : Dict[str, Any], socket_path : str =None, timeout : float =30) -> Any:
+    """Sends a request to the daemon and returns the result
+
+    :param request: The request dictionary, with the device ip, the method
+        name and optional args, kwargs and token
+    :param socket_path: Optional, the path of the daemon's Unix socket
+    :param timeout: Optional, the number of seconds to wait for the daemon
+
+    :raises NanoleafDaemonError: When the daemon isn't running or the request fails.
+
+    :returns: The result of the method
+    """
+    socket_path = socket_path or default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        try:
+            client.connect(socket_path)
+        except OSError as error:
+            raise NanoleafDaemonError(f"Couldn't connect to nanoleafd at {socket_path}, " +
+                "is it running?") from error
+        client.sendall(json.dumps(request).encode() + b"\n")
+        with client.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        raise NanoleafDaemonError("nanoleafd closed the connection")
+    response = json.loads(line)
+    if not response['ok']:
+        raise NanoleafDaemonError(response['error'])
+    return response['result']
+
+
+def parse_argument(argument : str) -> Any:
+    """Parses a command line argument as JSON, or returns it as a string"""
+    try:
+        return json.loads(argument)
+    except ValueError:
+        return argument
+
+
+def main(argv : List[str] =None) -> None:
+    """Runs a single command from the command line"""
+    parser = argparse.ArgumentParser(prog='nanoleaf',
+        description="Sends a command to a Nanoleaf device through nanoleafd.")
+    parser.add_argument('--socket', default=None, help="path of the Unix socket")
+    parser.add_argument('--ip', default=os.environ.get('NANOLEAF_IP'),
+        help="IP of the device, optional if nanoleafd is connected to one device")
+    parser.add_argument('method', help="Nanoleaf method to call, e.g. power_on, or " +
+        "ping, devices or events")
+    parser.add_argument('args', nargs='*', help="arguments for the method, as JSON or text")
+    options = parser.parse_args(argv)
+    request = {
+        'ip': options.ip,
+        'method': options.method,
+        'args': [parse_argument(argument) for argument in options.args]
+    }
+    try:
+        result = send(request, options.socket)
+    except NanoleafDaemonError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2) if isinstance(result, (dict, list)) else result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""codec
+
+This module chooses how the JSON responses of devices are decoded. Responses
+ are decoded straight from their bytes, with orjson when it is installed,
+ which can be done with ``pip install nanoleafapi[fast]``, and the standard
+ library otherwise. Any other function which decodes JSON from bytes can be
+ passed to the Nanoleaf class instead.
+
+benchmark() compares the size and parse time of the full device information
+ with the layout endpoint read by Nanoleaf.get_ids(), on a generated Shapes or
+ Canvas layout of any size."""
+
+import json
+import time
+from typing import Any, Callable, Dict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# A function which decodes JSON from the bytes of a response
+JSONLoads = Callable[[bytes], Any]
+
+# The fastest available decoder, used by default
+DEFAULT_LOADS : JSONLoads = orjson.loads if orjson is not None else json.loads
+
+# The shape type and side length of the panels of each product
+SHAPES = {'shapes': (7, 67), 'canvas': (2, 100)}
+
+
+def generate_info(num_panels : int, product : str ='shapes') -> Dict[str, Any]:
+    """Returns device information like that of a device with many panels
+
+    :param num_panels: The number of panels
+    :param product: Optional, 'shapes' for hexagons or 'canvas' for squares
+
+    :raises ValueError: When the product is unknown.
+
+    :returns: Dictionary in the format of Nanoleaf.get_info()
+    """
+    if product not in SHAPES:
+        raise ValueError("The product must be one of " + ", ".join(SHAPES))
+    shape_type, side_length = SHAPES[product]
+    columns = max(int(num_panels ** 0.5), 1)
+    position_data = [{"panelId": 1000 + index * 37 % 64000,
+        "x": index % columns * side_length, "y": index // columns * side_length,
+        "o": index * 60 % 360, "shapeType": shape_type} for index in range(num_panels)]
+    return {
+        "name": "Shapes 4C3A" if product == 'shapes' else "Canvas 8E21",
+        "serialNo": "S19124C3A", "manufacturer": "Nanoleaf",
+        "firmwareVersion": "9.2.4", "hardwareVersion": "2.0-4",
+        "model": "NL42" if product == 'shapes' else "NL29",
+        "cloudHash": {}, "discovery": {}, "schedules": {},
+        "state": {
+            "on": {"value": True},
+            "brightness": {"value": 100, "max": 100, "min": 0},
+            "hue": {"value": 0, "max": 360, "min": 0},
+            "sat": {"value": 0, "max": 100, "min": 0},
+            "ct": {"value": 4000, "max": 6500, "min": 1200},
+            "colorMode": "effect"
+        },
+        "effects": {
+            "select": "Northern Lights",
+            "effectsList": ["Effect " + str(index) for index in range(40)]
+        },
+        "panelLayout": {
+            "layout": {"numPanels": num_panels, "sideLength": side_length,
+                "positionData": position_data},
+            "globalOrientation": {"value": 0, "max": 360, "min": 0}
+        },
+        "rhythm": {}
+    }
+
+
+def _loads_text(content : bytes) -> Any:
+    """Decodes JSON by decoding the bytes to text first, as getters used to"""
+    return json.loads(content.decode('utf-8'))
+
+
+def _parse_time(loads : JSONLoads, content : bytes, repeat : int) -> float:
+    """Returns the mean time of decoding a response in microseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        loads(content)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def benchmark(num_panels : int =500, product : str ='shapes',
+    repeat : int =200) -> Dict[str, Dict[str, float]]:
+    """Compares the payload sizes and parse times of the reads of a layout
+
+    No requests are made; the responses are generated with generate_info().
+
+    :param num_panels: Optional, the number of panels
+    :param product: Optional, 'shapes' or 'canvas'
+    :param repeat: Optional, the number of times each response is parsed
+
+    :returns: Dictionary with 'info', the full device information previously
+        read by get_ids(), and 'layout', the /panelLayout/layout response it
+        now reads. Each has the size in bytes and the mean parse time in
+        microseconds when decoding text, decoding bytes with the standard
+        library and, if installed, decoding bytes with orjson.
+    """
+    decoders : Dict[str, JSONLoads] = {'text_us': _loads_text, 'bytes_us': json.loads}
+    if orjson is not None:
+        decoders['orjson_us'] = orjson.loads
+    info = generate_info(num_panels, product)
+    results = {}
+    for read, document in (('info', info), ('layout', info['panelLayout']['layout'])):
+        content = json.dumps(document).encode('utf-8')
+        result : Dict[str, float] = {'bytes': len(content)}
+        for name, loads in decoders.items():
+            result[name] = _parse_time(loads, content, repeat)
+        results[read] = result
+    return results
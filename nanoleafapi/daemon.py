@@ -0,0 +1,167 @@
+"""nanoleafd
+
+This module runs a long-lived local daemon which keeps warm connections to
+ Nanoleaf devices, along with their layouts and recent events, and serves
+ requests from the nanoleaf command line tool over a Unix socket.
+
+Each request is a single line of JSON, e.g.
+ ``{"ip": "192.168.0.2", "method": "set_brightness", "args": [50]}``,
+ and is answered with a single line of JSON, either
+ ``{"ok": true, "result": ...}`` or ``{"ok": false, "error": "..."}``."""
+
+import argparse
+import json
+import os
+import socketserver
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List
+from nanoleafapi.nanoleaf import Nanoleaf
+from nanoleafapi.cli import default_socket_path
+
+# Methods which can't be called remotely, as they need a local callback
+BLOCKED_METHODS = {'register_event'}
+
+# Number of recent events kept for each device
+EVENT_HISTORY = 100
+
+
+class NanoleafDaemon():
+    """Class for serving Nanoleaf requests over a Unix socket
+
+    :ivar socket_path: The path of the Unix socket
+    :ivar devices: Dictionary of device IPs and their Nanoleaf objects
+    :ivar layouts: Dictionary of device IPs and their cached layouts
+    :ivar events: Dictionary of device IPs and their most recent events
+    """
+
+    def __init__(self, socket_path : str =None) -> None:
+        """Initialises the daemon.
+
+        :param socket_path: Optional, the path of the Unix socket to listen on"""
+        self.socket_path = socket_path or default_socket_path()
+        self.devices : Dict[str, Nanoleaf] = {}
+        self.layouts : Dict[str, Dict[str, Any]] = {}
+        self.events : Dict[str, Deque[Dict[str, Any]]] = {}
+        self.__lock = threading.Lock()
+        self.__device_locks : Dict[str, threading.Lock] = {}
+        self.__server : socketserver.ThreadingUnixStreamServer = None
+
+    def get_device(self, ip : str, auth_token : str =None) -> Nanoleaf:
+        """Returns the Nanoleaf object for a device, connecting if required
+
+        The first connection to a device also subscribes to its events, which
+        keep the cached layout up to date. Only requests for the same device
+        wait for it to connect.
+
+        :param ip: The IP address of the device
+        :param auth_token: Optional, the authentication token of the device
+        """
+        with self.__lock:
+            if ip in self.devices:
+                return self.devices[ip]
+            device_lock = self.__device_locks.setdefault(ip, threading.Lock())
+        with device_lock:
+            if ip not in self.devices:
+                device = Nanoleaf(ip, auth_token)
+                self.events[ip] = deque(maxlen=EVENT_HISTORY)
+                device.register_event(lambda event: self.__on_event(ip, event), [1, 2, 3, 4])
+                with self.__lock:
+                    self.devices[ip] = device
+            return self.devices[ip]
+
+    def __on_event(self, ip : str, event : Dict[str, Any]) -> None:
+        """Records an event, and updates the cached layout from layout events"""
+        self.events[ip].append(event)
+        for item in event.get('events', []):
+            value = item.get('value')
+            if isinstance(value, dict) and 'positionData' in value:
+                self.layouts[ip] = value
+
+    def handle(self, request : Dict[str, Any]) -> Any:
+        """Carries out a single request
+
+        :param request: The request dictionary, with the device ip, the method
+            name and optional args, kwargs and token
+
+        :returns: The result of the method
+        """
+        method = request.get('method')
+        if method == 'ping':
+            return 'pong'
+        if method == 'devices':
+            return list(self.devices)
+        ip = request.get('ip')
+        if ip is None:
+            if len(self.devices) != 1:
+                raise ValueError("An ip is required when the daemon isn't connected " +
+                    "to exactly one device")
+            ip = next(iter(self.devices))
+        device = self.get_device(ip, request.get('token'))
+        args = request.get('args', [])
+        kwargs = request.get('kwargs', {})
+        if method == 'events':
+            return list(self.events[ip])
+        if method == 'get_layout':
+            if ip not in self.layouts:
+                self.layouts[ip] = device.get_layout()
+            return self.layouts[ip]
+        if method == 'get_ids':
+            if ip not in self.layouts:
+                self.layouts[ip] = device.get_layout()
+            return [data['panelId'] for data in self.layouts[ip].get('positionData', [])]
+        if (not isinstance(method, str) or method.startswith('_') or
+                method in BLOCKED_METHODS or not callable(getattr(device, method, None))):
+            raise ValueError(f"Unknown method: {method}")
+        return getattr(device, method)(*args, **kwargs)
+
+    def serve_forever(self) -> None:
+        """Listens on the Unix socket and serves requests until shutdown() is called."""
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    try:
+                        response = {"ok": True, "result": daemon.handle(json.loads(line))}
+                    except Exception as error: # pylint: disable=broad-except
+                        response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+                    self.wfile.write(json.dumps(response, default=str).encode() + b"\n")
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.__server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.__server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        try:
+            self.__server.serve_forever()
+        finally:
+            self.__server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        """Stops serving requests."""
+        if self.__server is not None:
+            self.__server.shutdown()
+
+
+def main(argv : List[str] =None) -> None:
+    """Runs the daemon from the command line"""
+    parser = argparse.ArgumentParser(prog='nanoleafd',
+        description="Keeps warm connections to Nanoleaf devices for the nanoleaf command.")
+    parser.add_argument('--socket', default=None, help="path of the Unix socket")
+    parser.add_argument('devices', nargs='*', metavar='ip',
+        help="devices to connect to on startup (using saved tokens)")
+    options = parser.parse_args(argv)
+    daemon = NanoleafDaemon(options.socket)
+    for ip in options.devices:
+        daemon.get_device(ip)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -3,25 +3,39 @@
 This module allows for the creation of a "digital twin", allowing you to
  make changes to individual panels and sync them to their real counterparts."""
 
-from typing import Tuple, List, Dict
+import threading
+from typing import Any, Tuple, List, Dict
 from nanoleafapi.nanoleaf import NanoleafEffectCreationError, Nanoleaf
+from nanoleafapi.layout import NanoleafLayout
 
 class NanoleafDigitalTwin():
     """Class for creating and modifying digital twins
 
+    When double buffered, the set methods change a back buffer, and
+    commit() makes its current colours the frame which sync() sends. This
+    lets several threads render while another syncs, without sync() ever
+    sending a partly drawn frame or waiting for the renderers.
+
     :ivar nanoleaf: The Nanoleaf object
-    :ivar tile_dict: The dictionary of tiles and their associated colour
+    :ivar tile_dict: The dictionary of tiles and their associated colour,
+        which is the back buffer when double buffered
+    :ivar layout: The geometry of the panel layout
+    :ivar double_buffered: True if sync() sends the last committed frame
     """
 
-    def __init__(self, nl : Nanoleaf) -> None:
+    def __init__(self, nl : Nanoleaf, double_buffered : bool =False) -> None:
         """Initialises a digital twin based on the Nanoleaf object provided.
 
-        :param nl: The Nanoleaf object"""
-        ids = nl.get_ids()
+        :param nl: The Nanoleaf object
+        :param double_buffered: Optional, True to only sync committed frames"""
+        self.layout = NanoleafLayout(nl.get_layout())
         self.nanoleaf = nl
+        self.double_buffered = double_buffered
         self.tile_dict = {}
-        for panel_id in ids:
+        for panel_id in self.layout.get_ids():
             self.tile_dict[panel_id] = {"R": 0, "G": 0, "B": 0, "W": 0, "T": 0}
+        self.__lock = threading.Lock()
+        self.__front = self.__copy_tiles()
 
 
     def set_color(self, panel_id : int, rgb : Tuple[int, int, int]) -> None:
@@ -41,9 +55,10 @@ class NanoleafDigitalTwin():
             if colour < 0 or colour > 255:
                 raise NanoleafEffectCreationError("All values in the tuple must be  " +
                     "integers between 0 and 255! E.g., (255, 0, 0)")
-        self.tile_dict[panel_id]['R'] = rgb[0]
-        self.tile_dict[panel_id]['G'] = rgb[1]
-        self.tile_dict[panel_id]['B'] = rgb[2]
+        with self.__lock:
+            self.tile_dict[panel_id]['R'] = rgb[0]
+            self.tile_dict[panel_id]['G'] = rgb[1]
+            self.tile_dict[panel_id]['B'] = rgb[2]
 
 
     def set_all_colors(self, rgb : Tuple[int, int, int]) -> None:
@@ -60,10 +75,70 @@ class NanoleafDigitalTwin():
             if colour < 0 or colour > 255:
                 raise NanoleafEffectCreationError("All values in the tuple must be  " +
                     "integers between 0 and 255! E.g., (255, 0, 0)")
-        for _, value in self.tile_dict.items():
-            value['R'] = rgb[0]
-            value['G'] = rgb[1]
-            value['B'] = rgb[2]
+        with self.__lock:
+            for _, value in self.tile_dict.items():
+                value['R'] = rgb[0]
+                value['G'] = rgb[1]
+                value['B'] = rgb[2]
+
+
+    def set_colors(self, colors : Dict[int, Tuple[int, int, int]]) -> None:
+        """Sets the colours of several panels.
+
+        :param colors: Dictionary with panel IDs as keys and RGB tuples as values"""
+        for panel_id, rgb in colors.items():
+            self.set_color(panel_id, rgb)
+
+
+    def set_color_at(self, x : float, y : float, rgb : Tuple[int, int, int]) -> int:
+        """Sets the colour of the panel nearest to a point.
+
+        :param x: The x coordinate, in the same units as the layout
+        :param y: The y coordinate, in the same units as the layout
+        :param rgb: A tuple containing the RGB values of the colour to set
+
+        :returns: The ID of the panel which was changed
+        """
+        panel_id = self.layout.nearest(x, y)
+        if panel_id is None:
+            raise NanoleafEffectCreationError("There are no panels in the layout")
+        self.set_color(panel_id, rgb)
+        return panel_id
+
+
+    def set_color_in_radius(self, x : float, y : float, radius : float,
+        rgb : Tuple[int, int, int]) -> List[int]:
+        """Sets the colour of all panels within a radius of a point.
+
+        :param x: The x coordinate, in the same units as the layout
+        :param y: The y coordinate, in the same units as the layout
+        :param radius: The radius around the point
+        :param rgb: A tuple containing the RGB values of the colour to set
+
+        :returns: List of the IDs of the panels which were changed
+        """
+        panel_ids = self.layout.within_radius(x, y, radius)
+        for panel_id in panel_ids:
+            self.set_color(panel_id, rgb)
+        return panel_ids
+
+
+    def set_color_in_box(self, x_min : float, y_min : float, x_max : float, y_max : float,
+        rgb : Tuple[int, int, int]) -> List[int]:
+        """Sets the colour of all panels inside a bounding box.
+
+        :param x_min: The left edge of the box
+        :param y_min: The bottom edge of the box
+        :param x_max: The right edge of the box
+        :param y_max: The top edge of the box
+        :param rgb: A tuple containing the RGB values of the colour to set
+
+        :returns: List of the IDs of the panels which were changed
+        """
+        panel_ids = self.layout.within_box(x_min, y_min, x_max, y_max)
+        for panel_id in panel_ids:
+            self.set_color(panel_id, rgb)
+        return panel_ids
 
 
     def get_ids(self) -> List[int]:
@@ -97,14 +172,32 @@ class NanoleafDigitalTwin():
             color_dict[key] = (value['R'], value['G'], value['B'])
         return color_dict
 
+    def __copy_tiles(self) -> Dict[int, Dict[str, Any]]:
+        """Returns a copy of the back buffer, which the caller must hold the lock for"""
+        return {panel_id: dict(value) for panel_id, value in self.tile_dict.items()}
+
+    def commit(self) -> None:
+        """Makes the current colours the frame sent by sync() when double
+        buffered, copying the back buffer to the front buffer atomically."""
+        with self.__lock:
+            self.__front = self.__copy_tiles()
+
     def sync(self) -> bool:
         """Syncs the digital twin's changes to the real Nanoleaf device.
 
+        When double buffered, the last committed frame is sent, and the set
+        methods can keep changing the back buffer while it is sent.
+
         :returns: True if success, otherwise False
         """
-        anim_data = str(len(self.tile_dict))
+        if self.double_buffered:
+            tiles = self.__front
+        else:
+            with self.__lock:
+                tiles = self.__copy_tiles()
+        anim_data = str(len(tiles))
         f = 1
-        for key, value in self.tile_dict.items():
+        for key, value in tiles.items():
             r = value['R']
             g = value['G']
             b = value['B']
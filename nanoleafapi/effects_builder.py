@@ -0,0 +1,132 @@
+"""effects-builder
+
+This module provides an interactive command line tool for building effects,
+ which previews and saves them through the nanoleafd daemon."""
+
+import colorsys
+import os
+from typing import Any, Dict, List, Tuple
+from nanoleafapi.cli import NanoleafDaemonError, send
+
+# Palette based animation types supported by the builder
+ANIM_TYPES = ['flow', 'wheel', 'fade', 'highlight', 'random', 'explode']
+
+# The longest transition or delay time accepted, in tenths of a second
+MAX_TIME = 600
+
+
+def build_effect(name : str, anim_type : str, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    rgb_list : List[Tuple[int, int, int]],
+    trans_time : int =10, delay_time : int =10, loop : bool =True,
+    command : str ='display') -> Dict[str, Any]:
+    """Builds a palette based effect dictionary
+
+    :param name: The name of the effect
+    :param anim_type: The animation type, one of ANIM_TYPES
+    :param rgb_list: A list of tuples containing the RGB colours of the palette
+    :param trans_time: Optional, the transition time between colours in tenths
+        of a second
+    :param delay_time: Optional, the time each colour is held in tenths of a second
+    :param loop: Optional, True to repeat the effect
+    :param command: Optional, display to preview the effect or add to save it
+
+    :raises ValueError: When an invalid animation type or colour is provided.
+
+    :returns: The effect dictionary, for use with Nanoleaf.write_effect()
+    """
+    if anim_type not in ANIM_TYPES:
+        raise ValueError("Animation type must be one of " + ", ".join(ANIM_TYPES))
+    if not rgb_list:
+        raise ValueError("The palette must contain at least one colour")
+    palette = []
+    for rgb in rgb_list:
+        if len(rgb) != 3 or any(colour < 0 or colour > 255 for colour in rgb):
+            raise ValueError("Colours must be three values between 0 and 255")
+        hue, sat, value = colorsys.rgb_to_hsv(rgb[0] / 255, rgb[1] / 255, rgb[2] / 255)
+        palette.append({
+            "hue": int(hue * 360),
+            "saturation": int(sat * 100),
+            "brightness": int(value * 100)
+        })
+    return {
+        "command": command,
+        "animName": name,
+        "animType": anim_type,
+        "colorType": "HSB",
+        "palette": palette,
+        "transTime": {"minValue": trans_time, "maxValue": trans_time},
+        "delayTime": {"minValue": delay_time, "maxValue": delay_time},
+        "loop": loop
+    }
+
+
+def _ask(prompt : str, default : str ="") -> str:
+    """Asks a question, returning the default for an empty answer"""
+    suffix = f" [{default}]" if default else ""
+    answer = input(f"{prompt}{suffix}: ").strip()
+    return answer or default
+
+
+def _ask_number(prompt : str, default : str, minimum : int, maximum : int) -> int:
+    """Asks for a whole number until one in the range is entered"""
+    while True:
+        answer = _ask(prompt, default)
+        try:
+            number = int(answer)
+        except ValueError:
+            number = None
+        if number is not None and minimum <= number <= maximum:
+            return number
+        print(f"  Please enter a whole number between {minimum} and {maximum}.")
+
+
+def _ask_colours() -> List[Tuple[int, int, int]]:
+    """Asks for palette colours until an empty line is entered"""
+    print("Enter the palette colours as R G B, followed by an empty line:")
+    rgb_list : List[Tuple[int, int, int]] = []
+    while True:
+        answer = input(f"  Colour {len(rgb_list) + 1}: ").strip()
+        if not answer:
+            if rgb_list:
+                return rgb_list
+            print("  The palette needs at least one colour.")
+            continue
+        try:
+            r, g, b = (int(value) for value in answer.replace(",", " ").split())
+        except ValueError:
+            print("  Please enter three numbers, e.g. 255 0 0")
+            continue
+        if any(colour < 0 or colour > 255 for colour in (r, g, b)):
+            print("  Colours must be between 0 and 255.")
+            continue
+        rgb_list.append((r, g, b))
+
+
+def interactive_builder() -> None:
+    """Builds an effect interactively, then previews and optionally saves it"""
+    ip = _ask("Device IP (blank if nanoleafd has one device)",
+        os.environ.get('NANOLEAF_IP', ''))
+    name = _ask("Effect name", "New effect")
+    anim_type = ""
+    while anim_type not in ANIM_TYPES:
+        anim_type = _ask("Animation type (" + ", ".join(ANIM_TYPES) + ")", "flow")
+    rgb_list = _ask_colours()
+    trans_time = _ask_number("Transition time (tenths of a second)", "10", 0, MAX_TIME)
+    delay_time = _ask_number("Delay time (tenths of a second)", "10", 0, MAX_TIME)
+    loop = _ask("Loop (y/n)", "y").lower().startswith("y")
+
+    effect = build_effect(name, anim_type, rgb_list, trans_time, delay_time, loop)
+    request : Dict[str, Any] = {'ip': ip or None, 'method': 'write_effect', 'args': [effect]}
+    try:
+        send(request)
+        print("Previewing the effect on the device.")
+        if _ask("Save the effect to the device (y/n)", "n").lower().startswith("y"):
+            effect['command'] = 'add'
+            send(request)
+            print(f"Saved '{name}'.")
+    except NanoleafDaemonError as error:
+        print(error)
+
+
+if __name__ == '__main__':
+    interactive_builder()
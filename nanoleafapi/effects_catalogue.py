@@ -0,0 +1,121 @@
+"""NanoleafEffectsCatalogue
+
+This module provides a local, indexed copy of the effects stored on a Nanoleaf
+ device, allowing effects to be looked up without a request to the device."""
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+PaletteKey = Tuple[Tuple[Any, ...], ...]
+
+class NanoleafEffectsCatalogue():
+    """Class for storing and indexing the effects of a Nanoleaf device
+
+    :ivar effects: Dictionary of effect names and their effect dictionaries
+    :ivar current_effect: The name of the currently selected effect, if known
+    """
+
+    def __init__(self, effects : List[Dict[str, Any]] =None) -> None:
+        """Initialises the catalogue with an optional list of effect dictionaries.
+
+        :param effects: List of effect dictionaries, as returned by the
+            requestAll command"""
+        self.effects : Dict[str, Dict[str, Any]] = {}
+        self.current_effect : Optional[str] = None
+        self.__by_type : Dict[str, Set[str]] = {}
+        self.__by_palette : Dict[PaletteKey, Set[str]] = {}
+        if effects is not None:
+            self.load(effects)
+
+    def __contains__(self, effect_name : object) -> bool:
+        return effect_name in self.effects
+
+    def __len__(self) -> int:
+        return len(self.effects)
+
+    @staticmethod
+    def palette_key(palette : List[Dict[str, Any]]) -> PaletteKey:
+        """Returns a hashable key for an effect palette
+
+        :param palette: List of palette colour dictionaries
+
+        :returns: Tuple of the sorted items of each palette colour
+        """
+        return tuple(tuple(sorted(colour.items())) for colour in palette)
+
+    def load(self, effects : List[Dict[str, Any]]) -> None:
+        """Replaces the contents of the catalogue.
+
+        :param effects: List of effect dictionaries"""
+        self.effects.clear()
+        self.__by_type.clear()
+        self.__by_palette.clear()
+        for effect in effects:
+            self.add(effect)
+
+    def add(self, effect : Dict[str, Any]) -> None:
+        """Adds or replaces an effect in the catalogue.
+
+        :param effect: The effect dictionary, which must contain an animName"""
+        name = effect['animName']
+        if name in self.effects:
+            self.remove(name)
+        self.effects[name] = effect
+        self.__by_type.setdefault(effect.get('animType'), set()).add(name)
+        palette = self.palette_key(effect.get('palette') or [])
+        self.__by_palette.setdefault(palette, set()).add(name)
+
+    def remove(self, effect_name : str) -> bool:
+        """Removes an effect from the catalogue.
+
+        :param effect_name: The name of the effect to remove
+
+        :returns: True if the effect was in the catalogue, otherwise False
+        """
+        effect = self.effects.pop(effect_name, None)
+        if effect is None:
+            return False
+        self.__by_type[effect.get('animType')].discard(effect_name)
+        palette = self.palette_key(effect.get('palette') or [])
+        self.__by_palette[palette].discard(effect_name)
+        return True
+
+    def get(self, effect_name : str) -> Optional[Dict[str, Any]]:
+        """Returns the effect dictionary for an effect, or None if unknown.
+
+        :param effect_name: The name of the effect"""
+        return self.effects.get(effect_name)
+
+    def names(self) -> List[str]:
+        """Returns a list of the names of all effects in the catalogue"""
+        return list(self.effects)
+
+    def find_by_type(self, anim_type : str) -> List[str]:
+        """Returns the names of all effects with the given animType
+
+        :param anim_type: The animation type, e.g. custom, flow or random"""
+        return sorted(self.__by_type.get(anim_type, ()))
+
+    def find_by_palette(self, palette : List[Dict[str, Any]]) -> List[str]:
+        """Returns the names of all effects with exactly the given palette
+
+        :param palette: List of palette colour dictionaries"""
+        return sorted(self.__by_palette.get(self.palette_key(palette), ()))
+
+    def handle_event(self, event : Dict[str, Any]) -> List[str]:
+        """Updates the catalogue from an effects event (type 3).
+
+        :param event: The event dictionary received from the device
+
+        :returns: List of effect names which were selected but are not in the
+            catalogue, and so should be fetched from the device
+        """
+        unknown = []
+        for effect_event in event.get('events', []):
+            if effect_event.get('attr') != 1:
+                continue
+            name = effect_event.get('value')
+            self.current_effect = name
+            # Names such as *Solid* and *Dynamic* are not stored effects
+            if name and not name.startswith('*') and name not in self.effects:
+                unknown.append(name)
+        return unknown
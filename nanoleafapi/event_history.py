@@ -0,0 +1,203 @@
+"""event_history
+
+This module keeps a bounded history of the events of a Nanoleaf device, for
+ dashboards which need recent events without keeping their own lists.
+
+Each event type has a ring buffer allocated up front with room for a fixed
+ number of events, so memory use never grows, and the oldest events are
+ overwritten once it is full. Each change in an event is stored separately,
+ with the time.time() it was received. Aggregates are updated as events
+ arrive: the last seen value of each state, layout and effect attribute, how
+ many times each effect was selected, and the number and recent rate of
+ touches on each panel."""
+
+import math
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+# Event types
+STATE = 1
+LAYOUT = 2
+EFFECTS = 3
+TOUCH = 4
+
+# The names of the attributes of state, layout and effects events
+ATTRIBUTES = {
+    STATE: {1: 'on', 2: 'brightness', 3: 'hue', 4: 'sat', 5: 'ct', 6: 'colorMode'},
+    LAYOUT: {1: 'layout', 2: 'globalOrientation'},
+    EFFECTS: {1: 'effect'},
+}
+
+
+class _EventRing():
+    """Preallocated ring buffer of events and their timestamps, oldest first"""
+
+    def __init__(self, capacity : int) -> None:
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.events : List[Any] = [None] * capacity
+        self.start = 0
+        self.size = 0
+
+    def append(self, timestamp : float, event : Dict[str, Any]) -> None:
+        """Adds an event, overwriting the oldest when full"""
+        index = (self.start + self.size) % self.capacity
+        self.timestamps[index] = timestamp
+        self.events[index] = event
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def __bisect(self, timestamp : float) -> int:
+        """Returns the position of the first event at or after a time"""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[(self.start + middle) % self.capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def between(self, start : Optional[float],
+        end : Optional[float]) -> List[Tuple[float, Dict[str, Any]]]:
+        """Returns the events from start up to but not including end"""
+        first = 0 if start is None else self.__bisect(start)
+        last = self.size if end is None else self.__bisect(end)
+        indices = ((self.start + position) % self.capacity for position in range(first, last))
+        return [(self.timestamps[index], self.events[index]) for index in indices]
+
+
+class NanoleafEventHistory(): # pylint: disable=too-many-instance-attributes
+    """Class for recording the recent events of a device with rolling aggregates
+
+    :ivar capacity: The number of events kept for each event type
+    :ivar rate_window: The time constant in seconds of the touch rates, which
+        weight touches in roughly the last rate_window seconds
+    :ivar totals: Dictionary of event types and the number of events
+        recorded, including those no longer kept
+    :ivar last_seen: Dictionary of the last value of each state, layout and
+        effect attribute, e.g. 'brightness' or 'effect'
+    :ivar last_seen_times: Dictionary of the time.time() each attribute in
+        last_seen was received
+    :ivar effect_changes: Dictionary of effect names and the number of times
+        they were selected
+    :ivar touch_counts: Dictionary of panel IDs and the number of touches
+    :ivar gesture_counts: Dictionary of gesture IDs and the number of touches
+    """
+
+    def __init__(self, capacity : int =1024, rate_window : float =60) -> None:
+        """Allocates the ring buffers.
+
+        :param capacity: Optional, the number of events kept for each event type
+        :param rate_window: Optional, the time constant of the touch rates in seconds"""
+        if capacity < 1:
+            raise ValueError("The capacity must be at least 1")
+        self.capacity = capacity
+        self.rate_window = rate_window
+        self.totals = {event_type: 0 for event_type in (STATE, LAYOUT, EFFECTS, TOUCH)}
+        self.last_seen : Dict[str, Any] = {}
+        self.last_seen_times : Dict[str, float] = {}
+        self.effect_changes : Dict[str, int] = {}
+        self.touch_counts : Dict[int, int] = {}
+        self.gesture_counts : Dict[int, int] = {}
+        self.__rings = {event_type: _EventRing(capacity) for event_type in self.totals}
+        self.__touch_rates : Dict[int, Tuple[float, float]] = {}
+        self.__lock = threading.Lock()
+
+    def record(self, event_type : int, event_data : Dict[str, Any],
+        timestamp : float =None) -> None:
+        """Records an event as received from the device
+
+        :param event_type: The event type, from 1-4
+        :param event_data: The event dictionary, as passed to the function
+            registered with Nanoleaf.register_event()
+        :param timestamp: Optional, the time.time() the event was received,
+            which defaults to now
+
+        :raises ValueError: When the event type isn't 1-4.
+        """
+        if event_type not in self.__rings:
+            raise ValueError("Valid event types must be between 1-4")
+        timestamp = time.time() if timestamp is None else timestamp
+        ring = self.__rings[event_type]
+        with self.__lock:
+            for event in event_data.get('events', []):
+                ring.append(timestamp, event)
+                self.totals[event_type] += 1
+                if event_type == TOUCH:
+                    self.__record_touch(timestamp, event)
+                    continue
+                name = ATTRIBUTES[event_type].get(event.get('attr'), str(event.get('attr')))
+                self.last_seen[name] = event.get('value')
+                self.last_seen_times[name] = timestamp
+                if event_type == EFFECTS and name == 'effect':
+                    self.effect_changes[event['value']] = \
+                        self.effect_changes.get(event['value'], 0) + 1
+
+    def __record_touch(self, timestamp : float, event : Dict[str, Any]) -> None:
+        """Updates the touch aggregates, which the caller must hold the lock for"""
+        panel_id = event.get('panelId')
+        gesture = event.get('gesture')
+        self.touch_counts[panel_id] = self.touch_counts.get(panel_id, 0) + 1
+        self.gesture_counts[gesture] = self.gesture_counts.get(gesture, 0) + 1
+        self.__touch_rates[panel_id] = (self.__decayed(panel_id, timestamp) +
+            1 / self.rate_window, timestamp)
+
+    def __decayed(self, panel_id : int, timestamp : float) -> float:
+        """Returns the touch rate of a panel decayed to a time"""
+        if panel_id not in self.__touch_rates:
+            return 0.0
+        rate, updated = self.__touch_rates[panel_id]
+        return rate * math.exp(-max(timestamp - updated, 0) / self.rate_window)
+
+    def touch_rates(self, now : float =None) -> Dict[int, float]:
+        """Returns the recent rate of touches on each panel
+
+        :param now: Optional, the time.time() to calculate the rates at
+
+        :returns: Dictionary of panel IDs and their touches per second, with
+            older touches counting exponentially less
+        """
+        now = time.time() if now is None else now
+        with self.__lock:
+            return {panel_id: self.__decayed(panel_id, now) for panel_id in self.__touch_rates}
+
+    def events(self, event_type : int, start : float =None,
+        end : float =None) -> List[Tuple[float, Dict[str, Any]]]:
+        """Returns the kept events of a type received in a time window
+
+        :param event_type: The event type, from 1-4
+        :param start: Optional, the earliest time.time(), e.g. time.time() - 60
+        :param end: Optional, the time.time() the window ends before
+
+        :returns: List of (timestamp, event) tuples, oldest first, where each
+            event is one of the dictionaries in the 'events' list of the data
+        """
+        with self.__lock:
+            return self.__rings[event_type].between(start, end)
+
+    def count(self, event_type : int, start : float =None, end : float =None) -> int:
+        """Returns the number of kept events of a type received in a time window
+
+        :param event_type: The event type, from 1-4
+        :param start: Optional, the earliest time.time()
+        :param end: Optional, the time.time() the window ends before
+        """
+        return len(self.events(event_type, start, end))
+
+    def touches(self, start : float =None, end : float =None) -> Dict[int, int]:
+        """Returns the number of kept touches on each panel in a time window
+
+        :param start: Optional, the earliest time.time()
+        :param end: Optional, the time.time() the window ends before
+
+        :returns: Dictionary of panel IDs and their number of touches
+        """
+        counts : Dict[int, int] = {}
+        for _, event in self.events(TOUCH, start, end):
+            counts[event.get('panelId')] = counts.get(event.get('panelId'), 0) + 1
+        return counts
@@ -0,0 +1,321 @@
+"""fleet
+
+This module controls very large fleets of Nanoleaf devices from several
+ worker processes. In a single process the GIL and the number of open sockets
+ limit how many devices can be streamed to, so the devices are split into
+ shards, one per process, and each worker keeps its own connections and
+ digital twins. The coordinator sends commands and frames to the workers
+ which own the devices and gathers the results and metrics, so throughput
+ grows with the number of cores.
+
+Functions passed to NanoleafFleet.run() are called inside the workers, so
+ they must be picklable, i.e. defined at the top level of a module."""
+
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from nanoleafapi.nanoleaf import Nanoleaf, DEFAULT_TIMEOUT
+from nanoleafapi.digital_twin import NanoleafDigitalTwin
+from nanoleafapi.transport import Timeout
+
+# The IP and auth token of a device
+Device = Tuple[str, str]
+
+# The largest number of threads each worker uses to reach its devices
+MAX_THREADS = 32
+
+
+def _portable(error : BaseException) -> BaseException:
+    """Returns an exception which can be sent from a worker to the coordinator"""
+    try:
+        return pickle.loads(pickle.dumps(error))
+    except Exception: # pylint: disable=broad-except
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+class _FleetWorker():
+    """The devices, digital twins and counters of one worker process"""
+
+    def __init__(self, devices : List[Device], timeout : Timeout) -> None:
+        self.devices : Dict[str, Nanoleaf] = {}
+        self.errors : Dict[str, BaseException] = {}
+        self.twins : Dict[str, NanoleafDigitalTwin] = {}
+        self.counters : Dict[str, float] = {'commands': 0, 'frames': 0, 'failures': 0,
+            'busy_seconds': 0.0}
+        self.executor = ThreadPoolExecutor(max_workers=max(min(len(devices), MAX_THREADS), 1),
+            thread_name_prefix="nanoleaf-fleet")
+
+        def connect(device : Device) -> None:
+            ip, auth_token = device
+            try:
+                self.devices[ip] = Nanoleaf(ip, auth_token, timeout=timeout)
+            except Exception as error: # pylint: disable=broad-except
+                self.errors[ip] = _portable(error)
+
+        list(self.executor.map(connect, devices))
+
+    def twin(self, ip : str) -> NanoleafDigitalTwin:
+        """Returns the digital twin of a device, creating it on first use"""
+        if ip not in self.twins:
+            self.twins[ip] = NanoleafDigitalTwin(self.devices[ip])
+        return self.twins[ip]
+
+    def each(self, ips : List[str], func : Callable[[str], Any]) -> Dict[str, Any]:
+        """Calls a function for each device concurrently, returning the results
+        or the exceptions raised"""
+        def call(ip : str) -> Any:
+            if ip in self.errors:
+                return self.errors[ip]
+            try:
+                return func(ip)
+            except Exception as error: # pylint: disable=broad-except
+                return _portable(error)
+
+        results = dict(zip(ips, self.executor.map(call, ips)))
+        self.counters['failures'] += sum(isinstance(result, BaseException)
+            for result in results.values())
+        return results
+
+    def command(self, ips : List[str], name : str, args : Tuple[Any, ...],
+        kwargs : Dict[str, Any]) -> Dict[str, Any]:
+        """Calls a method of the Nanoleaf object of each device"""
+        if name.startswith('_'):
+            raise AttributeError(f"'Nanoleaf' object has no command '{name}'")
+        self.counters['commands'] += len(ips)
+        return self.each(ips, lambda ip: getattr(self.devices[ip], name)(*args, **kwargs))
+
+    def render(self, frames : Dict[str, Dict[int, Tuple[int, int, int]]]) -> Dict[str, Any]:
+        """Sets the colours of each device's twin and syncs it"""
+        def draw(ip : str) -> bool:
+            twin = self.twin(ip)
+            twin.set_colors(frames[ip])
+            return twin.sync()
+
+        self.counters['frames'] += len(frames)
+        return self.each(list(frames), draw)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Returns the counters of the worker and the health of its devices"""
+        latencies = [nl.health.latency for nl in self.devices.values()
+            if nl.health.latency is not None]
+        return dict(self.counters, pid=os.getpid(),
+            devices=len(self.devices) + len(self.errors),
+            online=sum(nl.health.online for nl in self.devices.values()),
+            mean_latency=sum(latencies) / len(latencies) if latencies else None)
+
+    def handle(self, message : Tuple[Any, ...]) -> Any:
+        """Carries out a message from the coordinator and returns the reply"""
+        start = time.perf_counter()
+        kind = message[0]
+        if kind == 'command':
+            reply = self.command(*message[1:])
+        elif kind == 'render':
+            reply = self.render(message[1])
+        elif kind == 'run':
+            _, ips, func, args = message
+            reply = self.each(ips, lambda ip: func(self.twin(ip), *args))
+        else:
+            return self.metrics()
+        self.counters['busy_seconds'] += time.perf_counter() - start
+        return reply
+
+
+def _run_worker(connection : Any, devices : List[Device], timeout : Timeout) -> None:
+    """The main loop of a worker process, which replies to each message from
+    the coordinator until it is told to stop"""
+    worker = _FleetWorker(devices, timeout)
+    while True:
+        message = connection.recv()
+        if message[0] == 'stop':
+            break
+        try:
+            reply = worker.handle(message)
+        except Exception as error: # pylint: disable=broad-except
+            reply = _portable(error)
+        connection.send(reply)
+    worker.executor.shutdown()
+    connection.close()
+
+
+class NanoleafFleet():
+    """Class for controlling many devices from a pool of worker processes
+
+    Devices are shared between the workers in turn. Each worker connects to
+    its devices when it starts, and creates a device's digital twin the first
+    time a frame is rendered to it.
+
+    :ivar processes: The number of worker processes
+    :ivar shards: The IPs of the devices owned by each worker
+    """
+
+    def __init__(self, devices : Sequence[Device], processes : int =None,
+        timeout : Timeout =DEFAULT_TIMEOUT) -> None:
+        """Starts the worker processes, which connect to their devices.
+
+        :param devices: List of (IP, auth token) tuples of the devices
+        :param processes: Optional, the number of worker processes, which
+            defaults to the number of CPUs
+        :param timeout: Optional, the timeout of every request, see Nanoleaf
+
+        :raises ValueError: When there are no devices or an IP is repeated.
+        """
+        ips = [ip for ip, _ in devices]
+        if not ips:
+            raise ValueError("A fleet needs at least one device")
+        if len(set(ips)) != len(ips):
+            raise ValueError("Each device can only be in a fleet once")
+        self.processes = min(processes or os.cpu_count() or 1, len(devices))
+        self.shards = [ips[index::self.processes] for index in range(self.processes)]
+        self.__owners = {ip: index for index, shard in enumerate(self.shards) for ip in shard}
+        self.__lock = threading.Lock()
+        self.__broken : Optional[str] = None
+        self.__connections = []
+        self.__workers = []
+        context = multiprocessing.get_context()
+        for index in range(self.processes):
+            connection, child_connection = context.Pipe()
+            worker = context.Process(target=_run_worker, name=f"nanoleaf-fleet-{index}",
+                args=(child_connection, list(devices[index::self.processes]), timeout),
+                daemon=True)
+            worker.start()
+            child_connection.close()
+            self.__connections.append(connection)
+            self.__workers.append(worker)
+
+    def __split(self, ips : Optional[Sequence[str]]) -> Dict[int, List[str]]:
+        """Groups IPs by the worker which owns them, defaulting to every device"""
+        if ips is None:
+            return {index: shard for index, shard in enumerate(self.shards) if shard}
+        shards : Dict[int, List[str]] = {}
+        for ip in ips:
+            if ip not in self.__owners:
+                raise ValueError(f"{ip} is not in the fleet")
+            shards.setdefault(self.__owners[ip], []).append(ip)
+        return shards
+
+    def __exchange(self, messages : Dict[int, Tuple[Any, ...]]) -> List[Any]:
+        """Sends a message to each worker at once, then waits for all replies
+
+        Every worker which was sent a message is read from, even when another
+        has stopped, so no reply is left behind to be mistaken for the reply
+        to a later message. Once a worker has stopped the fleet is broken.
+
+        :raises EOFError: When a worker process has stopped.
+        """
+        with self.__lock:
+            if self.__broken is not None:
+                raise EOFError(self.__broken)
+            sent = []
+            for index, message in messages.items():
+                try:
+                    self.__connections[index].send(message)
+                except OSError:
+                    self.__broken = f"Worker {index} of the fleet has stopped"
+                    continue
+                sent.append(index)
+            replies = []
+            for index in sent:
+                try:
+                    replies.append(self.__connections[index].recv())
+                except (EOFError, OSError):
+                    self.__broken = f"Worker {index} of the fleet has stopped"
+            if self.__broken is not None:
+                raise EOFError(self.__broken)
+        for reply in replies:
+            if isinstance(reply, BaseException):
+                raise reply
+        return replies
+
+    def __gather(self, messages : Dict[int, Tuple[Any, ...]],
+        ips : Sequence[str]) -> Dict[str, Any]:
+        """Exchanges messages and merges the replies in the order of the IPs"""
+        results : Dict[str, Any] = {}
+        for reply in self.__exchange(messages):
+            results.update(reply)
+        return {ip: results[ip] for ip in ips}
+
+    def command(self, name : str, *args : Any, ips : Sequence[str] =None,
+        **kwargs : Any) -> Dict[str, Any]:
+        """Calls a method of the Nanoleaf object of each device, in parallel
+        across all workers, e.g. ``fleet.command('set_brightness', 50)``
+
+        :param name: The name of the Nanoleaf method
+        :param args: The positional arguments of the method
+        :param ips: Optional, the IPs of the devices, which defaults to all devices
+        :param kwargs: The keyword arguments of the method
+
+        :returns: Dictionary of device IPs and the result of the method, or
+            the exception it raised, e.g. NanoleafConnectionError
+        """
+        shards = self.__split(ips)
+        messages = {index: ('command', shard, name, args, kwargs)
+            for index, shard in shards.items()}
+        return self.__gather(messages, [ip for shard in shards.values() for ip in shard])
+
+    def render(self, frames : Dict[str, Dict[int, Tuple[int, int, int]]]) -> Dict[str, Any]:
+        """Sets the colours of several devices' digital twins and syncs them,
+        in parallel across all workers
+
+        :param frames: Dictionary of device IPs and their colours, each a
+            dictionary with panel IDs as keys and RGB tuples as values
+
+        :returns: Dictionary of device IPs and whether the sync succeeded, or
+            the exception it raised
+        """
+        shards = self.__split(list(frames))
+        messages = {index: ('render', {ip: frames[ip] for ip in shard})
+            for index, shard in shards.items()}
+        return self.__gather(messages, list(frames))
+
+    def run(self, func : Callable[..., Any], *args : Any,
+        ips : Sequence[str] =None) -> Dict[str, Any]:
+        """Calls a function with each device's digital twin inside its worker
+
+        Rendering inside the workers spreads the work of calculating frames
+        over all processes, e.g. a function which sets the twin's colours for
+        a point in time and syncs it.
+
+        :param func: A picklable function, called as func(twin, *args)
+        :param args: Further arguments of the function, which must be picklable
+        :param ips: Optional, the IPs of the devices, which defaults to all devices
+
+        :returns: Dictionary of device IPs and the function's return value, or
+            the exception it raised
+        """
+        shards = self.__split(ips)
+        messages = {index: ('run', shard, func, args) for index, shard in shards.items()}
+        return self.__gather(messages, [ip for shard in shards.values() for ip in shard])
+
+    def metrics(self) -> Dict[str, Any]:
+        """Returns the metrics of every worker and their totals
+
+        :returns: Dictionary with 'workers', a list of dictionaries of each
+            worker's pid, number of devices and devices online, commands and
+            frames sent, failures, seconds spent busy and mean request latency,
+            and the totals of devices, online, commands, frames and failures
+        """
+        workers = self.__exchange({index: ('metrics',) for index in range(self.processes)})
+        totals = {key: sum(worker[key] for worker in workers)
+            for key in ('devices', 'online', 'commands', 'frames', 'failures')}
+        return dict(totals, workers=workers)
+
+    def close(self, timeout : float =5) -> None:
+        """Stops the worker processes, terminating any which don't stop in time
+
+        :param timeout: Optional, the number of seconds to wait for each worker"""
+        with self.__lock:
+            for connection, worker in zip(self.__connections, self.__workers):
+                if worker.is_alive():
+                    try:
+                        connection.send(('stop',))
+                    except OSError:
+                        pass
+            for connection, worker in zip(self.__connections, self.__workers):
+                worker.join(timeout)
+                if worker.is_alive():
+                    worker.terminate()
+                connection.close()
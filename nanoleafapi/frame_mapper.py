@@ -0,0 +1,152 @@
+"""NanoleafFrameMapper
+
+This module maps image or video frames onto the panels of a Nanoleaf device,
+ by averaging the pixels underneath each panel. It requires NumPy, which can be
+ installed with ``pip install nanoleafapi[frames]``."""
+
+import time
+from typing import Any, Dict, Iterable, Tuple, Union
+from nanoleafapi.layout import NanoleafLayout
+from nanoleafapi.digital_twin import NanoleafDigitalTwin
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Frame = Union[bytes, bytearray, memoryview, Any]
+
+class NanoleafFrameMapper():
+    """Class for mapping frames of a fixed resolution onto a panel layout
+
+    The pixels sampled for each panel are calculated once, so mapping a frame
+    is a single vectorised gather and sum over all panels.
+
+    :ivar layout: The layout of the panels
+    :ivar width: The width of the frames in pixels
+    :ivar height: The height of the frames in pixels
+    :ivar panel_ids: The IDs of the panels, in the order of the mapped colours
+    """
+
+    def __init__(self, layout : NanoleafLayout, width : int, height : int,
+        sample_size : float =0.8) -> None:
+        """Initialises the mapper and precomputes the pixels sampled by each panel.
+
+        The layout is scaled to fit the frame, keeping its aspect ratio, and
+        each panel samples a disc of pixels around its centre.
+
+        :param layout: The layout of the panels
+        :param width: The width of the frames in pixels
+        :param height: The height of the frames in pixels
+        :param sample_size: Optional, the radius of the sampled disc as a
+            fraction of the panel's inradius"""
+        if np is None:
+            raise ImportError("NanoleafFrameMapper requires NumPy, install it with " +
+                "'pip install nanoleafapi[frames]'")
+        self.layout = layout
+        self.width = width
+        self.height = height
+        self.panel_ids = layout.get_lit_ids()
+
+        indices = []
+        counts = []
+        for row, col, radius in self.__fit_panels(sample_size):
+            flat = self.__sample_pixels(row, col, radius)
+            indices.append(flat)
+            counts.append(flat.size)
+
+        self.__indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.intp)
+        self.__counts = np.array(counts, dtype=np.uint32).reshape(-1, 1)
+        self.__offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+
+    def __fit_panels(self, sample_size : float) -> Iterable[Tuple[float, float, float]]:
+        """Scales the layout to fit the frame, keeping its aspect ratio
+
+        :returns: The row, column and sample radius in pixels of each panel
+        """
+        margin = max((self.layout.inradii[panel_id] for panel_id in self.panel_ids), default=1)
+        x_min, y_min, x_max, y_max = self.layout.get_bounds()
+        x_min, y_min, x_max, y_max = x_min - margin, y_min - margin, x_max + margin, y_max + margin
+        scale = min(self.width / (x_max - x_min), self.height / (y_max - y_min))
+        offset_x = (self.width - (x_max - x_min) * scale) / 2
+        offset_y = (self.height - (y_max - y_min) * scale) / 2
+        for panel_id in self.panel_ids:
+            x, y = self.layout.get_position(panel_id)
+            # Layout coordinates have y pointing up, frames have row 0 at the top
+            yield (offset_y + (y_max - y) * scale, offset_x + (x - x_min) * scale,
+                max(self.layout.inradii[panel_id] * sample_size * scale, 0.5))
+
+    def __sample_pixels(self, row : float, col : float, radius : float) -> Any:
+        """Returns the flat indices of the pixels in a disc, or the nearest pixel"""
+        rows, cols = np.mgrid[int(row - radius):int(row + radius) + 1,
+            int(col - radius):int(col + radius) + 1]
+        inside = (rows - row) ** 2 + (cols - col) ** 2 <= radius ** 2
+        inside &= (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        flat = (rows[inside] * self.width + cols[inside]).astype(np.intp)
+        if flat.size == 0:
+            flat = np.array([min(max(int(row), 0), self.height - 1) * self.width +
+                min(max(int(col), 0), self.width - 1)], dtype=np.intp)
+        return flat
+
+    def map_frame(self, frame : Frame) -> Any:
+        """Returns the colour of each panel for a frame
+
+        :param frame: Either a NumPy array of shape (height, width, 3 or 4),
+            or a raw buffer of height * width packed RGB bytes
+
+        :returns: NumPy array of shape (panels, 3) with the RGB colour of each
+            panel, in the order of panel_ids
+        """
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            pixels = np.frombuffer(frame, dtype=np.uint8).reshape(-1, 3)
+        else:
+            pixels = np.asarray(frame).reshape(self.width * self.height, -1)[:, :3]
+        if pixels.shape[0] != self.width * self.height:
+            raise ValueError(f"Frames must be {self.width}x{self.height} pixels")
+        if not self.panel_ids:
+            return np.zeros((0, 3), dtype=np.uint8)
+        sums = np.add.reduceat(pixels[self.__indices].astype(np.uint32), self.__offsets, axis=0)
+        return (sums // self.__counts).astype(np.uint8)
+
+    def map_frame_dict(self, frame : Frame) -> Dict[int, Tuple[int, int, int]]:
+        """Returns the colour of each panel for a frame as a dictionary
+
+        :param frame: The frame, as accepted by map_frame()
+
+        :returns: Dictionary with panel IDs as keys and RGB tuples as values
+        """
+        colours = self.map_frame(frame).tolist()
+        return {panel_id: tuple(colour) for panel_id, colour in zip(self.panel_ids, colours)}
+
+    def apply(self, frame : Frame, twin : NanoleafDigitalTwin) -> None:
+        """Sets the colours of a digital twin from a frame, without syncing it
+
+        :param frame: The frame, as accepted by map_frame()
+        :param twin: The digital twin to update"""
+        twin.set_colors(self.map_frame_dict(frame))
+
+    def stream(self, frames : Iterable[Frame], twin : NanoleafDigitalTwin,
+        max_fps : float =10) -> int:
+        """Maps a stream of frames onto a digital twin and syncs each one
+
+        Frames which arrive before the previous frame has been displayed for
+        1 / max_fps seconds are dropped without being mapped.
+
+        :param frames: An iterable of frames, e.g. a generator reading a video
+        :param twin: The digital twin to update and sync
+        :param max_fps: Optional, the maximum number of frames synced per second
+
+        :returns: The number of frames synced to the device
+        """
+        min_interval = 1 / max_fps
+        last_sync = -min_interval
+        synced = 0
+        for frame in frames:
+            now = time.monotonic()
+            if now - last_sync < min_interval:
+                continue
+            last_sync = now
+            self.apply(frame, twin)
+            twin.sync()
+            synced += 1
+        return synced
@@ -0,0 +1,120 @@
+"""health
+
+This module tracks the health of a Nanoleaf device. After several attempts
+ at requests in a row fail, including retries, the device is marked offline
+ and further requests fail immediately instead of waiting for timeouts, while
+ a background probe checks the device until it responds again."""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class NanoleafHealth(): # pylint: disable=too-many-instance-attributes
+    """Class for tracking whether a device is responding, with a circuit breaker
+
+    :ivar failure_threshold: The number of failed attempts in a row,
+        including retries, after which the device is marked offline
+    :ivar retries: The number of times an idempotent request is retried
+    :ivar backoff: The base delay between retries in seconds, which doubles
+        for each retry and is jittered
+    :ivar probe_interval: The number of seconds between probes of an offline device
+    :ivar online: False if the device has been marked offline
+    :ivar consecutive_failures: The number of failed attempts since the last success
+    :ivar requests: The total number of attempts, successful or not
+    :ivar failures: The total number of failed attempts
+    :ivar latency: The moving average of the request time in seconds, or None
+    :ivar last_success: The time.time() of the last successful request, or None
+    :ivar last_failure: The time.time() of the last failed request, or None
+    :ivar last_error: The exception of the last failed request, or None
+    """
+
+    def __init__(self, failure_threshold : int =3, retries : int =2, backoff : float =0.2,
+        probe_interval : float =10) -> None:
+        """Initialises the health of a device which is assumed to be online.
+
+        :param failure_threshold: Optional, the number of failed attempts in a
+            row, including retries, after which the device is marked offline
+        :param retries: Optional, the number of times an idempotent request is retried
+        :param backoff: Optional, the base delay between retries in seconds
+        :param probe_interval: Optional, the number of seconds between probes
+            of an offline device"""
+        if failure_threshold < 1:
+            raise ValueError("The failure threshold must be at least 1")
+        self.failure_threshold = failure_threshold
+        self.retries = retries
+        self.backoff = backoff
+        self.probe_interval = probe_interval
+        self.online = True
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency : Optional[float] = None
+        self.last_success : Optional[float] = None
+        self.last_failure : Optional[float] = None
+        self.last_error : Optional[BaseException] = None
+        self.__lock = threading.Lock()
+        self.__probe : Optional[threading.Thread] = None
+
+    def retry_delay(self, attempt : int) -> float:
+        """Returns a random delay before a retry, between zero and the backoff
+        doubled for each previous attempt
+
+        :param attempt: The number of attempts made so far, starting at 0"""
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def record_success(self, latency : float) -> None:
+        """Records a request which reached the device, and marks it online.
+
+        :param latency: The time the request took in seconds"""
+        with self.__lock:
+            self.requests += 1
+            self.consecutive_failures = 0
+            self.online = True
+            self.last_success = time.time()
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def record_failure(self, error : BaseException) -> bool:
+        """Records an attempt at a request which couldn't reach the device
+
+        :param error: The exception raised by the transport
+
+        :returns: True if this failure has just marked the device offline
+        """
+        with self.__lock:
+            self.requests += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = time.time()
+            self.last_error = error
+            if self.online and self.consecutive_failures >= self.failure_threshold:
+                self.online = False
+                return True
+            return False
+
+    def start_probe(self, probe : Callable[[], Any]) -> None:
+        """Starts probing an offline device in a background thread, until the
+        probe succeeds or the device is marked online by another request.
+
+        :param probe: Function which makes a request to the device, raising an
+            exception if it can't be reached"""
+        with self.__lock:
+            if self.__probe is not None and self.__probe.is_alive():
+                return
+            self.__probe = threading.Thread(target=self.__run_probe, args=(probe,),
+                daemon=True)
+            self.__probe.start()
+
+    def __run_probe(self, probe : Callable[[], Any]) -> None:
+        """Calls the probe at jittered intervals while the device is offline"""
+        while not self.online:
+            time.sleep(self.probe_interval * random.uniform(0.5, 1.5))
+            start = time.monotonic()
+            try:
+                probe()
+            except Exception as error: # pylint: disable=broad-except
+                with self.__lock:
+                    self.last_error = error
+                continue
+            self.record_success(time.monotonic() - start)
@@ -0,0 +1,308 @@
+"""NanoleafLayout
+
+This module provides a geometric view of a Nanoleaf device's panel layout,
+ allowing panels to be addressed by their coordinates rather than their IDs."""
+
+import math
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# Number of sides and side length of each panel shape type, from the OpenAPI docs.
+# Shapes with a side length of 0 (controllers, connectors) do not emit light.
+SHAPE_TYPES : Dict[int, Tuple[int, float]] = {
+    0: (3, 150),    # Light Panels triangle
+    1: (0, 0),      # Rhythm module
+    2: (4, 100),    # Canvas square
+    3: (4, 100),    # Canvas control square (master)
+    4: (4, 100),    # Canvas control square (passive)
+    5: (0, 0),      # Power supply
+    7: (6, 67),     # Shapes hexagon
+    8: (3, 134),    # Shapes triangle
+    9: (3, 67),     # Shapes mini triangle
+    12: (0, 0),     # Shapes controller
+    14: (6, 134),   # Elements hexagon
+    15: (6, 33.5),  # Elements hexagon corner
+    16: (0, 0),     # Lines connector
+    17: (2, 154),   # Lines
+    18: (2, 77),    # Lines single zone
+    19: (0, 0),     # Controller cap
+    20: (0, 0),     # Power connector
+}
+
+# Panels are neighbours if their centres are within this factor of touching
+ADJACENCY_TOLERANCE = 1.15
+
+class NanoleafLayout(): # pylint: disable=too-many-instance-attributes
+    """Class for querying the geometry of a panel layout
+
+    :ivar positions: Dictionary of panel IDs and their (x, y) coordinates
+    :ivar shape_types: Dictionary of panel IDs and their shape type
+    :ivar inradii: Dictionary of panel IDs and the distance from their centre
+        to the middle of an edge, 0 for panels which do not emit light
+    """
+
+    def __init__(self, layout : Dict[str, Any]) -> None:
+        """Initialises the layout from a layout dictionary.
+
+        :param layout: The layout dictionary, as returned by
+            Nanoleaf.get_layout()"""
+        self.positions : Dict[int, Tuple[float, float]] = {}
+        self.shape_types : Dict[int, int] = {}
+        self.inradii : Dict[int, float] = {}
+        default_side = layout.get('sideLength', 0)
+        for data in layout.get('positionData', []):
+            panel_id = data['panelId']
+            shape_type = data.get('shapeType', 0)
+            self.positions[panel_id] = (data['x'], data['y'])
+            self.shape_types[panel_id] = shape_type
+            sides, side_length = SHAPE_TYPES.get(shape_type, (4, default_side))
+            self.inradii[panel_id] = self.__inradius(sides, side_length)
+
+        self.__cell_size = max(2 * max(self.inradii.values(), default=0), 1.0)
+        self.__grid : Dict[Tuple[int, int], List[int]] = {}
+        for panel_id in self.get_lit_ids():
+            cell = self.__cell(*self.positions[panel_id])
+            self.__grid.setdefault(cell, []).append(panel_id)
+        cells = list(self.__grid) or [(0, 0)]
+        self.__grid_min = (min(cell[0] for cell in cells), min(cell[1] for cell in cells))
+        self.__grid_max = (max(cell[0] for cell in cells), max(cell[1] for cell in cells))
+        self.__adjacency = self.__build_adjacency()
+        self.__orderings : Dict[Tuple[Any, ...], List[int]] = {}
+
+    @staticmethod
+    def __inradius(sides : int, side_length : float) -> float:
+        """Returns the distance from the centre of a shape to the middle of an edge"""
+        if sides == 0 or side_length == 0:
+            return 0
+        if sides == 2:
+            return side_length / 2
+        return side_length / (2 * math.tan(math.pi / sides))
+
+    def __cell(self, x : float, y : float) -> Tuple[int, int]:
+        """Returns the grid cell containing a point"""
+        return (math.floor(x / self.__cell_size), math.floor(y / self.__cell_size))
+
+    def __cells_in_box(self, x_min : float, y_min : float, x_max : float,
+        y_max : float) -> List[int]:
+        """Returns the IDs of all panels in the grid cells overlapping a box"""
+        cell_min = self.__cell(x_min, y_min)
+        cell_max = self.__cell(x_max, y_max)
+        panel_ids : List[int] = []
+        # Only the cells inside the grid can contain panels
+        for cell_x in range(max(cell_min[0], self.__grid_min[0]),
+                min(cell_max[0], self.__grid_max[0]) + 1):
+            for cell_y in range(max(cell_min[1], self.__grid_min[1]),
+                    min(cell_max[1], self.__grid_max[1]) + 1):
+                panel_ids.extend(self.__grid.get((cell_x, cell_y), ()))
+        return panel_ids
+
+    def __distance(self, panel_id : int, x : float, y : float) -> float:
+        """Returns the distance from the centre of a panel to a point"""
+        panel_x, panel_y = self.positions[panel_id]
+        return math.hypot(panel_x - x, panel_y - y)
+
+    def __build_adjacency(self) -> Dict[int, List[int]]:
+        """Finds the neighbouring panels of every panel which emits light"""
+        lit_ids = self.get_lit_ids()
+        adjacency : Dict[int, List[int]] = {panel_id: [] for panel_id in lit_ids}
+        for panel_id in lit_ids:
+            x, y = self.positions[panel_id]
+            reach = (self.inradii[panel_id] + self.__cell_size / 2) * ADJACENCY_TOLERANCE
+            for other_id in self.__cells_in_box(x - reach, y - reach, x + reach, y + reach):
+                if other_id == panel_id:
+                    continue
+                touching = (self.inradii[panel_id] + self.inradii[other_id]) * ADJACENCY_TOLERANCE
+                if self.__distance(other_id, x, y) <= touching:
+                    adjacency[panel_id].append(other_id)
+        return adjacency
+
+    def get_ids(self) -> List[int]:
+        """Returns a list of the IDs of all panels in the layout"""
+        return list(self.positions)
+
+    def get_lit_ids(self) -> List[int]:
+        """Returns a list of the IDs of all panels which emit light"""
+        return [panel_id for panel_id, inradius in self.inradii.items() if inradius > 0]
+
+    def get_position(self, panel_id : int) -> Tuple[float, float]:
+        """Returns the (x, y) coordinates of the centre of a panel
+
+        :param panel_id: The ID of the panel"""
+        return self.positions[panel_id]
+
+    def get_bounds(self) -> Tuple[float, float, float, float]:
+        """Returns the bounding box of the panel centres as (x_min, y_min, x_max, y_max)"""
+        lit_ids = self.get_lit_ids()
+        xs = [self.positions[panel_id][0] for panel_id in lit_ids]
+        ys = [self.positions[panel_id][1] for panel_id in lit_ids]
+        if not xs:
+            return (0, 0, 0, 0)
+        return (min(xs), min(ys), max(xs), max(ys))
+
+    def get_centre(self) -> Tuple[float, float]:
+        """Returns the centre of the bounding box of the panels"""
+        x_min, y_min, x_max, y_max = self.get_bounds()
+        return ((x_min + x_max) / 2, (y_min + y_max) / 2)
+
+    #######################################################
+    ####                  QUERIES                      ####
+    #######################################################
+
+    def nearest(self, x : float, y : float) -> Optional[int]:
+        """Returns the ID of the panel nearest to a point
+
+        :param x: The x coordinate
+        :param y: The y coordinate
+
+        :returns: The ID of the nearest panel, or None if there are no panels
+        """
+        if not self.__grid:
+            return None
+        centre_x, centre_y = self.__cell(x, y)
+        if not (self.__grid_min[0] <= centre_x <= self.__grid_max[0] and
+                self.__grid_min[1] <= centre_y <= self.__grid_max[1]):
+            # Rings outside the grid are empty, so checking every panel is quicker
+            return min(self.__adjacency,
+                key=lambda panel_id: (self.__distance(panel_id, x, y), panel_id))
+        best_id = None
+        best_distance = math.inf
+        ring = 0
+        seen = 0
+        # Search rings of cells outwards until no closer panel can exist
+        while seen < len(self.__adjacency) and (ring - 1) * self.__cell_size < best_distance:
+            for cell in self.__ring_cells(centre_x, centre_y, ring):
+                panel_ids = self.__grid.get(cell, ())
+                seen += len(panel_ids)
+                for panel_id in panel_ids:
+                    distance = self.__distance(panel_id, x, y)
+                    if distance < best_distance:
+                        best_id, best_distance = panel_id, distance
+            ring += 1
+        return best_id
+
+    @staticmethod
+    def __ring_cells(centre_x : int, centre_y : int, ring : int) -> List[Tuple[int, int]]:
+        """Returns the cells on the edge of the square of cells ring cells out from a cell"""
+        if ring == 0:
+            return [(centre_x, centre_y)]
+        cells = []
+        for offset in range(-ring, ring + 1):
+            cells.append((centre_x + offset, centre_y - ring))
+            cells.append((centre_x + offset, centre_y + ring))
+        for offset in range(-ring + 1, ring):
+            cells.append((centre_x - ring, centre_y + offset))
+            cells.append((centre_x + ring, centre_y + offset))
+        return cells
+
+    def within_radius(self, x : float, y : float, radius : float) -> List[int]:
+        """Returns the IDs of all panels whose centre is within a radius of a point
+
+        :param x: The x coordinate
+        :param y: The y coordinate
+        :param radius: The radius around the point
+
+        :returns: List of panel IDs, nearest first
+        """
+        candidates = self.__cells_in_box(x - radius, y - radius, x + radius, y + radius)
+        found = [(self.__distance(panel_id, x, y), panel_id) for panel_id in candidates]
+        return [panel_id for distance, panel_id in sorted(found) if distance <= radius]
+
+    def within_box(self, x_min : float, y_min : float, x_max : float,
+        y_max : float) -> List[int]:
+        """Returns the IDs of all panels whose centre is inside a bounding box
+
+        :param x_min: The left edge of the box
+        :param y_min: The bottom edge of the box
+        :param x_max: The right edge of the box
+        :param y_max: The top edge of the box
+
+        :returns: List of panel IDs
+        """
+        found = []
+        for panel_id in self.__cells_in_box(x_min, y_min, x_max, y_max):
+            x, y = self.positions[panel_id]
+            if x_min <= x <= x_max and y_min <= y <= y_max:
+                found.append(panel_id)
+        return found
+
+    def neighbours(self, panel_id : int) -> List[int]:
+        """Returns the IDs of the panels sharing an edge with a panel
+
+        :param panel_id: The ID of the panel"""
+        return list(self.__adjacency.get(panel_id, ()))
+
+    #######################################################
+    ####                 ORDERINGS                     ####
+    #######################################################
+
+    def sweep(self, angle : float =0) -> List[int]:
+        """Returns the panels ordered along a direction
+
+        :param angle: The direction of the sweep in degrees, 0 for left to
+            right, 90 for bottom to top
+
+        :returns: List of panel IDs
+        """
+        if angle != 0:
+            # Only the default ordering is cached, as any angle can be given
+            return self.__sweep(angle)
+        if ('sweep',) not in self.__orderings:
+            self.__orderings[('sweep',)] = self.__sweep(0)
+        return list(self.__orderings[('sweep',)])
+
+    def __sweep(self, angle : float) -> List[int]:
+        """Returns the panels sorted along a direction"""
+        dx = math.cos(math.radians(angle))
+        dy = math.sin(math.radians(angle))
+        return sorted(self.get_lit_ids(), key=lambda panel_id: (self.positions[panel_id][0] * dx +
+            self.positions[panel_id][1] * dy, panel_id))
+
+    def radial(self, x : float =None, y : float =None) -> List[int]:
+        """Returns the panels ordered by their distance from a point
+
+        :param x: Optional, the x coordinate, defaults to the layout centre
+        :param y: Optional, the y coordinate, defaults to the layout centre
+
+        :returns: List of panel IDs, nearest first
+        """
+        if x is not None and y is not None:
+            # Only the ordering from the centre is cached, as any point can be given
+            return self.__radial(x, y)
+        if ('radial',) not in self.__orderings:
+            self.__orderings[('radial',)] = self.__radial(*self.get_centre())
+        return list(self.__orderings[('radial',)])
+
+    def __radial(self, x : float, y : float) -> List[int]:
+        """Returns the panels sorted by their distance from a point"""
+        return sorted(self.get_lit_ids(),
+            key=lambda panel_id: (self.__distance(panel_id, x, y), panel_id))
+
+    def rings(self, panel_id : int =None) -> List[List[int]]:
+        """Returns the panels grouped into rings of neighbours around a panel
+
+        The first ring contains only the starting panel, the second its
+        neighbours, the third their neighbours and so on. Panels which aren't
+        connected to the starting panel are not included.
+
+        :param panel_id: Optional, the starting panel, defaults to the panel
+            nearest the layout centre
+
+        :returns: List of rings, each a list of panel IDs
+        """
+        if panel_id is None:
+            panel_id = self.nearest(*self.get_centre())
+            if panel_id is None:
+                return []
+        depths = {panel_id: 0}
+        queue = deque([panel_id])
+        rings : List[List[int]] = [[panel_id]]
+        while queue:
+            current = queue.popleft()
+            for neighbour in self.__adjacency.get(current, ()):
+                if neighbour not in depths:
+                    depths[neighbour] = depths[current] + 1
+                    if depths[neighbour] == len(rings):
+                        rings.append([])
+                    rings[depths[neighbour]].append(neighbour)
+                    queue.append(neighbour)
+        return rings
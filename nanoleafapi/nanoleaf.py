@@ -7,10 +7,17 @@ It supports the Light Panels (previously Aurora), Canvas and Shapes (including H
 import json
 from threading import Thread
 import colorsys
+import hashlib
 import os
+import time
+from collections import OrderedDict
 from typing import Any, List, Dict, Tuple, Union, Callable, Optional
-from sseclient import SSEClient
-import requests
+from nanoleafapi.codec import DEFAULT_LOADS, JSONLoads
+from nanoleafapi.effects_catalogue import NanoleafEffectsCatalogue
+from nanoleafapi.event_history import NanoleafEventHistory
+from nanoleafapi.health import NanoleafHealth
+from nanoleafapi.transport import (NanoleafTransport, NanoleafResponse, HTTPClientTransport,
+    Timeout, TRANSPORT_ERRORS)
 
 # Preset colours
 RED = (255, 0, 0)
@@ -23,29 +30,75 @@ PINK = (255, 192, 203)
 PURPLE = (128, 0, 128)
 WHITE = (255, 255, 255)
 
-class Nanoleaf():
+# Default (connect, read) timeouts of every request in seconds
+DEFAULT_TIMEOUT = (5, 10)
+
+# The number of compiled effects kept on the device before the oldest is deleted
+MAX_CACHED_EFFECTS = 16
+
+# The start of the names of compiled effects stored on the device
+EFFECT_PREFIX = "nanoleafapi-"
+
+class Nanoleaf(): # pylint: disable=too-many-instance-attributes
     """The Nanoleaf class for controlling the Light Panels and Canvas
 
     :ivar ip: IP of the Nanoleaf device
     :ivar url: The base URL for requests
     :ivar auth_token: The authentication token for the API
     :ivar print_errors: True for errors to be shown, otherwise False
+    :ivar transport: The transport used to send requests to the device
+    :ivar timeout: The timeout of every request, in seconds or as a
+        (connect timeout, read timeout) tuple
+    :ivar health: The health of the device, which tracks failed requests and
+        marks the device offline
+    :ivar json_loads: The function which decodes JSON responses from bytes
+    :ivar effect_cache: Ordered dictionary of the names of compiled effects
+        stored on the device and their keys, least recently used first. The
+        key is None for effects stored by an earlier run.
+    :ivar effect_cache_size: The number of compiled effects kept on the
+        device, after which the least recently used is deleted
+    :ivar effects_catalogue: The local catalogue of effects, or None if it
+        has not been fetched yet
+    :ivar event_history: The history which registered events are recorded
+        in, or None
     """
 
-    def __init__(self, ip : str, auth_token : str =None, print_errors : bool =False):
+    def __init__(self, ip : str, # pylint: disable=too-many-arguments,too-many-positional-arguments
+        auth_token : str =None, print_errors : bool =False,
+        transport : NanoleafTransport =None, timeout : Timeout =DEFAULT_TIMEOUT,
+        health : NanoleafHealth =None, json_loads : JSONLoads =None):
         """Initalises Nanoleaf class with desired arguments.
 
         :param ip: The IP address of the Nanoleaf device
         :param auth_token: Optional, include Nanoleaf authentication
             token here if required.
         :param print_errors: Optional, True to show errors in the console
+        :param transport: Optional, the transport used to send requests,
+            which defaults to HTTPClientTransport
+        :param timeout: Optional, the timeout of every request, in seconds or
+            as a (connect timeout, read timeout) tuple
+        :param health: Optional, the health tracker of the device, to change
+            its retries, backoff or circuit breaker settings
+        :param json_loads: Optional, the function which decodes JSON responses
+            from bytes, which defaults to orjson.loads if orjson is installed,
+            otherwise json.loads
 
         :type ip: str
         :type auth_token: str
         :type print_errors: bool
+        :type transport: NanoleafTransport
+        :type timeout: float or tuple
+        :type health: NanoleafHealth
+        :type json_loads: function
+
+        :raises NanoleafConnectionError: When the device can't be reached.
         """
         self.ip = ip
         self.print_errors = print_errors
+        self.transport = transport or HTTPClientTransport()
+        self.timeout = timeout
+        self.health = health or NanoleafHealth()
+        self.json_loads = json_loads or DEFAULT_LOADS
         self.url = "http://" + ip + ":16021/api/v1/" + str(auth_token)
         self.check_connection()
         if auth_token is None:
@@ -56,6 +109,13 @@ class Nanoleaf():
             self.auth_token = auth_token
         self.url = "http://" + ip + ":16021/api/v1/" + str(self.auth_token)
         self.already_registered = False
+        self.effect_cache : 'OrderedDict[str, Optional[Tuple[Any, ...]]]' = OrderedDict()
+        self.effect_cache_size = MAX_CACHED_EFFECTS
+        self.__effect_cache_loaded = False
+        self.__compiled_ids : Optional[List[int]] = None
+        self.effects_catalogue : Optional[NanoleafEffectsCatalogue] = None
+        self.effect_events = False
+        self.event_history : Optional[NanoleafEventHistory] = None
 
 
     def __error_check(self, code : int) -> bool:
@@ -87,6 +147,53 @@ class Nanoleaf():
             return False
         return bool(code in (200, 204))
 
+    def __request(self, method : str, url : str, data : str =None,
+        idempotent : bool =None, retries : int =None) -> NanoleafResponse:
+        """Sends a request through the transport, tracking the device's health
+
+        Idempotent requests are retried with a jittered backoff, and requests
+        to a device marked offline fail straight away. Every failed attempt,
+        including retries, counts towards marking the device offline, so no
+        more retries are made once it is.
+
+        :param method: The HTTP method
+        :param url: The full URL of the request
+        :param data: Optional, the body of the request
+        :param idempotent: Optional, whether the request can safely be sent
+            twice, which defaults to True for GET and PUT requests
+        :param retries: Optional, the number of retries of an idempotent
+            request, which defaults to the retries of the device's health
+
+        :raises NanoleafOfflineError: When the device has been marked offline.
+        :raises NanoleafConnectionError: When the device can't be reached.
+
+        :returns: The response
+        """
+        if not self.health.online:
+            raise NanoleafOfflineError(self.ip)
+        if idempotent is None:
+            idempotent = method in ('GET', 'PUT')
+        if not idempotent:
+            retries = 0
+        elif retries is None:
+            retries = self.health.retries
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = self.transport.request(method, url, data, self.timeout)
+            except TRANSPORT_ERRORS as error:
+                if self.health.record_failure(error):
+                    self.health.start_probe(lambda: self.transport.request('GET',
+                        "http://" + self.ip + ":16021/api/v1/", timeout=self.timeout))
+                if attempt < retries and self.health.online:
+                    time.sleep(self.health.retry_delay(attempt))
+                    attempt += 1
+                    continue
+                raise NanoleafConnectionError() from error
+            self.health.record_success(time.monotonic() - start)
+            return response
+
     def create_auth_token(self) -> Union[str, None]:
         """Creates or retrives the device authentication token
 
@@ -106,15 +213,16 @@ class Nanoleaf():
         for token in tokens:
             if token != "":
                 token = token.rstrip()
-                response = requests.get("http://" + self.ip + ":16021/api/v1/" + str(token))
+                response = self.__request('GET',
+                    "http://" + self.ip + ":16021/api/v1/" + str(token))
                 if self.__error_check(response.status_code):
                     return token
 
-        response = requests.post('http://' + self.ip + ':16021/api/v1/new')
+        response = self.__request('POST', 'http://' + self.ip + ':16021/api/v1/new')
 
         # process response
         if response and response.status_code == 200:
-            data = json.loads(response.text)
+            data = self.json_loads(response.content)
 
             if 'auth_token' in data:
                 with open(file_path, 'a', encoding='utf-8') as file:
@@ -136,20 +244,31 @@ class Nanoleaf():
         :returns: True if successful, otherwise False
         """
         url = "http://" + self.ip + ":16021/api/v1/" + str(auth_token)
-        response = requests.delete(url)
+        response = self.__request('DELETE', url)
         return self.__error_check(response.status_code)
 
     def check_connection(self) -> None:
-        """Ensures there is a valid connection"""
+        """Ensures there is a valid connection, with a single request"""
         try:
-            requests.get(self.url, timeout=5)
+            self.__request('GET', self.url, retries=0)
+        except NanoleafOfflineError:
+            raise
         except Exception as connection_error:
             raise NanoleafConnectionError() from connection_error
 
+    def __get_json(self, path : str) -> Any:
+        """Reads an endpoint and decodes its JSON response
+
+        :param path: The path of the endpoint after the auth token, e.g. /state/on
+
+        :returns: The decoded response
+        """
+        response = self.__request('GET', self.url + path)
+        return self.json_loads(response.content)
+
     def get_info(self) -> Dict[str, Any]:
         """Returns a dictionary of device information"""
-        response = requests.get(self.url)
-        return json.loads(response.text)
+        return self.__get_json("")
 
     def get_name(self) -> str:
         """Returns the name of the current device"""
@@ -161,19 +280,8 @@ class Nanoleaf():
 
     def get_ids(self) -> List[int]:
         """Returns a list of all device ids"""
-        position_data = []
-        device_ids = []
-        info_data = self.get_info()
-
-        if ('panelLayout' in info_data and 'layout' in info_data['panelLayout'] and
-                'positionData' in info_data['panelLayout']['layout']):
-            position_data = info_data['panelLayout']['layout']['positionData']
-
-        # process position data
-        for data in position_data:
-            device_ids.append(data['panelId'])
-
-        return device_ids
+        layout = self.get_layout()
+        return [data['panelId'] for data in layout.get('positionData', [])]
 
     @staticmethod
     def get_custom_base_effect(anim_type : str ='custom', loop : bool =True) -> Dict[str, Any]:
@@ -197,7 +305,7 @@ class Nanoleaf():
         :returns: True if successful, otherwise False
         """
         data = {"on" : {"value": False}}
-        response = requests.put(self.url + "/state", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data))
         return self.__error_check(response.status_code)
 
     def power_on(self) -> bool:
@@ -206,7 +314,7 @@ class Nanoleaf():
         :returns: True if successful, otherwise False
         """
         data = {"on" : {"value": True}}
-        response = requests.put(self.url + "/state", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data))
         return self.__error_check(response.status_code)
 
     def get_power(self) -> bool:
@@ -214,9 +322,7 @@ class Nanoleaf():
 
         :returns: True if on, False if off
         """
-        response = requests.get(self.url + "/state/on")
-        ans = json.loads(response.text)
-        return ans['value']
+        return self.__get_json("/state/on")['value']
 
     def toggle_power(self) -> bool:
         """Toggles the lights on/off"""
@@ -224,6 +330,17 @@ class Nanoleaf():
             return self.power_off()
         return self.power_on()
 
+    def set_state(self, state : Dict[str, Any]) -> bool:
+        """Sets several state values in a single request
+
+        :param state: The state dictionary, e.g.
+            {"on": {"value": True}, "brightness": {"value": 50, "duration": 0}}
+
+        :returns: True if successful, otherwise False
+        """
+        response = self.__request('PUT', self.url + "/state", json.dumps(state))
+        return self.__error_check(response.status_code)
+
     #######################################################
     ####                   COLOUR                      ####
     #######################################################
@@ -246,7 +363,7 @@ class Nanoleaf():
                     "sat": {"value": final_colour[1]},
                     "brightness": {"value": final_colour[2], "duration": 0}
                 }
-        response = requests.put(self.url + "/state", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data))
         return self.__error_check(response.status_code)
 
 
@@ -265,7 +382,7 @@ class Nanoleaf():
         if brightness > 100 or brightness < 0:
             raise ValueError('Brightness should be between 0 and 100')
         data = {"brightness" : {"value": brightness, "duration": duration}}
-        response = requests.put(self.url + "/state", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data))
         return self.__error_check(response.status_code)
 
     def increment_brightness(self, brightness : int) -> bool:
@@ -277,14 +394,13 @@ class Nanoleaf():
         :returns: True if successful, otherwise False
         """
         data = {"brightness" : {"increment": brightness}}
-        response = requests.put(self.url + "/state", data = json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data),
+            idempotent=False)
         return self.__error_check(response.status_code)
 
     def get_brightness(self) -> int:
         """Returns the current brightness value of the lights"""
-        response = requests.get(self.url + "/state/brightness")
-        ans = json.loads(response.text)
-        return ans['value']
+        return self.__get_json("/state/brightness")['value']
 
     #######################################################
     ####                  IDENTIFY                     ####
@@ -295,7 +411,7 @@ class Nanoleaf():
 
         :returns: True if successful, otherwise False
         """
-        response = requests.put(self.url + "/identify")
+        response = self.__request('PUT', self.url + "/identify")
         return self.__error_check(response.status_code)
 
     #######################################################
@@ -312,7 +428,7 @@ class Nanoleaf():
         if value > 360 or value < 0:
             raise ValueError('Hue should be between 0 and 360')
         data = {"hue" : {"value" : value}}
-        response = requests.put(self.url + "/state", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data))
         return self.__error_check(response.status_code)
 
     def increment_hue(self, value : int) -> bool:
@@ -323,14 +439,13 @@ class Nanoleaf():
         :returns: True if successful, otherwise False
         """
         data = {"hue" : {"increment" : value}}
-        response = requests.put(self.url + "/state", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data),
+            idempotent=False)
         return self.__error_check(response.status_code)
 
     def get_hue(self) -> int:
         """Returns the current hue value of the lights"""
-        response = requests.get(self.url + "/state/hue")
-        ans = json.loads(response.text)
-        return ans['value']
+        return self.__get_json("/state/hue")['value']
 
     #######################################################
     ####                 SATURATION                    ####
@@ -346,7 +461,7 @@ class Nanoleaf():
         if value > 100 or value < 0:
             raise ValueError('Saturation should be between 0 and 100')
         data = {"sat" : {"value" : value}}
-        response = requests.put(self.url + "/state", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data))
         return self.__error_check(response.status_code)
 
     def increment_saturation(self, value : int) -> bool:
@@ -358,14 +473,13 @@ class Nanoleaf():
         :returns: True if successful, otherwise False
         """
         data = {"sat" : {"increment" : value}}
-        response = requests.put(self.url + "/state", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data),
+            idempotent=False)
         return self.__error_check(response.status_code)
 
     def get_saturation(self) -> int:
         """Returns the current saturation value of the lights"""
-        response = requests.get(self.url + "/state/sat")
-        ans = json.loads(response.text)
-        return ans['value']
+        return self.__get_json("/state/sat")['value']
 
     #######################################################
     ####              COLOUR TEMPERATURE               ####
@@ -381,7 +495,7 @@ class Nanoleaf():
         if value > 6500 or value < 1200:
             raise ValueError('Colour temp should be between 1200 and 6500')
         data = {"ct" : {"value" : value}}
-        response = requests.put(self.url + "/state", json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data))
         return self.__error_check(response.status_code)
 
     def increment_color_temp(self, value : int) -> bool:
@@ -393,14 +507,13 @@ class Nanoleaf():
         :returns: True if successful, otherwise False
         """
         data = {"ct" : {"increment" : value}}
-        response = requests.put(self.url + "/state", json.dumps(data))
+        response = self.__request('PUT', self.url + "/state", json.dumps(data),
+            idempotent=False)
         return self.__error_check(response.status_code)
 
     def get_color_temp(self) -> int:
         """Returns the current colour temperature of the lights"""
-        response = requests.get(self.url + "/state/ct")
-        ans = json.loads(response.text)
-        return ans['value']
+        return self.__get_json("/state/ct")['value']
 
     #######################################################
     ####                 COLOUR MODE                   ####
@@ -408,8 +521,7 @@ class Nanoleaf():
 
     def get_color_mode(self) -> str:
         """Returns the colour mode of the lights"""
-        response = requests.get(self.url + "/state/colorMode")
-        return json.loads(response.text)
+        return self.__get_json("/state/colorMode")
 
     #######################################################
     ####                   EFFECTS                     ####
@@ -423,8 +535,7 @@ class Nanoleaf():
 
         :returns: Name of the effect or type if unavailable.
         """
-        response = requests.get(self.url + "/effects/select")
-        return json.loads(response.text)
+        return self.__get_json("/effects/select")
 
     def set_effect(self, effect_name : str) -> bool:
         """Sets the effect of the lights
@@ -434,13 +545,77 @@ class Nanoleaf():
         :returns: True if successful, otherwise False
         """
         data = {"select": effect_name}
-        response = requests.put(self.url + "/effects", data=json.dumps(data))
-        return self.__error_check(response.status_code)
+        response = self.__request('PUT', self.url + "/effects", json.dumps(data))
+        success = self.__error_check(response.status_code)
+        if success and self.effects_catalogue is not None:
+            self.effects_catalogue.current_effect = effect_name
+        return success
 
     def list_effects(self) -> List[str]:
-        """Returns a list of available effects"""
-        response = requests.get(self.url + "/effects/effectsList")
-        return json.loads(response.text)
+        """Returns a list of available effects
+
+        The effects are read from the local effects catalogue, which is
+        fetched from the device on first use.
+        """
+        return self.get_effects_catalogue().names()
+
+    def get_effects_catalogue(self, refresh : bool =False) -> NanoleafEffectsCatalogue:
+        """Returns the local catalogue of effects stored on the device
+
+        All effect definitions are fetched with a single requestAll command the
+        first time this is called. The catalogue is kept up to date with
+        changes made through this object and, if registered for, effects
+        events (type 3).
+
+        :param refresh: True to fetch the effects from the device again
+
+        :returns: The effects catalogue
+        """
+        if self.effects_catalogue is None or refresh:
+            data = self.__request_effects({"command": "requestAll"})
+            animations = data.get('animations', []) if data else []
+            if self.effects_catalogue is None:
+                self.effects_catalogue = NanoleafEffectsCatalogue(animations)
+            else:
+                self.effects_catalogue.load(animations)
+        return self.effects_catalogue
+
+    def get_effect(self, effect_name : str) -> Optional[Dict[str, Any]]:
+        """Returns the effect dictionary of a stored effect
+
+        :param effect_name: Name of the effect
+
+        :returns: The effect dictionary, or None if the effect doesn't exist
+        """
+        return self.get_effects_catalogue().get(effect_name)
+
+    def get_dynamic_effect(self) -> Optional[Dict[str, Any]]:
+        """Returns the effect dictionary of the effect being displayed when it
+        isn't stored on the device, i.e. when the current effect is *Dynamic*
+
+        :returns: The effect dictionary, or None if unavailable
+        """
+        return self.__request_effects({"command": "request", "animName": "*Dynamic*"})
+
+    def __request_effects(self, command : Dict[str, Any]) -> Any:
+        """Sends a write command which returns effect data
+
+        :param command: The write command dictionary, e.g. requestAll
+
+        :returns: The decoded response, or None if unsuccessful
+        """
+        response = self.__request('PUT', self.url + "/effects",
+            json.dumps({"write": command}))
+        if response.status_code != 200:
+            return None
+        return self.json_loads(response.content)
+
+    def __current_effect(self) -> str:
+        """Returns the current effect, without a request if kept up to date by events"""
+        if (self.effect_events and self.effects_catalogue is not None and
+                self.effects_catalogue.current_effect is not None):
+            return self.effects_catalogue.current_effect
+        return self.get_current_effect()
 
     def write_effect(self, effect_dict : Dict['str', Any]) -> bool:
         """Writes a user-defined effect to the panels
@@ -452,10 +627,22 @@ class Nanoleaf():
 
         :returns: True if successful, otherwise False
         """
-        response = requests.put(self.url + "/effects", data=json.dumps({"write": effect_dict}))
+        response = self.__request('PUT', self.url + "/effects",
+            json.dumps({"write": effect_dict}))
         if response.status_code == 400:
             raise NanoleafEffectCreationError("Invalid effect dictionary")
-        return self.__error_check(response.status_code)
+        success = self.__error_check(response.status_code)
+        if success and self.effects_catalogue is not None:
+            command = effect_dict.get('command')
+            if command == 'add':
+                effect = dict(effect_dict)
+                del effect['command']
+                self.effects_catalogue.add(effect)
+            elif command == 'delete':
+                self.effects_catalogue.remove(effect_dict.get('animName'))
+            elif command == 'display':
+                self.effects_catalogue.current_effect = None
+        return success
 
     def effect_exists(self, effect_name : str) -> bool:
         """Verifies whether an effect exists
@@ -464,10 +651,7 @@ class Nanoleaf():
 
         :returns: True if effect exists, otherwise False
         """
-        response = requests.get(self.url + "/effects/effectsList")
-        if effect_name in json.loads(response.text):
-            return True
-        return False
+        return effect_name in self.get_effects_catalogue()
 
     def pulsate(self, rgb : Tuple[int, int, int], speed : float = 1) -> bool:
         """Displays a pulsating effect on the device with two colours
@@ -490,8 +674,13 @@ class Nanoleaf():
             if colour < 0 or colour > 255:
                 raise NanoleafEffectCreationError("All values in the tuple must be  " +
                     "integers between 0 and 255! E.g., (255, 0, 0)")
-        base_effect = self.get_custom_base_effect()
-        ids = self.get_ids()
+        return self.__display_compiled(('pulsate', tuple(rgb), speed),
+            lambda ids: self.__pulsate_anim_data(ids, rgb, speed))
+
+    @staticmethod
+    def __pulsate_anim_data(ids : List[int], rgb : Tuple[int, int, int],
+        speed : float) -> str:
+        """Generates the animData string for the pulsate effect"""
         anim_data = str(len(ids))
         frame_string = ""
         for device_id in ids:
@@ -500,8 +689,7 @@ class Nanoleaf():
             speed = int(speed*10)
             speed_2 = int(speed*10)
             frame_string += f" {r} {g} {b} 0 {speed} 0 0 0 0 {speed_2}"
-        base_effect['animData'] = anim_data + frame_string
-        return self.write_effect(base_effect)
+        return anim_data + frame_string
 
     def flow(self, rgb_list : List[Tuple[int, int, int]], speed : float = 1) -> bool:
         """Displays a sequence of specified colours on the device.
@@ -528,8 +716,14 @@ class Nanoleaf():
                 if colour < 0 or colour > 255:
                     raise NanoleafEffectCreationError("All values in the tuple must " +
                         "be integers between 0 and 255! E.g., (255, 0, 0)")
-        base_effect = self.get_custom_base_effect()
-        ids = self.get_ids()
+        rgb_key = tuple(tuple(rgb) for rgb in rgb_list)
+        return self.__display_compiled(('flow', rgb_key, speed),
+            lambda ids: self.__flow_anim_data(ids, rgb_list, speed))
+
+    @staticmethod
+    def __flow_anim_data(ids : List[int], rgb_list : List[Tuple[int, int, int]],
+        speed : float) -> str:
+        """Generates the animData string for a flow between the given colours"""
         anim_data = str(len(ids))
         frame_string = ""
         for device_id in ids:
@@ -539,8 +733,7 @@ class Nanoleaf():
                 r, g, b = rgb[0], rgb[1], rgb[2]
                 speed = int(speed*10)
                 frame_string += f" {r} {g} {b} 0 {speed}"
-        base_effect['animData'] = anim_data + frame_string
-        return self.write_effect(base_effect)
+        return anim_data + frame_string
 
     def spectrum(self, speed : float = 1) -> bool:
         """Displays a spectrum cycling effect on the device
@@ -551,24 +744,100 @@ class Nanoleaf():
         :returns: True if the effect was created and displayed successfully,
             otherwise False
         """
-        base_effect = self.get_custom_base_effect()
-        ids = self.get_ids()
         spectrum_palette = []
         for hue in range(0, 360, 10):
             (r, g, b) = colorsys.hsv_to_rgb(hue/360, 1.0, 1.0)
             spectrum_palette.append((int(255*r), int(255*g), int(255*b)))
-        anim_data = str(len(ids))
-        frame_string = ""
-        for device_id in ids:
-            number_frames = len(spectrum_palette)
-            frame_string += f" {device_id} {number_frames}"
-            for rgb in spectrum_palette:
-                r, g, b = rgb[0], rgb[1], rgb[2]
-                speed = int(speed*10)
-                frame_string += f" {r} {g} {b} 0 {speed}"
-        base_effect['animData'] = anim_data + frame_string
+        return self.__display_compiled(('spectrum', speed),
+            lambda ids: self.__flow_anim_data(ids, spectrum_palette, speed))
+
+    def __display_compiled(self, key : Tuple[Any, ...],
+        compile_anim_data : Callable[[List[int]], str]) -> bool:
+        """Displays a compiled custom effect, storing it on the device
+
+        Compiled effects are named after the layout of the device and the
+        parameters of the effect. The first time an effect is displayed it
+        is added to the device as a named effect, after which it is simply
+        selected, or left alone if it is already the current effect. Once
+        more than effect_cache_size effects are stored, including those left
+        by earlier runs, the least recently used is deleted from the device.
+
+        The panel IDs are only read once, and again after a layout event.
+
+        :param key: Tuple of the effect type and its parameters
+        :param compile_anim_data: Function to generate the animData string
+            for a list of panel IDs
+
+        :returns: True if the effect was displayed successfully, otherwise False
+        """
+        if self.__compiled_ids is None:
+            self.__compiled_ids = self.get_ids()
+        ids = self.__compiled_ids
+        cache_key = (tuple(ids),) + key
+        effect_name = EFFECT_PREFIX + hashlib.sha1(repr(cache_key).encode()).hexdigest()[:12]
+        self.__load_effect_cache()
+        if effect_name in self.effect_cache:
+            self.effect_cache[effect_name] = cache_key
+            self.effect_cache.move_to_end(effect_name)
+            if self.__current_effect() == effect_name:
+                return True
+            if self.set_effect(effect_name):
+                return True
+            # The stored effect was removed from the device, so recompile it
+            del self.effect_cache[effect_name]
+
+        base_effect = self.get_custom_base_effect()
+        base_effect['animData'] = compile_anim_data(ids)
+        stored_effect = dict(base_effect, command='add', animName=effect_name)
+        try:
+            if self.write_effect(stored_effect):
+                self.effect_cache[effect_name] = cache_key
+                while len(self.effect_cache) > max(self.effect_cache_size, 1):
+                    self.__delete_effect(self.effect_cache.popitem(last=False)[0])
+                if self.set_effect(effect_name):
+                    return True
+        except NanoleafEffectCreationError:
+            pass
         return self.write_effect(base_effect)
 
+    def __load_effect_cache(self) -> None:
+        """Adds the compiled effects left on the device by earlier runs to the
+        cache, as the least recently used, the first time it is used"""
+        if self.__effect_cache_loaded:
+            return
+        for effect_name in self.list_effects():
+            if effect_name.startswith(EFFECT_PREFIX) and effect_name not in self.effect_cache:
+                self.effect_cache[effect_name] = None
+                self.effect_cache.move_to_end(effect_name, last=False)
+        self.__effect_cache_loaded = True
+
+    def __delete_effect(self, effect_name : str) -> bool:
+        """Deletes a stored effect from the device
+
+        :returns: True if the effect was deleted, otherwise False
+        """
+        try:
+            return self.write_effect({"command": "delete", "animName": effect_name})
+        except NanoleafEffectCreationError:
+            return False
+
+    def clear_effect_cache(self) -> bool:
+        """Deletes all compiled effects from the device, including those left
+        by earlier runs, so they are regenerated on next use.
+
+        :returns: True if every effect was deleted, otherwise False
+        """
+        effect_names = list(self.effect_cache)
+        effect_names += [effect_name for effect_name in self.list_effects()
+            if effect_name.startswith(EFFECT_PREFIX) and effect_name not in self.effect_cache]
+        self.effect_cache.clear()
+        self.__effect_cache_loaded = True
+        self.__compiled_ids = None
+        success = True
+        for effect_name in effect_names:
+            success = self.__delete_effect(effect_name) and success
+        return success
+
     def enable_extcontrol(self) -> bool:
         """Enables the extControl UDP streaming mode
 
@@ -577,7 +846,7 @@ class Nanoleaf():
         data = {"write": {"command":  "display",
                         "animType": "extControl",
                         "extControlVersion": "v2"}}
-        response = requests.put(self.url + "/effects", data=json.dumps(data))
+        response = self.__request('PUT', self.url + "/effects", json.dumps(data))
         return self.__error_check(response.status_code)
 
     #######################################################
@@ -586,15 +855,14 @@ class Nanoleaf():
 
     def get_layout(self) -> Dict[str, Any]:
         """Returns the device layout information"""
-        response = requests.get(self.url + "/panelLayout/layout")
-        return json.loads(response.text)
+        return self.__get_json("/panelLayout/layout")
 
     #######################################################
     ####                  EVENTS                       ####
     #######################################################
 
-    def register_event(self, func : Callable[[Dict[str, Any]], Any],
-        event_types : List[int]) -> None:
+    def register_event(self, func : Optional[Callable[[Dict[str, Any]], Any]],
+        event_types : List[int], history : NanoleafEventHistory =None) -> None:
         """Starts a thread to register and listen for events
 
         Creates an event listener. This method can only be called once per
@@ -609,6 +877,9 @@ class Nanoleaf():
             2 = layout,
             3 = effects,
             4 = touch (Canvas only)
+        :param history: Optional, the event history to record the events in,
+            which is kept in event_history. func can be None if only the
+            history is needed.
         """
 
         if self.already_registered:
@@ -621,20 +892,35 @@ class Nanoleaf():
             if event < 1 or event > 4:
                 raise Exception("Valid event types must be between 1-4")
         self.already_registered = True
+        self.effect_events = 3 in event_types
+        if history is not None:
+            self.event_history = history
         thread = Thread(target=self.__event_listener, args=(func, set(event_types)))
         thread.daemon = True
         thread.start()
 
-    def __event_listener(self, func : Callable[[Dict[str, Any]], Any],
+    def __event_listener(self, func : Optional[Callable[[Dict[str, Any]], Any]],
         event_types : List[int]) -> None:
         """Listens for events and passes event data to the user-defined
         function."""
         url = self.url + "/events?id="
         for event in event_types:
             url += str(event) + ","
-        client = SSEClient(url[:-1])
-        for event in client:
-            func(json.loads(str(event)))
+        for event_id, data in self.transport.events(url[:-1]):
+            event_data = json.loads(data)
+            if event_id == "2":
+                # Compiled effects are made for the new layout from now on
+                self.__compiled_ids = None
+            if event_id == "3" and self.effects_catalogue is not None:
+                for effect_name in self.effects_catalogue.handle_event(event_data):
+                    effect = self.__request_effects({"command": "request",
+                        "animName": effect_name})
+                    if effect:
+                        self.effects_catalogue.add(effect)
+            if self.event_history is not None:
+                self.event_history.record(int(event_id), event_data)
+            if func is not None:
+                func(event_data)
 
 
 #######################################################
@@ -649,14 +935,34 @@ class NanoleafRegistrationError(Exception):
             button on your Nanoleaf device for 5-7 seconds and try again."""
         super().__init__(message)
 
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # Rebuilt without the message, which __init__ doesn't take
+        return (type(self), ())
+
 
 class NanoleafConnectionError(Exception):
     """Raised when the connection to the Nanoleaf device fails."""
 
-    def __init__(self) -> None:
-        message = "Connection to Nanoleaf device failed. Is this the correct IP?"
+    def __init__(self, message : str ="Connection to Nanoleaf device failed. " +
+        "Is this the correct IP?") -> None:
         super().__init__(message)
 
 
+class NanoleafOfflineError(NanoleafConnectionError):
+    """Raised instead of sending a request to a device which is marked offline.
+
+    :ivar ip: The IP of the device
+    """
+
+    def __init__(self, ip : str) -> None:
+        self.ip = ip
+        super().__init__(f"The Nanoleaf device at {ip} is offline, waiting for " +
+            "it to respond again.")
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # Rebuilt from the IP rather than the message, e.g. by fleet workers
+        return (type(self), (self.ip,))
+
+
 class NanoleafEffectCreationError(Exception):
     """Raised when one of the custom effects creation has incorrect arguments."""
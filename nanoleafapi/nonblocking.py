@@ -0,0 +1,100 @@
+"""nonblocking
+
+This module provides a non-blocking version of the Nanoleaf API. Every
+ command returns a future straight away, and is run on a worker thread
+ belonging to the device, so commands for one device are carried out in the
+ order they were submitted while different devices run in parallel.
+
+Example usage::
+
+    devices = [NanoleafNonBlocking(Nanoleaf(ip)) for ip in ips]
+    futures = [device.set_color(RED) for device in devices]
+    results = wait_all(futures)
+"""
+
+import concurrent.futures
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List
+from nanoleafapi.nanoleaf import Nanoleaf
+
+
+class NanoleafNonBlocking():
+    """Class for sending commands to a Nanoleaf device without waiting
+
+    Any public method of the Nanoleaf object can be called on this object
+    with the same arguments, e.g. ``device.set_brightness(50)``, but returns
+    a concurrent.futures.Future of the result instead of the result itself.
+
+    :ivar nanoleaf: The Nanoleaf object the commands are sent with
+    """
+
+    def __init__(self, nanoleaf : Nanoleaf) -> None:
+        """Initialises the device's worker thread.
+
+        :param nanoleaf: The Nanoleaf object of the device"""
+        self.nanoleaf = nanoleaf
+        self.__worker = ThreadPoolExecutor(max_workers=1,
+            thread_name_prefix="nanoleaf-" + nanoleaf.ip)
+
+    def submit(self, func : Callable[..., Any], *args : Any, **kwargs : Any) -> 'Future[Any]':
+        """Queues any callable on the device's worker, e.g. a digital twin's sync()
+
+        :param func: The function to call
+        :param args: The positional arguments of the function
+        :param kwargs: The keyword arguments of the function
+
+        :returns: A future of the function's return value
+        """
+        return self.__worker.submit(func, *args, **kwargs)
+
+    def __getattr__(self, name : str) -> Callable[..., 'Future[Any]']:
+        method = None if name.startswith('_') else getattr(self.nanoleaf, name, None)
+        if not callable(method):
+            raise AttributeError(f"'{type(self).__name__}' object has no command '{name}'")
+
+        def command(*args : Any, **kwargs : Any) -> 'Future[Any]':
+            return self.__worker.submit(method, *args, **kwargs)
+        command.__name__ = name
+        command.__doc__ = method.__doc__
+        return command
+
+    def close(self, wait : bool =True) -> None:
+        """Stops the worker thread once the queued commands have finished
+
+        :param wait: Optional, False to return without waiting for the queued
+            commands
+        """
+        self.__worker.shutdown(wait=wait)
+
+
+def wait_all(futures : Iterable['Future[Any]'], timeout : float =None) -> List[Any]:
+    """Waits for all futures to finish and returns their results
+
+    :param futures: The futures returned by commands
+    :param timeout: Optional, the maximum number of seconds to wait
+
+    :raises concurrent.futures.TimeoutError: When the futures don't finish in time.
+    :raises Exception: The exception raised by the first failed command, in
+        the order the futures were given.
+
+    :returns: List of the results, in the same order as the futures
+    """
+    futures = list(futures)
+    _, not_done = concurrent.futures.wait(futures, timeout)
+    if not_done:
+        raise concurrent.futures.TimeoutError(f"{len(not_done)} commands did not finish")
+    return [future.result() for future in futures]
+
+
+def as_completed(futures : Iterable['Future[Any]'],
+    timeout : float =None) -> Iterator['Future[Any]']:
+    """Yields futures as they finish, whichever device they belong to
+
+    :param futures: The futures returned by commands
+    :param timeout: Optional, the maximum number of seconds to wait in total
+
+    :raises concurrent.futures.TimeoutError: When the futures don't finish in time.
+
+    :returns: Iterator of the finished futures
+    """
+    return concurrent.futures.as_completed(list(futures), timeout)
@@ -0,0 +1,305 @@
+"""recorder
+
+This module records the traffic of a Nanoleaf object into a compact binary
+ log, and replays it with the same timing against a device, an emulator or a
+ digital twin, to reproduce and benchmark real workloads.
+
+The log starts with the 6 byte header ``b"NLRC"`` and a little-endian uint16
+ version, followed by records which are only ever appended. Each record is a
+ 21 byte little-endian header of::
+
+    uint8   kind        1 for a command, 2 for an event, 3 for a failed command
+    float64 timestamp   time.time() when the command was sent or event received
+    float32 duration    seconds until the response arrived or the command
+                        failed, 0 for events
+    uint16  status      HTTP status code, 0 for events and failed commands
+    uint16  name size   size of the name in bytes
+    uint32  body size   size of the body in bytes
+
+followed by the UTF-8 name and the body. The name of a command is its method
+ and endpoint, e.g. ``"PUT /state"``, with the host and authentication token
+ removed. Pairing and deleting tokens keep their path from the API root,
+ ``"POST /api/v1/new"`` and ``"DELETE /api/v1/<token>"``, and are never
+ replayed. The name of an event is its type. The body is the request body
+ of a command, the event data of an event, or for a failed command a JSON
+ object of the ``"error"`` raised by the transport and the request ``"body"``."""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, NamedTuple, Optional, Tuple, Union
+from urllib.parse import urlsplit
+from nanoleafapi.transport import (Body, NanoleafResponse, NanoleafTransport, Timeout,
+    TRANSPORT_ERRORS)
+from nanoleafapi.nanoleaf import Nanoleaf
+from nanoleafapi.anim_data import parse_anim_data
+from nanoleafapi.digital_twin import NanoleafDigitalTwin
+
+MAGIC = b"NLRC"
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sH')
+RECORD_HEADER = struct.Struct('<BdfHHI')
+
+COMMAND = 1
+EVENT = 2
+FAILED = 3
+
+# Commands which change the authentication of the device, which aren't replayed
+AUTH_COMMANDS = {"POST /api/v1/new", "DELETE /api/v1/<token>"}
+
+
+class LogRecord(NamedTuple):
+    """A command or event read from a log"""
+    kind : int
+    timestamp : float
+    duration : float
+    status : int
+    name : str
+    body : bytes
+
+    @property
+    def error(self) -> Optional[str]:
+        """The error raised by the transport for a failed command, otherwise None"""
+        if self.kind != FAILED:
+            return None
+        return json.loads(self.body)['error']
+
+    @property
+    def request_body(self) -> Optional[str]:
+        """The body of the request of a command or failed command, or None"""
+        if self.kind == FAILED:
+            return json.loads(self.body)['body']
+        return self.body.decode('utf-8') if self.body else None
+
+
+def _command_name(method : str, url : str) -> str:
+    """Returns the method and the path of a request URL after the API version
+    and auth token, or from the API root for pairing and deleting tokens"""
+    parts = urlsplit(url)
+    segments = parts.path.split('/')
+    # The path is /api/v1/<auth token>/<endpoint>
+    if segments[3:4] == ['new']:
+        return method + " /api/v1/new"
+    if method == 'DELETE' and not any(segments[4:]):
+        return method + " /api/v1/<token>"
+    path = '/' + '/'.join(segments[4:]) if len(segments) > 4 else '/'
+    return method + " " + path + ('?' + parts.query if parts.query else '')
+
+
+class RecordingTransport(NanoleafTransport):
+    """Transport which records every request and event sent through another
+    transport into a log file
+
+    :ivar transport: The transport which sends the requests
+    :ivar path: The path of the log file
+    """
+
+    def __init__(self, transport : NanoleafTransport, path : str) -> None:
+        """Opens the log for appending, writing its header if it is new.
+
+        :param transport: The transport to record, e.g. HTTPClientTransport()
+        :param path: The path of the log file"""
+        self.transport = transport
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__log : BinaryIO = open(path, 'ab') # pylint: disable=consider-using-with
+        if self.__log.tell() == 0:
+            self.__log.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.__log.flush()
+
+    def record(self, kind : int, # pylint: disable=too-many-arguments,too-many-positional-arguments
+        timestamp : float, duration : float, status : int, name : str,
+        body : Body) -> None:
+        """Appends a record to the log
+
+        :param kind: COMMAND, EVENT or FAILED
+        :param timestamp: The time.time() of the command or event
+        :param duration: The number of seconds the command took
+        :param status: The HTTP status code of the command
+        :param name: The method and endpoint of a command, or the event type
+        :param body: The body of the command, the data of the event, or the
+            error and body of a failed command
+        """
+        encoded_name = name.encode('utf-8')
+        encoded_body = body.encode('utf-8') if isinstance(body, str) else (body or b"")
+        with self.__lock:
+            self.__log.write(RECORD_HEADER.pack(kind, timestamp, duration, status,
+                len(encoded_name), len(encoded_body)) + encoded_name + encoded_body)
+            self.__log.flush()
+
+    def request(self, method : str, url : str, data : Body =None,
+        timeout : Timeout =None) -> NanoleafResponse:
+        timestamp = time.time()
+        start = time.monotonic()
+        name = _command_name(method, url)
+        try:
+            response = self.transport.request(method, url, data, timeout)
+        except TRANSPORT_ERRORS as error:
+            body = data.decode('utf-8') if isinstance(data, bytes) else data
+            self.record(FAILED, timestamp, time.monotonic() - start, 0, name,
+                json.dumps({"error": f"{type(error).__name__}: {error}", "body": body}))
+            raise
+        self.record(COMMAND, timestamp, time.monotonic() - start, response.status_code,
+            name, data)
+        return response
+
+    def events(self, url : str) -> Iterator[Tuple[str, str]]:
+        for event_id, data in self.transport.events(url):
+            self.record(EVENT, time.time(), 0, 0, event_id, data)
+            yield event_id, data
+
+    def close(self) -> None:
+        self.transport.close()
+        with self.__lock:
+            self.__log.close()
+
+
+class NanoleafReplayer():
+    """Class for reading a log and replaying it with its original timing
+
+    The log is memory-mapped, so large logs are read without copying them
+    into memory first.
+
+    :ivar path: The path of the log file
+    """
+
+    def __init__(self, path : str) -> None:
+        """Memory-maps a log file.
+
+        :param path: The path of the log file
+
+        :raises ValueError: When the file isn't a log.
+        """
+        self.path = path
+        with open(path, 'rb') as log:
+            # An empty file can't be memory-mapped
+            if os.fstat(log.fileno()).st_size < FILE_HEADER.size:
+                raise ValueError(f"{path} is not a nanoleafapi log")
+            self.__map = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self.__map)
+        if magic != MAGIC:
+            self.__map.close()
+            raise ValueError(f"{path} is not a nanoleafapi log")
+        if version != VERSION:
+            self.__map.close()
+            raise ValueError(f"Unsupported log version {version}")
+
+    def records(self) -> Iterator[LogRecord]:
+        """Yields the records in the log, stopping at an incomplete final record
+
+        :returns: Iterator of LogRecord tuples
+        """
+        offset = FILE_HEADER.size
+        size = len(self.__map)
+        while offset + RECORD_HEADER.size <= size:
+            kind, timestamp, duration, status, name_size, body_size = \
+                RECORD_HEADER.unpack_from(self.__map, offset)
+            offset += RECORD_HEADER.size
+            if offset + name_size + body_size > size:
+                return
+            name = self.__map[offset:offset + name_size].decode('utf-8')
+            offset += name_size
+            body = self.__map[offset:offset + body_size]
+            offset += body_size
+            yield LogRecord(kind, timestamp, duration, status, name, body)
+
+    def replay(self, target : Union[Nanoleaf, NanoleafDigitalTwin, None] =None,
+        speed : Optional[float] =1, on_event : Callable[[Dict[str, Any]], Any] =None
+        ) -> Dict[str, float]:
+        """Replays the log with its original timing
+
+        Commands are sent to a Nanoleaf object, which can point at a real
+        device or an emulator, or applied to a digital twin, which sets the
+        panel colours of each custom effect and syncs them. Commands which
+        failed when recorded, e.g. timeouts and their retries, are sent to a
+        Nanoleaf object again but not applied to a digital twin. Pairing and
+        deleting tokens are skipped, so the target's own token is never
+        changed. Events are passed to on_event, like functions registered
+        with Nanoleaf.register_event().
+
+        :param target: Optional, the Nanoleaf object or digital twin to send
+            the commands to, or None to only replay events
+        :param speed: Optional, how many times faster than recorded to replay,
+            or None to replay as fast as possible
+        :param on_event: Optional, function called with each event as a dictionary
+
+        :raises NanoleafEffectCreationError: When a custom effect replayed to a
+            digital twin has malformed animData.
+
+        :returns: Dictionary of the number of commands and events, the number
+            of recorded failures, skipped commands and commands which failed
+            to send, the recorded and elapsed seconds, the mean and max
+            command latency in seconds, and the furthest replay fell behind
+            the recorded timing in seconds
+        """
+        stats = {'commands': 0, 'events': 0, 'failed': 0, 'skipped': 0, 'errors': 0,
+            'recorded_seconds': 0.0,
+            'elapsed_seconds': 0.0, 'mean_latency': 0.0, 'max_latency': 0.0, 'max_lag': 0.0}
+        first : Optional[float] = None
+        start = time.monotonic()
+        total_latency = 0.0
+        for record in self.records():
+            if first is None:
+                first = record.timestamp
+            offset = record.timestamp - first
+            stats['recorded_seconds'] = offset
+            if speed:
+                lag = time.monotonic() - start - offset / speed
+                if lag < 0:
+                    time.sleep(-lag)
+                stats['max_lag'] = max(stats['max_lag'], lag)
+            if record.kind == EVENT:
+                stats['events'] += 1
+                if on_event is not None:
+                    on_event(json.loads(record.body))
+                continue
+            if record.kind == FAILED:
+                stats['failed'] += 1
+            if record.name in AUTH_COMMANDS:
+                stats['skipped'] += 1
+            elif record.kind in (COMMAND, FAILED) and target is not None:
+                sent = time.monotonic()
+                try:
+                    self.__send(target, record)
+                except TRANSPORT_ERRORS:
+                    stats['errors'] += 1
+                latency = time.monotonic() - sent
+                stats['commands'] += 1
+                total_latency += latency
+                stats['max_latency'] = max(stats['max_latency'], latency)
+        stats['elapsed_seconds'] = time.monotonic() - start
+        if stats['commands']:
+            stats['mean_latency'] = total_latency / stats['commands']
+        return stats
+
+    @staticmethod
+    def __send(target : Union[Nanoleaf, NanoleafDigitalTwin], record : LogRecord) -> None:
+        """Sends a recorded command to a device, or applies it to a digital twin"""
+        method, endpoint = record.name.split(' ', 1)
+        body = record.request_body
+        if isinstance(target, NanoleafDigitalTwin):
+            if record.kind == FAILED:
+                return
+            if method == 'PUT' and endpoint == '/effects' and body is not None:
+                anim_data = json.loads(body).get('write', {}).get('animData')
+                if anim_data:
+                    target.set_colors(_first_frame(anim_data, target))
+                    target.sync()
+            return
+        target.transport.request(method, target.url + endpoint.rstrip('/'), body, target.timeout)
+
+    def close(self) -> None:
+        """Unmaps the log."""
+        self.__map.close()
+
+
+def _first_frame(anim_data : str, twin : NanoleafDigitalTwin) -> Dict[int, Tuple[int, int, int]]:
+    """Returns the colours of the first frame of each of the twin's panels in animData
+
+    :raises NanoleafEffectCreationError: When the animData is malformed.
+    """
+    return {panel_id: frames[0][:3] for panel_id, frames in parse_anim_data(anim_data).items()
+        if frames and panel_id in twin.tile_dict}
@@ -0,0 +1,196 @@
+"""scenes
+
+This module captures and restores scenes, the complete look of several
+ Nanoleaf devices: their power, brightness, colour or colour temperature and
+ the effect being displayed, including custom animData effects.
+
+Each device is read with a single request (two if it is displaying an
+ unsaved custom effect), and all devices are read and written in parallel.
+ Restoring a device only writes what differs from the scene, which is at
+ most one effect write and one merged state write, and devices which
+ already match are skipped entirely."""
+
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+from nanoleafapi.nanoleaf import Nanoleaf, NanoleafConnectionError, NanoleafEffectCreationError
+
+# Results of restoring a scene to a device
+UNCHANGED = 'unchanged'
+RESTORED = 'restored'
+FAILED = 'failed'
+MISSING = 'missing'
+
+# Errors of one device which shouldn't stop the rest of the scene
+DEVICE_ERRORS = (NanoleafConnectionError, NanoleafEffectCreationError)
+
+# Effects which can't be restored, as they aren't defined by the device
+UNRESTORABLE_EFFECTS = {'*ExtControl*', '*Static*', '*Solid*'}
+
+Result = TypeVar('Result')
+
+
+def _parallel(devices : List[Nanoleaf], func : Callable[[Nanoleaf], Result]) -> List[Result]:
+    """Calls a function for each device concurrently, returning the results in order"""
+    if not devices:
+        return []
+    with ThreadPoolExecutor(max_workers=len(devices),
+            thread_name_prefix="nanoleaf-scene") as executor:
+        return list(executor.map(func, devices))
+
+
+def read_state(nl : Nanoleaf) -> Dict[str, Any]:
+    """Reads the state of a device which makes up its part of a scene
+
+    :param nl: The Nanoleaf object of the device
+
+    :returns: The state dictionary, with the keys on, brightness, hue, sat,
+        ct, colorMode, effect and, for unsaved custom effects, animation
+    """
+    info = nl.get_info()
+    state = {key: value['value'] if isinstance(value, dict) else value
+        for key, value in info['state'].items()}
+    state['effect'] = info.get('effects', {}).get('select')
+    if state['colorMode'] == 'effect' and state['effect'] == '*Dynamic*':
+        state['animation'] = nl.get_dynamic_effect()
+    return state
+
+
+def _effect_write(current : Dict[str, Any], target : Dict[str, Any]) -> Any:
+    """Returns the effect name or dictionary to display, or None if it matches"""
+    if target['colorMode'] != 'effect' or target['effect'] in UNRESTORABLE_EFFECTS:
+        return None
+    if target['effect'] == '*Dynamic*':
+        if target.get('animation') and current.get('animation') != target['animation']:
+            return dict(target['animation'], command='display')
+        return None
+    if current['colorMode'] != 'effect' or current['effect'] != target['effect']:
+        return target['effect']
+    return None
+
+
+def state_writes(current : Dict[str, Any],
+    target : Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the writes needed to change a device from one state to another
+
+    :param current: The current state of the device, from read_state()
+    :param target: The state of the device in the scene
+
+    :returns: Dictionary with an optional effect, the effect name or effect
+        dictionary to display, and an optional state, the body of a single
+        /state request. It is empty if the device already matches.
+    """
+    writes : Dict[str, Any] = {}
+    if not target['on']:
+        if current['on']:
+            writes['state'] = {'on': {'value': False}}
+        return writes
+    effect = _effect_write(current, target)
+    if effect is not None:
+        writes['effect'] = effect
+    state : Dict[str, Any] = {}
+    mode = target['colorMode']
+    keys = {'hs': ('hue', 'sat'), 'ct': ('ct',)}.get(mode, ())
+    for key in keys:
+        if current['colorMode'] != mode or current[key] != target[key]:
+            state[key] = {'value': target[key]}
+    if current['brightness'] != target['brightness']:
+        state['brightness'] = {'value': target['brightness'], 'duration': 0}
+    if not current['on']:
+        state['on'] = {'value': True}
+    if state:
+        writes['state'] = state
+    return writes
+
+
+class NanoleafScene():
+    """Class for capturing, saving and restoring the state of several devices
+
+    :ivar states: Dictionary of device IPs and their states, as returned by
+        read_state()
+    """
+
+    def __init__(self, states : Dict[str, Dict[str, Any]] =None) -> None:
+        """Initialises the scene.
+
+        :param states: Optional, dictionary of device IPs and their states"""
+        self.states = states or {}
+
+    @classmethod
+    def capture(cls, devices : List[Nanoleaf]) -> 'NanoleafScene':
+        """Captures the current state of several devices in parallel
+
+        Devices which can't be reached are left out of the scene.
+
+        :param devices: List of the Nanoleaf objects of the devices
+
+        :returns: The scene
+        """
+        def capture_device(nl : Nanoleaf) -> Optional[Dict[str, Any]]:
+            try:
+                return read_state(nl)
+            except DEVICE_ERRORS:
+                return None
+
+        states = _parallel(devices, capture_device)
+        return cls({nl.ip: state for nl, state in zip(devices, states) if state is not None})
+
+    def restore(self, devices : List[Nanoleaf]) -> Dict[str, str]:
+        """Restores the scene to several devices in parallel
+
+        Each device is read first, then only the differences are written.
+        Devices which are turned off in the scene are only turned off. A
+        device which can't be reached or rejects the effect is FAILED without
+        affecting the others.
+
+        :param devices: List of the Nanoleaf objects of the devices
+
+        :returns: Dictionary of device IPs and the result, which is one of
+            UNCHANGED, RESTORED, FAILED, or MISSING if the device isn't in
+            the scene
+        """
+        def restore_device(nl : Nanoleaf) -> str:
+            if nl.ip not in self.states:
+                return MISSING
+            try:
+                writes = state_writes(read_state(nl), self.states[nl.ip])
+                if not writes:
+                    return UNCHANGED
+                success = True
+                if isinstance(writes.get('effect'), dict):
+                    success = nl.write_effect(writes['effect'])
+                elif 'effect' in writes:
+                    success = nl.set_effect(writes['effect'])
+                if success and 'state' in writes:
+                    success = nl.set_state(writes['state'])
+            except DEVICE_ERRORS:
+                return FAILED
+            return RESTORED if success else FAILED
+
+        return dict(zip((nl.ip for nl in devices), _parallel(devices, restore_device)))
+
+    def save(self, path : str) -> None:
+        """Saves the scene to a file as compact JSON, compressed with gzip if
+        the path ends with .gz
+
+        :param path: The path of the file"""
+        data = json.dumps(self.states, separators=(',', ':')).encode('utf-8')
+        if path.endswith('.gz'):
+            data = gzip.compress(data)
+        with open(path, 'wb') as scene_file:
+            scene_file.write(data)
+
+    @classmethod
+    def load(cls, path : str) -> 'NanoleafScene':
+        """Loads a scene saved with save()
+
+        :param path: The path of the file
+
+        :returns: The scene
+        """
+        with open(path, 'rb') as scene_file:
+            data = scene_file.read()
+        if path.endswith('.gz'):
+            data = gzip.decompress(data)
+        return cls(json.loads(data))
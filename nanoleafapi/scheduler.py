@@ -0,0 +1,260 @@
+"""scheduler
+
+This module runs timed commands, such as sunrise fades, effect rotations and
+ off timers, for any number of devices. The timers are kept in a heap and a
+ single dispatcher thread sleeps until the next one is due, however many
+ timers exist, then hands the command to a bounded pool of worker threads so
+ a slow or unreachable device doesn't delay the other timers.
+
+A run is missed when the dispatcher gets to it more than the grace period
+ late, e.g. after the computer has been asleep, or when a recurring job is
+ still running from its previous time. What happens then is set for each job:
+
+- CATCH_UP_ONCE, the default, runs the job once for all of its missed runs
+- CATCH_UP_ALL runs the job once for every missed run
+- CATCH_UP_NONE skips the missed runs and waits for the next time
+
+Example usage::
+
+    scheduler = NanoleafScheduler()
+    scheduler.at(datetime(2024, 1, 1, 7, 30), nl.set_effect, "Sunrise")
+    scheduler.every(600, nl.set_effect, "Forest", start=time.time() + 300)
+    off_timer = scheduler.after(3600, nl.power_off)
+    off_timer.cancel()
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+CATCH_UP_ONCE = 'once'
+CATCH_UP_ALL = 'all'
+CATCH_UP_NONE = 'none'
+
+# The longest the dispatcher sleeps, so changes to the system clock are noticed
+MAX_WAIT = 60
+
+
+class ScheduledJob(): # pylint: disable=too-many-instance-attributes
+    """A command scheduled with NanoleafScheduler
+
+    :ivar func: The function called when the job runs
+    :ivar args: The positional arguments of the function
+    :ivar kwargs: The keyword arguments of the function
+    :ivar next_run: The time.time() the job is next due, or None if it won't
+        run again
+    :ivar interval: The number of seconds between runs, or None if it runs once
+    :ivar catch_up: What happens to missed runs, CATCH_UP_ONCE, CATCH_UP_ALL
+        or CATCH_UP_NONE
+    :ivar runs: The number of times the job has finished
+    :ivar missed: The number of runs which were skipped
+    :ivar last_result: The return value of the last run
+    :ivar last_error: The exception raised by the last run, or None
+    :ivar cancelled: True if the job has been cancelled
+    """
+
+    def __init__(self, func : Callable[..., Any], # pylint: disable=too-many-arguments,too-many-positional-arguments
+        args : Tuple[Any, ...],
+        kwargs : Dict[str, Any], next_run : float, interval : Optional[float],
+        catch_up : str) -> None:
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.next_run : Optional[float] = next_run
+        self.interval = interval
+        self.catch_up = catch_up
+        self.runs = 0
+        self.missed = 0
+        self.last_result : Any = None
+        self.last_error : Optional[BaseException] = None
+        self.cancelled = False
+        self.future : Optional['Future[Any]'] = None
+        self.__lock = threading.Lock()
+
+    def cancel(self) -> bool:
+        """Stops the job from running again, without stopping a run in progress
+
+        :returns: True if the job was still scheduled, otherwise False
+        """
+        scheduled = not self.cancelled and self.next_run is not None
+        self.cancelled = True
+        self.next_run = None
+        return scheduled
+
+    def run(self) -> Any:
+        """Calls the function, recording its result or exception"""
+        try:
+            result = self.func(*self.args, **self.kwargs)
+            error = None
+        except Exception as exception: # pylint: disable=broad-except
+            result, error = None, exception
+        with self.__lock:
+            self.last_result = result
+            self.last_error = error
+            self.runs += 1
+        return result
+
+
+class NanoleafScheduler():
+    """Class for running timed and recurring commands from one dispatcher thread
+
+    :ivar grace: The number of seconds a run can be late before it is missed
+    """
+
+    def __init__(self, max_workers : int =4, grace : float =1) -> None:
+        """Starts the dispatcher thread.
+
+        :param max_workers: Optional, the number of threads running commands
+        :param grace: Optional, the number of seconds a run can be late
+            before it counts as missed"""
+        self.grace = grace
+        self.__heap : List[Tuple[float, int, ScheduledJob]] = []
+        self.__counter = itertools.count()
+        self.__condition = threading.Condition()
+        self.__stopped = False
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers,
+            thread_name_prefix="nanoleaf-scheduler")
+        self.__dispatcher = threading.Thread(target=self.__dispatch_loop,
+            name="nanoleaf-scheduler", daemon=True)
+        self.__dispatcher.start()
+
+    def __add(self, when : Union[float, datetime], # pylint: disable=too-many-arguments,too-many-positional-arguments
+        interval : Optional[float],
+        catch_up : str, func : Callable[..., Any], args : Tuple[Any, ...],
+        kwargs : Dict[str, Any]) -> ScheduledJob:
+        """Creates a job and wakes the dispatcher if it is now the first due"""
+        if catch_up not in (CATCH_UP_ONCE, CATCH_UP_ALL, CATCH_UP_NONE):
+            raise ValueError("catch_up must be CATCH_UP_ONCE, CATCH_UP_ALL or CATCH_UP_NONE")
+        if interval is not None and interval <= 0:
+            raise ValueError("The interval must be greater than 0")
+        if isinstance(when, datetime):
+            when = when.timestamp()
+        job = ScheduledJob(func, args, kwargs, when, interval, catch_up)
+        with self.__condition:
+            if self.__stopped:
+                raise RuntimeError("The scheduler has been shut down")
+            self.__push(job)
+            self.__condition.notify()
+        return job
+
+    def __push(self, job : ScheduledJob) -> None:
+        """Adds a job to the heap at its next run, holding the condition's lock"""
+        heapq.heappush(self.__heap, (job.next_run, next(self.__counter), job))
+
+    def at(self, when : Union[float, datetime], func : Callable[..., Any], *args : Any,
+        catch_up : str =CATCH_UP_ONCE, **kwargs : Any) -> ScheduledJob:
+        """Runs a command once at a time, e.g. ``scheduler.at(sunrise, nl.power_on)``
+
+        :param when: The time.time() or datetime to run the command at
+        :param func: The function to call, e.g. a method of a Nanoleaf object
+        :param args: The positional arguments of the function
+        :param catch_up: Optional, CATCH_UP_NONE to skip the command if it is missed
+        :param kwargs: The keyword arguments of the function
+
+        :returns: The job, which can be cancelled
+        """
+        return self.__add(when, None, catch_up, func, args, kwargs)
+
+    def after(self, delay : float, func : Callable[..., Any], *args : Any,
+        catch_up : str =CATCH_UP_ONCE, **kwargs : Any) -> ScheduledJob:
+        """Runs a command once after a delay, e.g. an off timer
+
+        :param delay: The number of seconds to wait
+        :param func: The function to call
+        :param args: The positional arguments of the function
+        :param catch_up: Optional, CATCH_UP_NONE to skip the command if it is missed
+        :param kwargs: The keyword arguments of the function
+
+        :returns: The job, which can be cancelled
+        """
+        return self.__add(time.time() + delay, None, catch_up, func, args, kwargs)
+
+    def every(self, interval : float, func : Callable[..., Any], *args : Any,
+        start : Union[float, datetime] =None, catch_up : str =CATCH_UP_ONCE,
+        **kwargs : Any) -> ScheduledJob:
+        """Runs a command repeatedly, e.g. to rotate effects
+
+        The runs stay on the times start + n * interval, however late some of
+        them are.
+
+        :param interval: The number of seconds between runs
+        :param func: The function to call
+        :param args: The positional arguments of the function
+        :param start: Optional, the time.time() or datetime of the first run,
+            which defaults to one interval from now
+        :param catch_up: Optional, what happens to missed runs
+        :param kwargs: The keyword arguments of the function
+
+        :raises ValueError: When the interval isn't positive.
+
+        :returns: The job, which can be cancelled
+        """
+        if start is None:
+            start = time.time() + interval
+        return self.__add(start, interval, catch_up, func, args, kwargs)
+
+    def jobs(self) -> List[ScheduledJob]:
+        """Returns the scheduled jobs, in the order they are next due"""
+        with self.__condition:
+            return [job for due, _, job in sorted(self.__heap)
+                if not job.cancelled and job.next_run == due]
+
+    def __dispatch_loop(self) -> None:
+        """Waits for each job to be due and dispatches it, until shut down"""
+        with self.__condition:
+            while not self.__stopped:
+                # Cancelled and rescheduled jobs are left in the heap until they reach the top
+                while self.__heap and (self.__heap[0][2].cancelled or
+                        self.__heap[0][2].next_run != self.__heap[0][0]):
+                    heapq.heappop(self.__heap)
+                if not self.__heap:
+                    self.__condition.wait()
+                    continue
+                now = time.time()
+                if self.__heap[0][0] > now:
+                    self.__condition.wait(min(self.__heap[0][0] - now, MAX_WAIT))
+                    continue
+                _, _, job = heapq.heappop(self.__heap)
+                self.__dispatch(job, now)
+
+    def __dispatch(self, job : ScheduledJob, now : float) -> None:
+        """Submits the due runs of a job according to its catch up rule and
+        schedules its next run, holding the condition's lock"""
+        next_run = job.next_run or now
+        due = 1
+        if job.interval is not None:
+            due = math.floor((now - next_run) / job.interval) + 1
+        if now - next_run <= self.grace:
+            runs = 1
+        else:
+            runs = {CATCH_UP_ONCE: 1, CATCH_UP_ALL: due, CATCH_UP_NONE: 0}[job.catch_up]
+        if runs and job.catch_up != CATCH_UP_ALL and job.future is not None \
+                and not job.future.done():
+            runs = 0
+        job.missed += due - runs
+        for _ in range(runs):
+            job.future = self.__executor.submit(job.run)
+        if job.interval is None:
+            job.next_run = None
+        else:
+            job.next_run = next_run + due * job.interval
+            self.__push(job)
+
+    def shutdown(self, wait : bool =True) -> None:
+        """Stops the dispatcher, cancelling all jobs
+
+        :param wait: Optional, False to return without waiting for running commands
+        """
+        with self.__condition:
+            self.__stopped = True
+            for _, _, job in self.__heap:
+                job.cancel()
+            self.__heap.clear()
+            self.__condition.notify()
+        self.__dispatcher.join()
+        self.__executor.shutdown(wait=wait)
@@ -0,0 +1,263 @@
+"""shared_frame
+
+This module shares the panel colours of a digital twin with other processes
+ through named shared memory, so renderers running in separate processes can
+ write frames in place, without pickling or copying them, while the process
+ which owns the twin pushes each new frame to the device.
+
+The buffer is laid out, in little-endian byte order, as a 24 byte header of::
+
+    4s      magic       b"NLFB"
+    uint16  version     1
+    uint16  reserved    0
+    uint64  sequence    even when a frame is complete, odd while one is written
+    uint32  panels      the number of panels
+    4x      padding
+
+followed by the uint32 ID of each panel and then the uint8 R, G and B values
+ of each panel, in the same order.
+
+The sequence counter works as a seqlock: a writer makes it odd, changes the
+ colours and makes it even again, so it increases by two with every frame.
+ Readers copy the colours and retry if the sequence was odd or changed in the
+ meantime, so they never see a partly written frame. Only one process should
+ write at a time. It requires Python 3.8 or later, and NumPy, if installed,
+ for the colors array."""
+
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from nanoleafapi.nanoleaf import NanoleafEffectCreationError
+from nanoleafapi.digital_twin import NanoleafDigitalTwin
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"NLFB"
+VERSION = 1
+HEADER = struct.Struct('<4sHHQI4x')
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 8
+
+# The longest read() sleeps between checks for a write in progress to finish
+MAX_READ_DELAY = 0.01
+
+
+def _attach(name : str) -> Any:
+    """Opens an existing shared memory block without letting this process's
+    resource tracker remove it when the process exits"""
+    memory_class : Any = shared_memory.SharedMemory
+    try:
+        return memory_class(name, track=False) # pylint: disable=unexpected-keyword-arg
+    except TypeError:
+        # Before Python 3.13, attaching always registers the block for removal
+        memory = memory_class(name)
+        resource_tracker.unregister(memory._name, 'shared_memory') # pylint: disable=protected-access
+        return memory
+
+
+class NanoleafSharedFrame(): # pylint: disable=too-many-instance-attributes
+    """Class for a frame of panel colours in named shared memory
+
+    :ivar name: The name of the shared memory block, used to attach to it
+        from another process
+    :ivar panel_ids: The IDs of the panels, in the order of their colours
+    :ivar colors: The colours written in place, a NumPy array of shape
+        (panels, 3) if NumPy is installed, otherwise a memoryview of the
+        R, G and B bytes of each panel. It should only be changed inside
+        writing().
+    """
+
+    def __init__(self, name : str =None, panel_ids : List[int] =None) -> None:
+        """Creates a shared frame for a list of panels, or attaches to an
+        existing frame by its name.
+
+        :param name: Optional when creating, the name of the shared memory
+            block, which is generated if not given
+        :param panel_ids: Optional, the IDs of the panels to create a frame
+            for, or None to attach to the frame called name
+
+        :raises ValueError: When the shared memory isn't a frame.
+        """
+        if shared_memory is None:
+            raise ImportError("NanoleafSharedFrame requires Python 3.8 or later")
+        if panel_ids is None:
+            if name is None:
+                raise ValueError("The name of the frame to attach to is required")
+            self.__memory = _attach(name)
+            self.__owner = False
+            buffer = self.__memory.buf
+            if (len(buffer) < HEADER.size or
+                    HEADER.unpack_from(buffer)[0] != MAGIC):
+                self.__memory.close()
+                raise ValueError(f"{name} is not a nanoleafapi frame")
+            _, version, _, _, num_panels = HEADER.unpack_from(buffer)
+            if version != VERSION:
+                self.__memory.close()
+                raise ValueError(f"Unsupported frame version {version}")
+            self.panel_ids = list(struct.unpack_from(f'<{num_panels}I', buffer, HEADER.size))
+        else:
+            self.panel_ids = list(panel_ids)
+            num_panels = len(self.panel_ids)
+            self.__memory = shared_memory.SharedMemory(name, create=True,
+                size=HEADER.size + 7 * max(num_panels, 1))
+            self.__owner = True
+            HEADER.pack_into(self.__memory.buf, 0, MAGIC, VERSION, 0, 0, num_panels)
+            struct.pack_into(f'<{num_panels}I', self.__memory.buf, HEADER.size,
+                *self.panel_ids)
+        self.name = self.__memory.name
+        self.__offset = HEADER.size + 4 * num_panels
+        self.__indices = {panel_id: index for index, panel_id in enumerate(self.panel_ids)}
+        self.__lock = threading.Lock()
+        rgb = self.__memory.buf[self.__offset:self.__offset + 3 * num_panels]
+        self.colors : Any = rgb if np is None else np.ndarray((num_panels, 3), np.uint8, rgb)
+
+    @classmethod
+    def from_twin(cls, twin : NanoleafDigitalTwin, name : str =None) -> 'NanoleafSharedFrame':
+        """Creates a shared frame of a digital twin's panels and current colours
+
+        :param twin: The digital twin
+        :param name: Optional, the name of the shared memory block
+
+        :returns: The shared frame
+        """
+        frame = cls(name, twin.get_ids())
+        frame.set_colors(twin.get_all_colors())
+        return frame
+
+    @property
+    def sequence(self) -> int:
+        """The sequence counter, which is odd while a frame is being written"""
+        return SEQUENCE.unpack_from(self.__memory.buf, SEQUENCE_OFFSET)[0]
+
+    @contextmanager
+    def writing(self) -> Iterator[Any]:
+        """Context manager for writing a frame in place through colors, e.g.
+        ``with frame.writing() as colors: colors[:] = pixels``
+
+        :returns: The colors of the frame
+        """
+        with self.__lock:
+            # Starting from an odd sequence recovers from a writer which stopped
+            sequence = self.sequence | 1
+            SEQUENCE.pack_into(self.__memory.buf, SEQUENCE_OFFSET, sequence)
+            try:
+                yield self.colors
+            finally:
+                SEQUENCE.pack_into(self.__memory.buf, SEQUENCE_OFFSET, sequence + 1)
+
+    def set_colors(self, colors : Dict[int, Tuple[int, int, int]]) -> None:
+        """Writes the colours of several panels as one frame.
+
+        :param colors: Dictionary with panel IDs as keys and RGB tuples as values
+
+        :raises NanoleafEffectCreationError: When a panel isn't in the frame.
+        """
+        for panel_id in colors:
+            if panel_id not in self.__indices:
+                raise NanoleafEffectCreationError("Invalid panel ID")
+        buffer = self.__memory.buf
+        with self.writing():
+            for panel_id, rgb in colors.items():
+                start = self.__offset + 3 * self.__indices[panel_id]
+                buffer[start:start + 3] = bytes(rgb)
+
+    def read(self, timeout : float =1) -> Tuple[int, Dict[int, Tuple[int, int, int]]]:
+        """Returns a complete frame, waiting for a write in progress to finish
+
+        :param timeout: Optional, the maximum number of seconds to wait
+
+        :raises TimeoutError: When no frame is completed in time, e.g. because
+            the writer stopped part way through a frame.
+
+        :returns: Tuple of the sequence of the frame and a dictionary with
+            panel IDs as keys and RGB tuples as values
+        """
+        buffer = self.__memory.buf
+        end = self.__offset + 3 * len(self.panel_ids)
+        deadline = time.monotonic() + timeout
+        delay = 0.0
+        while True:
+            sequence = self.sequence
+            if sequence % 2 == 0:
+                data = bytes(buffer[self.__offset:end])
+                if self.sequence == sequence:
+                    break
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"{self.name} is still being written")
+            time.sleep(delay)
+            delay = min(max(delay * 2, 0.0001), MAX_READ_DELAY)
+        return sequence, {panel_id: (data[index], data[index + 1], data[index + 2])
+            for panel_id, index in zip(self.panel_ids, range(0, len(data), 3))}
+
+    def wait(self, sequence : int, timeout : float =None,
+        poll_interval : float =0.001) -> int:
+        """Waits for a frame newer than a sequence to be completed
+
+        :param sequence: The sequence of the last frame seen
+        :param timeout: Optional, the maximum number of seconds to wait
+        :param poll_interval: Optional, the number of seconds between checks
+
+        :returns: The new sequence, which is even, or the given sequence if
+            no frame was completed in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.sequence
+            if current != sequence and current % 2 == 0:
+                return current
+            if deadline is not None and time.monotonic() >= deadline:
+                return sequence
+            time.sleep(poll_interval)
+
+    def sync_loop(self, twin : NanoleafDigitalTwin, stop : threading.Event =None,
+        poll_interval : float =0.001) -> int:
+        """Pushes each new frame to a device through its digital twin, until
+        stop is set
+
+        Only the latest frame is sent, so frames written faster than the
+        device can be synced are skipped rather than queued. A frame left
+        part written by a writer which stopped is skipped until a new frame
+        is written.
+
+        :param twin: The digital twin of the device
+        :param stop: Optional, an event which ends the loop when set
+        :param poll_interval: Optional, the number of seconds between checks
+            for a new frame
+
+        :returns: The number of frames synced
+        """
+        synced = 0
+        last : Optional[int] = None
+        while stop is None or not stop.is_set():
+            if self.wait(-1 if last is None else last, 0.1, poll_interval) == last:
+                continue
+            try:
+                last, colors = self.read(0.1)
+            except TimeoutError:
+                continue
+            twin.set_colors(colors)
+            twin.sync()
+            synced += 1
+        return synced
+
+    def close(self) -> None:
+        """Detaches from the shared memory, which is removed when the process
+        that created it closes it"""
+        self.colors = None
+        self.__memory.close()
+        if self.__owner:
+            # A process which attached may have unregistered the block from a
+            # resource tracker shared with this one, see _attach()
+            resource_tracker.register(self.__memory._name, # pylint: disable=protected-access
+                'shared_memory')
+            self.__memory.unlink()
@@ -1,7 +1,34 @@
 import unittest
-from nanoleafapi.nanoleaf import Nanoleaf, NanoleafEffectCreationError
+from nanoleafapi.nanoleaf import (Nanoleaf, NanoleafEffectCreationError,
+    NanoleafConnectionError, NanoleafOfflineError)
+from nanoleafapi.health import NanoleafHealth
+from nanoleafapi.event_history import NanoleafEventHistory, EFFECTS, TOUCH
+from nanoleafapi.recorder import RecordingTransport, NanoleafReplayer, COMMAND, FAILED
+from nanoleafapi.transport import HTTPClientTransport, NanoleafTransport, NanoleafResponse
+from nanoleafapi.scenes import NanoleafScene, RESTORED, UNCHANGED
 from nanoleafapi.digital_twin import NanoleafDigitalTwin
+from nanoleafapi.frame_mapper import NanoleafFrameMapper
+from nanoleafapi.canvas import NanoleafVirtualCanvas
+from nanoleafapi.shared_frame import NanoleafSharedFrame
+from nanoleafapi.transitions import NanoleafTransition
+from nanoleafapi.effects_builder import build_effect
+from nanoleafapi.anim_data import optimise_effect, parse_anim_data
+from nanoleafapi.codec import benchmark, generate_info
+from nanoleafapi.layout import NanoleafLayout
+from nanoleafapi.audio import NanoleafAudioAnalyser, NanoleafAudioVisualiser
+from nanoleafapi.async_transport import AsyncTransport
+from nanoleafapi.nonblocking import NanoleafNonBlocking, wait_all
+from nanoleafapi.fleet import NanoleafFleet
+from nanoleafapi.scheduler import NanoleafScheduler, CATCH_UP_NONE
+import asyncio
+import http.server
+import json
+import os
+import pickle
 import socket
+import tempfile
+import threading
+import time
 
 class TestNanoleafMethods(unittest.TestCase):
 
@@ -129,6 +156,22 @@ class TestNanoleafMethods(unittest.TestCase):
     def test_spectrum(self):
         self.assertTrue(self.nl.spectrum(1))
 
+    def test_compiled_effect_cache(self):
+        self.nl.clear_effect_cache()
+        self.assertTrue(self.nl.flow([(255, 0, 0), (0, 0, 255)], 1))
+        self.assertEqual(len(self.nl.effect_cache), 1)
+        effect_name = list(self.nl.effect_cache)[0]
+        self.assertEqual(self.nl.get_current_effect(), effect_name)
+        self.assertTrue(self.nl.flow([(255, 0, 0), (0, 0, 255)], 1))
+        self.assertEqual(len(self.nl.effect_cache), 1)
+        self.addCleanup(setattr, self.nl, 'effect_cache_size', self.nl.effect_cache_size)
+        self.nl.effect_cache_size = 1
+        self.assertTrue(self.nl.pulsate((0, 255, 0), 1))
+        self.assertEqual(len(self.nl.effect_cache), 1)
+        self.assertNotIn(effect_name, self.nl.list_effects())
+        self.assertTrue(self.nl.clear_effect_cache())
+        self.assertFalse(any(name.startswith("nanoleafapi-") for name in self.nl.list_effects()))
+
     def test_write_effect(self):
         effect_data = {
             "command": "display",
@@ -171,12 +214,48 @@ class TestNanoleafMethods(unittest.TestCase):
         with self.assertRaises(NanoleafEffectCreationError):
             self.assertFalse(self.nl.write_effect({"invalid-string": "invalid"}))
 
+    def test_optimise_effect(self):
+        effect = self.nl.get_custom_base_effect()
+        effect['animData'] = "2 1 3 255 0 0 0 10 255 0 0 0 10 0 0 255 0 10 " + \
+            "2 3 255 0 0 0 10 255 0 0 0 10 0 0 255 0 10"
+        fade, report = optimise_effect(effect)
+        self.assertEqual(fade['animType'], 'fade')
+        self.assertLess(report['optimised_bytes'], report['original_bytes'])
+        self.assertTrue(self.nl.write_effect(fade))
+        custom, report = optimise_effect(effect, use_palette=False)
+        self.assertEqual(custom['animData'], effect['animData'])
+        with self.assertRaises(NanoleafEffectCreationError):
+            optimise_effect(effect, max_bytes=50)
+
+    def test_build_effect(self):
+        effect = build_effect("Builder test", "flow", [(255, 0, 0), (0, 0, 255)])
+        self.assertEqual(effect['palette'][1], {"hue": 240, "saturation": 100, "brightness": 100})
+        self.assertTrue(self.nl.write_effect(effect))
+        with self.assertRaises(ValueError):
+            build_effect("Builder test", "invalid", [(255, 0, 0)])
+
     def test_effect_exists(self):
         self.assertFalse(self.nl.effect_exists('non-existent-effect'))
 
+    def test_effects_catalogue(self):
+        catalogue = self.nl.get_effects_catalogue(refresh=True)
+        self.assertEqual(self.nl.list_effects(), catalogue.names())
+        for name in catalogue.names():
+            self.assertTrue(self.nl.effect_exists(name))
+            effect = self.nl.get_effect(name)
+            self.assertIn(name, catalogue.find_by_type(effect['animType']))
+        self.assertIsNone(self.nl.get_effect('non-existent-effect'))
+
     def test_get_layout(self):
         self.assertTrue(self.nl.get_layout())
 
+    def test_json_decoding(self):
+        nl = Nanoleaf(self.ip, self.nl.auth_token, True, json_loads=json.loads)
+        self.assertEqual(nl.get_ids(), self.nl.get_ids())
+        self.assertEqual(nl.get_name(), self.nl.get_info()['name'])
+        results = benchmark(num_panels=100, product='canvas', repeat=5)
+        self.assertLess(results['layout']['bytes'], results['info']['bytes'])
+
     def __helper_function(self, dictionary):
         self.assertTrue(True)
 
@@ -188,6 +267,103 @@ class TestNanoleafMethods(unittest.TestCase):
         self.nl.register_event(self.__helper_function, [1])
         self.nl.toggle_power()
 
+    def test_event_history(self):
+        history = NanoleafEventHistory(capacity=2)
+        for timestamp, panel_id in enumerate([5, 6, 5]):
+            history.record(TOUCH, {"events": [{"panelId": panel_id, "gesture": 0}]}, timestamp)
+        history.record(EFFECTS, {"events": [{"attr": 1, "value": "Forest"}]}, 3)
+        self.assertEqual([event['panelId'] for _, event in history.events(TOUCH)], [6, 5])
+        self.assertEqual(history.touches(start=2), {5: 1})
+        self.assertEqual(history.touch_counts, {5: 2, 6: 1})
+        self.assertEqual(history.effect_changes, {"Forest": 1})
+        self.assertEqual(history.last_seen['effect'], "Forest")
+        self.assertGreater(history.touch_rates(now=3)[5], history.touch_rates(now=3)[6])
+
+    def test_async_transport(self):
+        transport = AsyncTransport()
+        nl = Nanoleaf(self.ip, self.nl.auth_token, True, transport)
+        self.assertEqual(nl.get_info(), self.nl.get_info())
+        self.assertTrue(nl.power_on())
+        response = asyncio.run(transport.arequest('GET', nl.url))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(nl.power_on())
+        transport.close()
+
+    def test_record_and_replay(self):
+        path = os.path.join(tempfile.mkdtemp(), "traffic.nlrc")
+        transport = RecordingTransport(HTTPClientTransport(), path)
+        nl = Nanoleaf(self.ip, self.nl.auth_token, True, transport)
+        self.assertTrue(nl.power_on())
+        self.assertTrue(nl.set_brightness(50))
+        transport.close()
+        replayer = NanoleafReplayer(path)
+        names = [record.name for record in replayer.records() if record.kind == COMMAND]
+        self.assertEqual(names[-2:], ["PUT /state", "PUT /state"])
+        self.assertEqual(replayer.replay(self.nl, speed=None)['commands'], len(names))
+        replayer.close()
+        open(path, 'wb').close()
+        with self.assertRaises(ValueError):
+            NanoleafReplayer(path)
+
+    def test_scene(self):
+        self.assertTrue(self.nl.set_brightness(40))
+        scene = NanoleafScene.capture([self.nl])
+        self.assertEqual(scene.restore([self.nl]), {self.ip: UNCHANGED})
+        self.assertTrue(self.nl.set_brightness(80))
+        self.assertEqual(scene.restore([self.nl]), {self.ip: RESTORED})
+        self.assertEqual(self.nl.get_brightness(), 40)
+
+    def test_device_health(self):
+        self.assertTrue(self.nl.health.online)
+        self.assertIsNotNone(self.nl.health.latency)
+        health = NanoleafHealth(failure_threshold=2, retries=5, backoff=0.01, probe_interval=60)
+        nl = Nanoleaf(self.ip, self.nl.auth_token, True, timeout=1, health=health)
+        # Point the device at an address which doesn't respond
+        nl.url = "http://192.0.2.1:16021/api/v1/" + str(self.nl.auth_token)
+        with self.assertRaises(NanoleafConnectionError):
+            nl.get_power()
+        # The retries stop once the failed attempts mark the device offline
+        self.assertFalse(health.online)
+        self.assertEqual(health.consecutive_failures, 2)
+        with self.assertRaises(NanoleafOfflineError) as context:
+            nl.get_power()
+        # Errors are pickled to send them between processes, e.g. by NanoleafFleet
+        self.assertEqual(str(pickle.loads(pickle.dumps(context.exception))),
+            str(context.exception))
+
+    def test_non_blocking(self):
+        device = NanoleafNonBlocking(self.nl)
+        futures = [device.set_brightness(10), device.get_brightness(),
+            device.set_brightness(100), device.get_brightness()]
+        self.assertEqual(wait_all(futures), [True, 10, True, 100])
+        device.close()
+
+    def test_fleet(self):
+        fleet = NanoleafFleet([(self.ip, self.nl.auth_token)], processes=2)
+        self.assertEqual(fleet.processes, 1)
+        self.assertEqual(fleet.command('set_brightness', 50), {self.ip: True})
+        self.assertEqual(fleet.command('get_brightness'), {self.ip: 50})
+        panel_id = self.nl.get_ids()[0]
+        self.assertEqual(fleet.render({self.ip: {panel_id: (255, 0, 0)}}), {self.ip: True})
+        metrics = fleet.metrics()
+        self.assertEqual((metrics['commands'], metrics['frames'], metrics['failures']), (2, 1, 0))
+        fleet.close()
+
+    def test_scheduler(self):
+        scheduler = NanoleafScheduler(max_workers=2)
+        brightness = scheduler.after(0.1, self.nl.set_brightness, 30)
+        cancelled = scheduler.after(0.1, self.nl.set_brightness, 90)
+        self.assertTrue(cancelled.cancel())
+        toggles = scheduler.every(0.5, self.nl.toggle_power, start=time.time() - 1.2,
+            catch_up=CATCH_UP_NONE)
+        time.sleep(1)
+        toggles.cancel()
+        scheduler.shutdown()
+        self.assertEqual(self.nl.get_brightness(), 30)
+        self.assertEqual((brightness.runs, cancelled.runs), (1, 0))
+        self.assertEqual(toggles.missed, 3)
+        self.assertGreaterEqual(toggles.runs, 1)
+
     def test_digital_twin_get_ids(self):
         self.assertTrue(self.digital_twin.get_ids() == self.nl.get_ids())
 
@@ -205,6 +381,103 @@ class TestNanoleafMethods(unittest.TestCase):
         for value in all_colours.values():
             self.assertTrue(value == (255, 255, 255))
 
+    def test_digital_twin_layout(self):
+        layout = self.digital_twin.layout
+        for panel_id in layout.get_lit_ids():
+            x, y = layout.get_position(panel_id)
+            self.assertEqual(layout.nearest(x, y), panel_id)
+            self.assertEqual(self.digital_twin.set_color_at(x, y, (255, 0, 0)), panel_id)
+            self.assertEqual(layout.within_radius(x, y, 0), [panel_id])
+            for neighbour in layout.neighbours(panel_id):
+                self.assertIn(panel_id, layout.neighbours(neighbour))
+        self.assertEqual(sorted(layout.sweep()), sorted(layout.get_lit_ids()))
+
+    def test_frame_mapper(self):
+        mapper = NanoleafFrameMapper(self.digital_twin.layout, 64, 48)
+        frame = bytes([255, 0, 0]) * 64 * 48
+        colours = mapper.map_frame_dict(frame)
+        self.assertEqual(sorted(colours), sorted(self.digital_twin.layout.get_lit_ids()))
+        for value in colours.values():
+            self.assertEqual(value, (255, 0, 0))
+        self.assertEqual(mapper.stream([frame] * 5, self.digital_twin, 1), 1)
+
+    def test_transition(self):
+        self.digital_twin.set_all_colors((0, 0, 0))
+        target = {panel_id: (255, 0, 0) for panel_id in self.digital_twin.get_ids()}
+        transition = NanoleafTransition.from_twin(self.digital_twin, target, 1, 'cubic')
+        self.assertGreater(transition.stream(self.digital_twin, fps=5), 1)
+        self.assertEqual(set(self.digital_twin.get_all_colors().values()), {(255, 0, 0)})
+        self.assertTrue(self.nl.write_effect(transition.to_effect(fps=5)))
+        delayed = NanoleafTransition({1: (0, 0, 0), 2: (0, 0, 0)},
+            {1: (100, 0, 0), 2: (100, 0, 0)}, 0.1, 'linear', delays={2: 0.2})
+        self.assertEqual(delayed.to_effect()['animData'], "2 1 3 0 0 0 0 1 100 0 0 0 1 " +
+            "100 0 0 0 2 2 3 0 0 0 0 1 0 0 0 0 2 100 0 0 0 1")
+        with self.assertRaises(ValueError):
+            NanoleafTransition(target, target, 1, 'bounce')
+
+    def test_audio_visualiser(self):
+        analyser = NanoleafAudioAnalyser(8000, bands=4, window_size=256)
+        visualiser = NanoleafAudioVisualiser(analyser, self.digital_twin.layout)
+        silence = bytes(2 * 400)
+        frames = list(visualiser.frames([silence] * 10, fps=20))
+        self.assertEqual(len(frames), 10)
+        for colour in frames[-1].values():
+            self.assertEqual(colour, (0, 0, 0))
+        self.assertEqual(visualiser.run([silence] * 4, self.digital_twin, 20, False), 4)
+
+    def test_virtual_canvas(self):
+        canvas = NanoleafVirtualCanvas([(self.digital_twin, (1000, 0))])
+        panel_id = self.digital_twin.layout.get_lit_ids()[0]
+        x, y = self.digital_twin.layout.get_position(panel_id)
+        global_id = canvas.set_color_at(x + 1000, y, (0, 255, 0))
+        self.assertEqual(canvas.to_local(global_id), (self.digital_twin, panel_id))
+        self.assertEqual(self.digital_twin.get_color(panel_id), (0, 255, 0))
+        self.assertTrue(canvas.sync())
+        canvas.close()
+
+    def test_digital_twin_double_buffered(self):
+        path = os.path.join(tempfile.mkdtemp(), "traffic.nlrc")
+        transport = RecordingTransport(HTTPClientTransport(), path)
+        twin = NanoleafDigitalTwin(Nanoleaf(self.ip, self.nl.auth_token, True, transport),
+            double_buffered=True)
+        twin.set_all_colors((255, 0, 0))
+        twin.commit()
+        twin.set_all_colors((0, 0, 255))
+        self.assertTrue(twin.sync())
+        self.assertEqual(set(twin.get_all_colors().values()), {(0, 0, 255)})
+        transport.close()
+        # sync() sent the committed red frame rather than the blue back buffer
+        replayer = NanoleafReplayer(path)
+        writes = [record.request_body for record in replayer.records()
+            if record.kind == COMMAND and record.name == "PUT /effects"]
+        replayer.close()
+        panels = parse_anim_data(json.loads(writes[-1])['write']['animData'])
+        self.assertEqual(set(panels), set(twin.get_ids()))
+        self.assertEqual({tuple(frames) for frames in panels.values()}, {((255, 0, 0, 0, 0),)})
+
+    def test_shared_frame(self):
+        frame = NanoleafSharedFrame.from_twin(self.digital_twin)
+        other = NanoleafSharedFrame(frame.name)
+        self.assertEqual(other.panel_ids, self.digital_twin.get_ids())
+        panel_id = other.panel_ids[0]
+        other.set_colors({panel_id: (255, 0, 0)})
+        sequence, colors = frame.read()
+        self.assertEqual(sequence % 2, 0)
+        self.assertEqual(colors[panel_id], (255, 0, 0))
+        stop = threading.Event()
+        thread = threading.Thread(target=frame.sync_loop, args=(self.digital_twin, stop))
+        thread.start()
+        time.sleep(1)
+        stop.set()
+        thread.join()
+        self.assertEqual(self.digital_twin.get_color(panel_id), (255, 0, 0))
+        # A writer which stops part way through a frame leaves it unreadable
+        with self.assertRaises(TimeoutError):
+            with other.writing():
+                frame.read(0.1)
+        other.close()
+        frame.close()
+
     def test_digital_twin_sync(self):
         self.digital_twin.set_all_colors((255, 255, 255))
         self.assertTrue(self.digital_twin.sync())
@@ -243,3 +516,139 @@ class TestNanoleafMethods(unittest.TestCase):
         self.assertTrue(info['state']['hue']['value'] == 0)
         self.assertTrue(info['state']['sat']['value'] == 0)
 
+
+
+class _ChunkedHandler(http.server.BaseHTTPRequestHandler):
+    """Answers every request with a chunked JSON body and a trailer"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in (b'{"value"', b': true}'):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\nX-Trailer: 1\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class _EventStreamHandler(http.server.BaseHTTPRequestHandler):
+    """Sends an event every 0.1 seconds until the client disconnects"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        try:
+            while True:
+                self.wfile.write(b"id: 1\ndata: {}\n\n")
+                self.wfile.flush()
+                time.sleep(0.1)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTransports(unittest.TestCase):
+
+    def test_async_transport_chunked(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _ChunkedHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        transport = AsyncTransport()
+        url = f"http://127.0.0.1:{server.server_port}/api/v1/token/state/on"
+        # The second request reuses the connection after the first chunked body
+        for _ in range(2):
+            self.assertEqual(transport.request('GET', url).json(), {"value": True})
+        transport.close()
+        server.shutdown()
+        server.server_close()
+
+    def test_close_ends_event_streams(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _EventStreamHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/api/v1/token/events?id=1"
+        for transport in (HTTPClientTransport(), AsyncTransport()):
+            events = []
+            listener = threading.Thread(target=lambda: events.extend(transport.events(url)))
+            listener.start()
+            time.sleep(0.3)
+            transport.close()
+            listener.join(5)
+            self.assertFalse(listener.is_alive())
+            self.assertTrue(events)
+        server.shutdown()
+        server.server_close()
+
+
+class TestLayout(unittest.TestCase):
+
+    def test_nearest_far_from_layout(self):
+        layout = NanoleafLayout(generate_info(16, 'canvas')['panelLayout']['layout'])
+        corner = max(layout.get_ids(), key=lambda panel_id: sum(layout.get_position(panel_id)))
+        start = time.perf_counter()
+        self.assertEqual(layout.nearest(5e4, 5e4), corner)
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(layout.radial(), layout.radial(*layout.get_centre()))
+
+
+class _FakeTransport(NanoleafTransport):
+    """Records the requests sent, answering 200 or raising TimeoutError for /slow"""
+
+    def __init__(self):
+        self.sent = []
+
+    def request(self, method, url, data=None, timeout=None):
+        self.sent.append(method + " " + url)
+        if url.endswith("/slow"):
+            raise TimeoutError("timed out")
+        return NanoleafResponse(200, b"{}")
+
+
+class TestRecorder(unittest.TestCase):
+
+    def test_auth_commands_and_failures(self):
+        path = os.path.join(tempfile.mkdtemp(), "traffic.nlrc")
+        transport = RecordingTransport(_FakeTransport(), path)
+        base = "http://127.0.0.1:16021/api/v1/"
+        transport.request('POST', base + "new")
+        transport.request('DELETE', base + "token")
+        transport.request('PUT', base + "token/state", '{"on": {"value": true}}')
+        with self.assertRaises(TimeoutError):
+            transport.request('GET', base + "token/slow")
+        transport.close()
+        replayer = NanoleafReplayer(path)
+        records = list(replayer.records())
+        self.assertEqual([record.name for record in records], ["POST /api/v1/new",
+            "DELETE /api/v1/<token>", "PUT /state", "GET /slow"])
+        self.assertEqual(records[-1].kind, FAILED)
+        self.assertEqual(records[-1].error, "TimeoutError: timed out")
+        target = _FakeTransport()
+        nl = Nanoleaf("127.0.0.1", "target", transport=target)
+        target.sent.clear()
+        stats = replayer.replay(nl, speed=None)
+        self.assertEqual((stats['skipped'], stats['failed'], stats['errors']), (2, 1, 1))
+        self.assertEqual(target.sent, ["PUT " + base + "target/state", "GET " + base + "target/slow"])
+        replayer.close()
+
+
+class TestFleet(unittest.TestCase):
+
+    def test_stopped_worker(self):
+        # Nothing listens on these addresses, so each worker stores the connection error
+        fleet = NanoleafFleet([("127.0.0.1", "token"), ("127.0.0.2", "token")], processes=2)
+        self.assertEqual(fleet.metrics()['devices'], 2)
+        worker = fleet._NanoleafFleet__workers[0]
+        worker.terminate()
+        worker.join()
+        with self.assertRaises(EOFError):
+            fleet.metrics()
+        # The other worker's metrics reply was read, so isn't returned here
+        with self.assertRaises(EOFError):
+            fleet.command('get_brightness', ips=["127.0.0.2"])
+        fleet.close()
@@ -0,0 +1,208 @@
+"""NanoleafTransition
+
+This module calculates eased transitions between two sets of panel colours,
+ which can be streamed through a digital twin or compiled into a single
+ custom effect for the device to play by itself. It requires NumPy, which can
+ be installed with ``pip install nanoleafapi[frames]``."""
+
+import math
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
+from nanoleafapi.nanoleaf import Nanoleaf, NanoleafEffectCreationError
+from nanoleafapi.digital_twin import NanoleafDigitalTwin
+from nanoleafapi.anim_data import Frame, format_anim_data, merge_frames
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# An easing name from EASINGS, or a function mapping a NumPy array of
+# progress values between 0 and 1 to eased values
+Easing = Union[str, Callable[[Any], Any]]
+
+EASINGS : Dict[str, Callable[[Any], Any]] = {
+    'linear': lambda t: t,
+    'ease_in': lambda t: t ** 3,
+    'ease_out': lambda t: 1 - (1 - t) ** 3,
+    'ease_in_out': lambda t: np.where(t < 0.5, 4 * t ** 3, 1 - (2 - 2 * t) ** 3 / 2),
+}
+EASINGS['cubic'] = EASINGS['ease_in_out']
+
+# The transition times of custom effects are in tenths of a second
+MAX_EFFECT_FPS = 10
+
+class NanoleafTransition():
+    """Class for calculating eased colour transitions over all panels at once
+
+    Each panel can have its own easing curve and a delay before it starts,
+    which can be used for wipes and ripples.
+
+    :ivar panel_ids: The IDs of the panels, in the order of the frames
+    :ivar duration: The length of each panel's transition in seconds
+    :ivar total_duration: The length of the whole transition in seconds,
+        including the longest delay
+    """
+
+    def __init__(self, start : Dict[int, Tuple[int, int, int]],
+        end : Dict[int, Tuple[int, int, int]], duration : float,
+        easing : Union[Easing, Dict[int, Easing]] ='ease_in_out',
+        delays : Dict[int, float] =None) -> None:
+        """Initialises the transition.
+
+        :param start: Dictionary of panel IDs and their starting RGB colours.
+            Panels which aren't included start black.
+        :param end: Dictionary of panel IDs and their final RGB colours
+        :param duration: The length of each panel's transition in seconds
+        :param easing: Optional, the easing of every panel, or a dictionary of
+            panel IDs and their easing, with linear used for missing panels
+        :param delays: Optional, dictionary of panel IDs and the number of
+            seconds before their transition starts
+
+        :raises ValueError: When the duration isn't positive or an easing is unknown.
+        """
+        if np is None:
+            raise ImportError("NanoleafTransition requires NumPy, install it with " +
+                "'pip install nanoleafapi[frames]'")
+        if duration <= 0:
+            raise ValueError("The duration must be greater than 0")
+        delays = delays or {}
+        self.panel_ids = list(end)
+        self.duration = duration
+        self.__start = np.array([start.get(panel_id, (0, 0, 0)) for panel_id in self.panel_ids],
+            dtype=np.float64).reshape(-1, 3)
+        self.__delta = np.array([end[panel_id] for panel_id in self.panel_ids],
+            dtype=np.float64).reshape(-1, 3) - self.__start
+        self.__delays = np.array([delays.get(panel_id, 0) for panel_id in self.panel_ids],
+            dtype=np.float64)
+        self.total_duration = duration + max(delays.values(), default=0)
+
+        # Panels are grouped by easing so each curve is evaluated once per frame
+        groups : Dict[Any, List[int]] = {}
+        for index, panel_id in enumerate(self.panel_ids):
+            panel_easing = easing.get(panel_id, 'linear') if isinstance(easing, dict) else easing
+            groups.setdefault(panel_easing, []).append(index)
+        self.__groups = [(self.__easing_function(panel_easing), np.array(indices))
+            for panel_easing, indices in groups.items()]
+
+    @classmethod
+    def from_twin(cls, twin : NanoleafDigitalTwin, end : Dict[int, Tuple[int, int, int]],
+        duration : float, easing : Union[Easing, Dict[int, Easing]] ='ease_in_out',
+        delays : Dict[int, float] =None) -> 'NanoleafTransition':
+        """Creates a crossfade from the current colours of a digital twin
+
+        Panels of the twin which aren't in end keep their current colour.
+
+        :param twin: The digital twin to transition from
+        :param end: Dictionary of panel IDs and their final RGB colours
+        :param duration: The length of each panel's transition in seconds
+        :param easing: Optional, see __init__()
+        :param delays: Optional, see __init__()
+
+        :returns: The transition
+        """
+        start = twin.get_all_colors()
+        return cls(start, {**start, **end}, duration, easing, delays)
+
+    @staticmethod
+    def __easing_function(easing : Easing) -> Callable[[Any], Any]:
+        """Returns the function of an easing name, or the easing if it's a function"""
+        if callable(easing):
+            return easing
+        if easing not in EASINGS:
+            raise ValueError("Easing must be a function or one of " + ", ".join(EASINGS))
+        return EASINGS[easing]
+
+    def frame_at(self, elapsed : float) -> Any:
+        """Returns the colour of each panel part way through the transition
+
+        :param elapsed: The number of seconds since the transition started
+
+        :returns: NumPy array of shape (panels, 3) with the RGB colour of each
+            panel, in the order of panel_ids
+        """
+        progress = np.clip((elapsed - self.__delays) / self.duration, 0, 1)
+        eased = np.empty_like(progress)
+        for function, indices in self.__groups:
+            eased[indices] = function(progress[indices])
+        return np.clip(np.rint(self.__start + self.__delta * eased[:, None]), 0,
+            255).astype(np.uint8)
+
+    def frame_dict(self, elapsed : float) -> Dict[int, Tuple[int, int, int]]:
+        """Returns the colour of each panel part way through the transition as
+        a dictionary
+
+        :param elapsed: The number of seconds since the transition started
+
+        :returns: Dictionary with panel IDs as keys and RGB tuples as values
+        """
+        colours = self.frame_at(elapsed).tolist()
+        return {panel_id: tuple(colour) for panel_id, colour in zip(self.panel_ids, colours)}
+
+    def frames(self, fps : float) -> Iterator[Any]:
+        """Yields the frames of the transition at a fixed rate, ending with the
+        final colours
+
+        :param fps: The number of frames per second
+
+        :returns: Iterator of NumPy arrays, as returned by frame_at()
+        """
+        # Rounded so floating point error doesn't add an extra frame
+        count = max(math.ceil(round(self.total_duration * fps, 9)), 1)
+        for index in range(count + 1):
+            yield self.frame_at(min(index / fps, self.total_duration))
+
+    def stream(self, twin : NanoleafDigitalTwin, fps : float =10) -> int:
+        """Plays the transition in real time by syncing a digital twin
+
+        Each frame is calculated for the time it is sent, so if the device is
+        slower than the frame rate, frames are skipped rather than slowing the
+        transition down.
+
+        :param twin: The digital twin to update and sync
+        :param fps: Optional, the maximum number of frames synced per second
+
+        :returns: The number of frames synced to the device
+        """
+        interval = 1 / fps
+        start = time.monotonic()
+        synced = 0
+        while True:
+            elapsed = min(time.monotonic() - start, self.total_duration)
+            twin.set_colors(self.frame_dict(elapsed))
+            twin.sync()
+            synced += 1
+            if elapsed >= self.total_duration:
+                return synced
+            next_frame = start + (math.floor(elapsed / interval) + 1) * interval
+            time.sleep(max(next_frame - time.monotonic(), 0))
+
+    def to_effect(self, fps : float =MAX_EFFECT_FPS, loop : bool =False) -> Dict[str, Any]:
+        """Compiles the transition into a custom effect which the device plays
+        by itself, for devices which can't be streamed to
+
+        The device fades linearly between the frames, so the easing is
+        followed more closely at higher frame rates. Runs of repeated frames
+        are merged into a single hold, see anim_data.merge_frames().
+
+        :param fps: Optional, the number of frames per second, up to 10
+        :param loop: Optional, True to repeat the transition
+
+        :raises NanoleafEffectCreationError: When the frame rate is above 10.
+
+        :returns: The effect dictionary, for use with Nanoleaf.write_effect()
+        """
+        if fps <= 0 or fps > MAX_EFFECT_FPS:
+            raise NanoleafEffectCreationError("The frame rate of an effect must be " +
+                f"between 0 and {MAX_EFFECT_FPS}")
+        trans_time = max(round(MAX_EFFECT_FPS / fps), 1)
+        frames = np.stack(list(self.frames(fps)), axis=1).tolist()
+        panels : Dict[int, List[Frame]] = {}
+        for panel_id, panel_frames in zip(self.panel_ids, frames):
+            # The first frame is shown straight away
+            panels[panel_id] = merge_frames([(r, g, b, 0, trans_time if index else 1)
+                for index, (r, g, b) in enumerate(panel_frames)])
+        anim_data = format_anim_data(panels)
+        effect = Nanoleaf.get_custom_base_effect(loop=loop)
+        effect['animData'] = anim_data
+        return effect
@@ -0,0 +1,229 @@
+"""transport
+
+This module separates the HTTP and Server-Sent Events I/O from the Nanoleaf
+ class, so the backend can be chosen to suit the program using it.
+
+Three backends are provided:
+
+- HTTPClientTransport, the default, which only uses the standard library and
+  keeps a connection open to each device
+- RequestsTransport, which uses requests and sseclient
+- AsyncTransport, in the async_transport module, which uses asyncio and can
+  also be awaited directly"""
+
+import http.client
+import json
+import socket
+import threading
+import weakref
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+from urllib.parse import urlsplit
+
+Body = Optional[Union[str, bytes]]
+
+# Either one timeout in seconds, or a (connect timeout, read timeout) tuple
+Timeout = Optional[Union[float, Tuple[float, float]]]
+
+# Errors raised by transports when a device can't be reached; other
+# transports should raise subclasses of these, e.g. TimeoutError
+TRANSPORT_ERRORS = (OSError, http.client.HTTPException)
+
+# Connections which may have been closed by the device while idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+    http.client.BadStatusLine, BrokenPipeError, ConnectionResetError)
+
+
+def split_timeout(timeout : Timeout) -> Tuple[Optional[float], Optional[float]]:
+    """Returns the (connect timeout, read timeout) tuple of a timeout"""
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+class NanoleafResponse():
+    """The response to a request sent by a transport
+
+    :ivar status_code: The HTTP status code
+    :ivar content: The body of the response
+    """
+
+    def __init__(self, status_code : int, content : bytes) -> None:
+        self.status_code = status_code
+        self.content = content
+
+    def __bool__(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        """The body of the response, decoded as UTF-8"""
+        return self.content.decode('utf-8')
+
+    def json(self) -> Any:
+        """The body of the response, decoded as JSON"""
+        return json.loads(self.content)
+
+
+class NanoleafTransport():
+    """Base class for the transport used by a Nanoleaf object to make requests"""
+
+    def request(self, method : str, url : str, data : Body =None,
+        timeout : Timeout =None) -> NanoleafResponse:
+        """Sends a request and waits for the response
+
+        :param method: The HTTP method, e.g. GET or PUT
+        :param url: The full URL of the request
+        :param data: Optional, the body of the request
+        :param timeout: Optional, the number of seconds to wait for the device,
+            or a (connect timeout, read timeout) tuple
+
+        :raises OSError: When the device can't be reached or doesn't respond
+            in time, see TRANSPORT_ERRORS.
+
+        :returns: The response
+        """
+        raise NotImplementedError
+
+    def events(self, url : str) -> Iterator[Tuple[str, str]]:
+        """Connects to a Server-Sent Events stream and yields its events
+
+        :param url: The full URL of the event stream
+
+        :returns: Iterator of (event id, event data) tuples
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Closes any open connections."""
+
+
+class EventParser(): # pylint: disable=too-few-public-methods
+    """Parses the lines of a Server-Sent Events stream into (id, data) tuples"""
+
+    def __init__(self) -> None:
+        self.event_id = ""
+        self.data : List[str] = []
+
+    def feed(self, raw_line : bytes) -> Optional[Tuple[str, str]]:
+        """Parses a line, returning the event if the line completes one"""
+        line = raw_line.decode('utf-8').rstrip('\r\n')
+        if not line:
+            event = (self.event_id, "\n".join(self.data)) if self.data else None
+            self.data = []
+            return event
+        field, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if field == 'id':
+            self.event_id = value
+        elif field == 'data':
+            self.data.append(value)
+        return None
+
+
+class HTTPClientTransport(NanoleafTransport):
+    """Transport using http.client, with a keep-alive connection per device and thread
+
+    close() closes the connections of every thread, and ends any event
+    streams, after which the connections are reopened when next used.
+    """
+
+    def __init__(self) -> None:
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__connections : 'weakref.WeakSet[http.client.HTTPConnection]' = weakref.WeakSet()
+        self.__streams : Set[socket.socket] = set()
+
+    def __connection(self, host : str) -> http.client.HTTPConnection:
+        """Returns this thread's connection to a host, creating it if required"""
+        connections : Dict[str, http.client.HTTPConnection] = getattr(self.__local,
+            'connections', None)
+        if connections is None:
+            connections = self.__local.connections = {}
+        if host not in connections:
+            connections[host] = http.client.HTTPConnection(host)
+            with self.__lock:
+                self.__connections.add(connections[host])
+        return connections[host]
+
+    def request(self, method : str, url : str, data : Body =None,
+        timeout : Timeout =None) -> NanoleafResponse:
+        parts = urlsplit(url)
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        body = data.encode('utf-8') if isinstance(data, str) else data
+        connect_timeout, read_timeout = split_timeout(timeout)
+        for attempt in range(2):
+            connection = self.__connection(parts.netloc)
+            reused = connection.sock is not None
+            try:
+                if not reused:
+                    connection.timeout = connect_timeout
+                    connection.connect()
+                connection.sock.settimeout(read_timeout)
+                connection.request(method, path, body=body)
+                response = connection.getresponse()
+                return NanoleafResponse(response.status, response.read())
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                # Only a connection left open from a previous request can be stale
+                if not reused or attempt == 1:
+                    raise
+            except Exception:
+                connection.close()
+                raise
+        raise http.client.HTTPException("Request failed")
+
+    def events(self, url : str) -> Iterator[Tuple[str, str]]:
+        parts = urlsplit(url)
+        connection = http.client.HTTPConnection(parts.netloc)
+        stream : Optional[socket.socket] = None
+        try:
+            connection.connect()
+            stream = connection.sock
+            with self.__lock:
+                self.__streams.add(stream)
+            connection.request('GET', parts.path + "?" + parts.query,
+                headers={'Accept': 'text/event-stream'})
+            response = connection.getresponse()
+            parser = EventParser()
+            for line in iter(response.readline, b""):
+                event = parser.feed(line)
+                if event is not None:
+                    yield event
+        finally:
+            with self.__lock:
+                self.__streams.discard(stream)
+            connection.close()
+
+    def close(self) -> None:
+        with self.__lock:
+            connections = list(self.__connections)
+            streams = list(self.__streams)
+        for connection in connections:
+            connection.close()
+        for stream in streams:
+            # Wakes the thread reading the stream, which then closes it
+            try:
+                stream.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class RequestsTransport(NanoleafTransport):
+    """Transport using requests, with a session per transport, and sseclient for events"""
+
+    def __init__(self) -> None:
+        import requests # pylint: disable=import-outside-toplevel
+        self.__session = requests.Session()
+
+    def request(self, method : str, url : str, data : Body =None,
+        timeout : Timeout =None) -> NanoleafResponse:
+        response = self.__session.request(method, url, data=data, timeout=timeout)
+        return NanoleafResponse(response.status_code, response.content)
+
+    def events(self, url : str) -> Iterator[Tuple[str, str]]:
+        from sseclient import SSEClient # pylint: disable=import-outside-toplevel
+        for event in SSEClient(url):
+            yield event.id, event.data
+
+    def close(self) -> None:
+        self.__session.close()
@@ -14,14 +14,22 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/MylesMor/nanoleafapi",
     packages=setuptools.find_packages(),
-    install_requires=['requests', 'sseclient'],
+    extras_require={
+        'frames': ['numpy'],
+        'requests': ['requests', 'sseclient'],
+        'fast': ['orjson'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
     entry_points = {
-        'console_scripts': ['effects-builder=nanoleafapi.effects_builder:interactive_builder']
+        'console_scripts': [
+            'effects-builder=nanoleafapi.effects_builder:interactive_builder',
+            'nanoleaf=nanoleafapi.cli:main',
+            'nanoleafd=nanoleafapi.daemon:main'
+        ]
     },
-    python_requires='>=3.6',
+    python_requires='>=3.7',
 )